@@ -1,14 +1,20 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import matplotlib.pyplot as plt
 from dicts import *
+import dicts
 import csv
 import io
+import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from taxdash import load_and_process_data, load_and_process_sped_fiscal, load_and_process_ecd
 from taxdash import config, processors
+from taxdash import bundle_key, bundle_cache_path, read_bundle_cache, write_bundle_cache
+from taxdash import csv_via_arrow
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', None)
@@ -33,20 +39,118 @@ if 'file_registry' not in st.session_state:
 @st.cache_data
 def convert_df_to_csv(df):
     """Cache CSV conversion to avoid regenerating on every rerun."""
-    return df.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig')
+    csv_bytes = csv_via_arrow(df)
+    if csv_bytes is None:
+        csv_bytes = df.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig')
+    return csv_bytes
+
+@st.cache_data(show_spinner=False)
+def preparar_tabela(df, max_rows):
+    """Cache the displayed rows of ``df`` as an Arrow table."""
+    # o st.dataframe recebe a tabela Arrow pronta e nao converte o pandas a cada rerun
+    exibida = df.head(max_rows)
+    try:
+        exibida = pa.Table.from_pandas(exibida, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # colunas com tipos mistos: fica o pandas, e o st.dataframe faz a conversao com o fallback dele
+        pass
+    return exibida
 
 def display_table_with_download(df, filename, max_rows=1000):
-    """Display table with row limit and cached download button."""
+    """Display table with row limit and a download button that builds the CSV on click."""
     total_rows = len(df)
+    exibida = preparar_tabela(df, max_rows)
 
     if total_rows > max_rows:
         st.warning(f"⚠️ Exibindo {max_rows:,} de {total_rows:,} linhas. Baixe o CSV para dados completos.")
-        st.dataframe(df.head(max_rows), hide_index=True)
-    else:
-        st.dataframe(df, hide_index=True)
+    st.dataframe(exibida, hide_index=True)
+
+    # o CSV da tabela inteira so e gerado quando o usuario clica em baixar
+    st.download_button("📥 Baixar CSV", lambda: convert_df_to_csv(df), filename, "text/csv")
+
+
+def exibir_metricas(itens):
+    """Show ``(label, value)`` totals side by side as ``st.metric``, formatted in R$."""
+    for col, (rotulo, valor) in zip(st.columns(len(itens)), itens):
+        col.metric(rotulo, f"R$ {valor:,.2f}")
+
+
+def exibir_secao_reforma(imposto, totais, tabela, arquivo, mostrar_tabela, rotulo_cbs="CBS Projetado"):
+    """Render an Área 5 débitos section: the totals as metrics, the table (when ``mostrar_tabela``)
+    and the '<imposto> vs IBS' / 'PIS/Cofins vs CBS' charts.
 
-    csv = convert_df_to_csv(df)
-    st.download_button("📥 Baixar CSV", csv, filename, "text/csv")
+    ``totais`` holds the section totals under 'total', 'imposto', 'piscofins', 'ibs' and 'cbs'.
+    """
+    exibir_metricas([
+        ("Valor Total", totais["total"]),
+        (f"{imposto} Destacado", totais["imposto"]),
+        ("PIS/Cofins Destacado", totais["piscofins"]),
+        ("IBS Projetado", totais["ibs"]),
+        (rotulo_cbs, totais["cbs"]),
+    ])
+    st.markdown('#####')
+
+    if mostrar_tabela:
+        display_table_with_download(tabela, arquivo)
+        st.markdown('#####')
+
+    # graficos em PNG cacheados pelos totais (os dois paineis numa unica figura): nas reruns
+    # sem mudanca nao ha figura a montar; ocupam a metade esquerda da pagina
+    with st.columns(2)[0]:
+        st.image(grafico_barras_png((
+            ((f'{imposto} Destacado', 'IBS a ser destacado'), (float(totais["imposto"]), float(totais["ibs"])), f'{imposto} vs IBS'),
+            (('PIS/Cofins Destacado', 'CBS a ser destacada'), (float(totais["piscofins"]), float(totais["cbs"])), 'PIS/Cofins vs CBS'),
+        )), width="stretch")
+
+
+@st.cache_data(show_spinner=False)
+def grafico_pizza_png(valores, legendas, titulo):
+    """Render a pie chart with a side legend to PNG bytes, cached by its (hashable) inputs."""
+    fig, ax = plt.subplots()
+    wedges, texts = ax.pie(
+        valores,
+        labels=None,
+        autopct=None,
+        labeldistance=1.2,
+        pctdistance=1.3
+    )
+    ax.axis('equal')
+    ax.legend(
+        wedges,
+        legendas,
+        title=titulo,
+        loc="center left",
+        bbox_to_anchor=(1, 0, 0.5, 1)
+    )
+    buf = io.BytesIO()
+    # mesmos parametros do st.pyplot (bbox_inches="tight" para a legenda lateral nao ser cortada)
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+@st.cache_data(show_spinner=False)
+def grafico_barras_png(paineis):
+    """Render the 'destacado vs projetado' bar panels of an Área 5 section side by side in one
+    figure, as PNG bytes cached by ``paineis`` (a tuple of ``(rotulos, valores, titulo)``)."""
+    fig, axes = plt.subplots(1, len(paineis), figsize=(6.4 * len(paineis), 4.8), squeeze=False)
+    for ax, (rotulos, valores, titulo) in zip(axes[0], paineis):
+        bars = ax.bar(rotulos, valores, color=['#2099d2', '#0eff93'])
+        ax.set_ylabel('Valor (R$)')
+        ax.set_title(titulo)
+        ax.tick_params(left=False, bottom=False)
+        for side in ('top','right','left'):
+            ax.spines[side].set_visible(False)
+        ax.bar_label(bars, fmt='R$ %.2f')
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def formatar_cnpj(cnpj):
+    """Format a 14-digit CNPJ as 00.000.000/0000-00 (computed once, when the files are processed)."""
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[-2:]}"
 
 
 # layout dos datadrames
@@ -120,14 +224,15 @@ def add_files_to_registry(new_files, file_type):
 def clear_analysis_data():
     """Clear all processed analysis data from session state."""
     keys_to_clear = [
-        "processing_done", "df", "empresa", "raiz_cnpj",
-        "df_sped_fiscal", "df_ecd", "C170", "C100_SF", "C170_SF", "C190_SF", "C197_SF", "C590_SF",
+        "processing_done", "empresa", "raiz_cnpj", "cnpj_fmt",
+        "C170", "C100_SF", "C170_SF", "C190_SF", "C197_SF", "C590_SF",
         "D190_SF", "D590_SF", "E110_SF", "E111_SF", "E116_SF",
         "REG_0150_SF", "REG_0200_SF", "REG_1900_SF", "REG_1920_SF", "REG_1921_SF", "REG_1925_SF", "REG_1926_SF",
         "REG_I050_ECD", "REG_I051_ECD", "REG_I150_ECD", "REG_I155_ECD", "REG_I200_ECD", "REG_I250_ECD", "REG_I355_ECD",
         "df_receitas_com_debito", "df_receitas_sem_debito", "df_cred_por_tipo", "df_cred_por_tipo_all",
         "cred_bc_total", "cred_total", "df_serv_tomados", "df_serv_prestados",
         "df_ajuste_acresc_pis", "vlr_ajuste_acresc_pis", "df_ajuste_acresc_cofins", "vlr_ajuste_acresc_cofins",
+        "vlr_receita_tributada", "vlr_receita_nao_tributada", "vlr_debito_pis_cofins",
         "df_C170_por_mod55_aliq", "df_C170_COMPRA_por_item_cfop_cst_aliq_ncm",
         "df_C170_venda_por_ncm", "df_C175_por_mod65_aliq",
         "df_final_venda_por_estab", "df_final_venda_por_uf_estab", "df_final_venda_por_cfop", "df_C170_saidas",
@@ -158,7 +263,11 @@ def clear_file_registry():
 
 def get_files_for_processing(file_type):
     """Get file objects from registry for processing."""
-    return [f['file_obj'] for f in st.session_state.file_registry[file_type]]
+    files = [f['file_obj'] for f in st.session_state.file_registry[file_type]]
+    # rewind so the cache keys (which include the read offset) match between runs
+    for f in files:
+        f.seek(0)
+    return files
 
 def render_file_dashboard():
     """Render dashboard showing all uploaded files."""
@@ -246,121 +355,359 @@ def render_file_dashboard():
 
 def base_saidas_reforma(C100_SF, C197_SF, C170_SC):
 
-    C170_SC = C170_SC[C170_SC['ind_oper'] == '1'].copy()
+    # take pelas posicoes ja devolve um frame proprio (sem a marca de "copia" do filtro booleano),
+    # entao as insercoes abaixo nao precisam de um .copy() a mais
+    C170_SC = C170_SC.take(np.flatnonzero((C170_SC['ind_oper'] == '1').to_numpy()))
 
 
     # ----------------------------------------------------------------
     # incluindo a IE no registro C170_SC
     # ----------------------------------------------------------------
 
-    # Create composite keys and a unique mapping (avoid non-unique index in map)
-    c100_map = C100_SF[["9", "2", "ie_estab"]].copy()
-    c100_map = c100_map.dropna(subset=["9", "2"])  # ensure tuple is well-formed
-    c100_map["key"] = list(zip(c100_map["9"], c100_map["2"]))
-    c100_map = c100_map.drop_duplicates(subset=["key"], keep="last")[ ["key", "ie_estab"] ].set_index("key")
+    # (CHV_NFE, IND_OPER) lookup: every C170_SC row here has IND_OPER '1', so the C100 side is
+    # filtered on it and keyed on CHV_NFE alone (a plain hashed Index, no MultiIndex to build);
+    # keep one row per key (reindex needs a unique index)
+    c100_map = (C100_SF.loc[C100_SF["2"] == "1", ["9", "ie_estab"]]
+                .dropna(subset=["9"])
+                .drop_duplicates(subset=["9"], keep="last")
+                .set_index("9")["ie_estab"])
 
-    C170_SC["key"] = list(zip(C170_SC["chave_nf"], C170_SC["ind_oper"]))
-    C170_SC.insert(loc=4, column="ie_estab", value=C170_SC["key"].map(c100_map["ie_estab"]))
-    C170_SC.drop(columns="key", inplace=True)
+    C170_SC.insert(loc=4, column="ie_estab", value=c100_map.reindex(C170_SC["chave_nf"]).to_numpy())
 
 
     # ----------------------------------------------------------------
     # incluindo o COD_AJUSTE no registro C170_SC
     # ----------------------------------------------------------------
 
-    # Create composite keys and a unique mapping for C197 → avoid non-unique index in map
-    c197_map = C197_SF[["chave_nf", "4", "2"]].copy()
-    c197_map = c197_map.dropna(subset=["chave_nf", "4"])  # ensure tuple is well-formed
-    c197_map["key2"] = list(zip(c197_map["chave_nf"], c197_map["4"]))
-    c197_map = c197_map.drop_duplicates(subset=["key2"], keep="last")[ ["key2", "2"] ].set_index("key2")
-
-    C170_SC["key2"] = list(zip(C170_SC["chave_nf"], C170_SC["3"]))
-    C170_SC.insert(10, "cod_aj_doc", C170_SC["key2"].map(c197_map["2"]))
-    C170_SC.insert(11, 'cod_aj_doc_descr', C170_SC['cod_aj_doc'].map(sped_fiscal_tab_5_3_AM))
-    C170_SC.drop(columns="key2", inplace=True)
-
-    # Incluir colunas IBS e CBS com valor zerado por enquanto 
-    C170_SC['IBS'] = 0
-    C170_SC['CBS'] = 0
-
+    # Composite (CHV_NFE, NUM_ITEM) lookup for C197: a left merge without sorting factorizes both
+    # keys in one hashed pass and keeps the C170_SC row order (one C197 row per key, so no fan-out)
+    c197_map = (C197_SF[["chave_nf", "4", "2"]]
+                .dropna(subset=["chave_nf", "4"])
+                .drop_duplicates(subset=["chave_nf", "4"], keep="last"))
+
+    cod_aj_doc = C170_SC[["chave_nf", "3"]].merge(
+        c197_map, how="left", left_on=["chave_nf", "3"], right_on=["chave_nf", "4"], sort=False
+    )["2"]
+    # poucos codigos de ajuste distintos: a descricao e buscada so nas categorias e espalhada pelos
+    # codigos (-1, sem ajuste, cai no NaN do fim)
+    cod_aj_doc = pd.Categorical(cod_aj_doc)
+    descr_aj = cod_aj_doc.categories.map(sped_fiscal_tab_5_3_AM).to_numpy(dtype=object)
+    C170_SC.insert(10, "cod_aj_doc", cod_aj_doc)
+    C170_SC.insert(11, 'cod_aj_doc_descr', np.append(descr_aj, np.nan)[cod_aj_doc.codes])
 
     # ----------------------------------------------------------------
     # incluindo a tributação do IBS e CBS
     # ----------------------------------------------------------------
 
-    C170_SC["ie_estab_prefix"] = C170_SC["ie_estab"].astype(str).str[:4]
-
-    # Vectorized IBS calculation - much faster than row-wise apply
-    C170_SC["cfop_str"] = C170_SC["11"].astype(str)
-    # Create lookup key as tuple (prefix, cfop)
-    lookup_keys = list(zip(C170_SC["ie_estab_prefix"], C170_SC["cfop_str"]))
-    # Convert dict to Series for vectorized lookups
-    ibs_rates_series = pd.Series(regras_ibs_saidas_zfm)
-    # Try exact lookup
-    ibs_rates = pd.Series(lookup_keys).map(ibs_rates_series)
-    # For NaN values, try fallback with wildcard
-    fallback_keys = list(zip(['*'] * len(C170_SC), C170_SC["cfop_str"]))
-    ibs_rates_fallback = pd.Series(fallback_keys).map(ibs_rates_series)
-    ibs_rates = ibs_rates.fillna(ibs_rates_fallback).fillna(0.0)
-    C170_SC["IBS"] = ibs_rates.values * C170_SC["7"]
-
-    # Vectorized CBS calculation - much faster than row-wise apply
-    cbs_rates_series = pd.Series(regras_cbs_saidas_zfm)
-    # Try exact lookup
-    cbs_rates = pd.Series(lookup_keys).map(cbs_rates_series)
-    # For NaN values, try fallback with wildcard
-    cbs_rates_fallback = pd.Series(fallback_keys).map(cbs_rates_series)
-    cbs_rates = cbs_rates.fillna(cbs_rates_fallback).fillna(0.0)
-    C170_SC["CBS"] = cbs_rates.values * C170_SC["7"]
-
-    # Clean up temporary column
-    C170_SC = C170_SC.drop(columns=["cfop_str"])
-
-    # update column names
-    C170_SC = C170_SC.rename(columns={
-        '1': 'REG',
-        '2': 'NUM_ITEM',
-        '3': 'COD_ITEM',
-        '4': 'DESCR_COMPL',
-        '5': 'QTD',
-        '6': 'UNID',
-        '7': 'VL_ITEM',
-        '8': 'VL_DESC',
-        '9': 'IND_MOV',
-        '10': 'CST_ICMS',
-        '11': 'CFOP',
-        '12': 'COD_NAT',
-        '13': 'VL_BC_ICMS',
-        '14': 'ALIQ_ICMS',
-        '15': 'VL_ICMS',
-        '16': 'VL_BC_ICMS_ST',
-        '17': 'ALIQ_ST',
-        '18': 'VL_ICMS_ST',
-        '19': 'IND_APUR',
-        '20': 'CST_IPI',
-        '21': 'COD_ENQ',
-        '22': 'VL_BC_IPI',
-        '23': 'ALIQ_IPI',
-        '24': 'VL_IPI',
-        '25': 'CST_PIS',
-        '26': 'VL_BC_PIS',
-        '27': 'ALIQ_PIS',
-        '28': 'QUANT_BC_PIS',
-        '29': 'ALIQ_PIS_QUANT',
-        '30': 'VL_PIS',
-        '31': 'CST_COFINS',
-        '32': 'VL_BC_COFINS',
-        '33': 'ALIQ_COFINS',
-        '34': 'QUANT_BC_COFINS',
-        '35': 'ALIQ_COFINS_QUANT',
-        '36': 'VL_COFINS',
-        '37': 'COD_CTA',
-    })
+    # prefixo da IE e CFOP tratados nos valores distintos (poucos): o corte em '<U4' e feito pelo
+    # numpy sobre os unicos e cada linha so recebe o codigo; NaN vira 'nan', como no astype(str)
+    ie_codes, ie_unicos = pd.factorize(C170_SC["ie_estab"], use_na_sentinel=False)
+    prefixo_unicos = pd.Index(np.asarray(ie_unicos, dtype="U4").astype(object))
+    cfop_codes, cfop_unicos = pd.factorize(C170_SC["11"], use_na_sentinel=False)
+
+    # IBS/CBS rates as dense tables: one row per IE prefix plus a last row for "no exact rule"
+    # (the ('*', cfop) wildcard), one column per CFOP plus a last column for "no rule" (rate 0);
+    # each row then needs a single gather, -1 from get_indexer wrapping to the last row/column
+    regras = regras_ibs_saidas_zfm.keys() | regras_cbs_saidas_zfm.keys()
+    prefixos = pd.Index(sorted({p for p, _ in regras if p != '*'}))
+    cfops = pd.Index(sorted({c for _, c in regras}))
+    n_cols = len(cfops) + 1
+    pi = (prefixos.get_indexer(prefixo_unicos) % (len(prefixos) + 1))[ie_codes]
+    ci = (cfops.get_indexer(pd.Index(cfop_unicos).astype(str)) % n_cols)[cfop_codes]
+    # flat position into the (prefix, cfop) table, shared by IBS and CBS
+    pos = (pi * n_cols + ci).astype(np.intp)
+    vl_item = C170_SC["7"].to_numpy(dtype=float)
+    for col, regras_tributo in (("IBS", regras_ibs_saidas_zfm), ("CBS", regras_cbs_saidas_zfm)):
+        wildcard = np.zeros(len(cfops) + 1)
+        for (p, c), aliq in regras_tributo.items():
+            if p == '*':
+                wildcard[cfops.get_loc(c)] = aliq
+        tabela = np.tile(wildcard, (len(prefixos) + 1, 1))
+        for (p, c), aliq in regras_tributo.items():
+            if p != '*':
+                tabela[prefixos.get_loc(p), cfops.get_loc(c)] = aliq
+        C170_SC[col] = np.multiply(tabela.ravel().take(pos), vl_item, out=np.empty(len(pos)))
+    # IBS/CBS sao criadas ja com o valor final; o prefixo entra depois delas (ordem das colunas)
+    C170_SC["ie_estab_prefix"] = pd.Categorical(prefixo_unicos)[ie_codes]
+
+    # update column names (C170_SC e copia local: os rotulos sao trocados no proprio frame)
+    C170_SC.columns = [config.C170_COLUMN_NAMES.get(col, col) for col in C170_SC.columns]
+
+    # chaves de agrupamento da Área 5 (poucos valores distintos) como categoricas: os groupbys
+    # por CFOP/NCM/CST passam a hashear codigos inteiros em vez de strings a cada render
+    for col in ('ie_estab', 'uf_empresa', 'part_uf', 'ncm', 'CST_ICMS', 'CFOP', 'cfop_descr', 'CST_PIS'):
+        C170_SC[col] = C170_SC[col].astype('category')
 
 
     return C170_SC
 
 
+def chave_linha_i355(df):
+    """Integer row key for (ano, COD_CTA, CTA_REF): each column is factorized and the codes are
+    combined in mixed radix, so distinct triples always get distinct keys."""
+    chave = np.zeros(len(df), dtype=np.int64)
+    for col in ("ano", "COD_CTA", "CTA_REF"):
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        chave = chave * len(uniques) + codes
+    return chave
+
+
+@st.cache_data(show_spinner=False)
+def montar_base_i355(REG_I355_ECD, ctas_creditaveis):
+    """Build the base I355 table for the Área 5 editor, seeding 'CREDITAVEL' from ``ctas_creditaveis``."""
+    df_REG_I355_ECD = REG_I355_ECD.loc[
+        REG_I355_ECD['VL_CTA'].fillna(0) != 0,
+        ['ano', 'COD_CTA', 'CTA_DESCR', 'CTA_REF', 'CTA_REF_DESCR', 'VL_CTA', 'IND_DC']
+    ].sort_values(by='CTA_REF', ascending=True).reset_index(drop=True)
+
+    # ensure numeric
+    df_REG_I355_ECD['VL_CTA'] = pd.to_numeric(df_REG_I355_ECD['VL_CTA'], errors='coerce')
+
+    # Make debit values negative (D = expenses, C = revenues)
+    df_REG_I355_ECD['VL_CTA'] = np.where(
+        df_REG_I355_ECD['IND_DC'] == 'D',
+        -df_REG_I355_ECD['VL_CTA'],
+        df_REG_I355_ECD['VL_CTA']
+    )
+
+    # seed CREDITAVEL from your reference list; the lookup runs on the distinct CTA_REF
+    # codes only and is broadcast back to the rows (the trailing False is a missing CTA_REF)
+    codes_cta_ref, ctas_ref = pd.factorize(df_REG_I355_ECD['CTA_REF'])
+    cta_ref_creditavel_mask = np.append(pd.Index(ctas_ref).isin(ctas_creditaveis), False)[codes_cta_ref]
+    df_REG_I355_ECD['CREDITAVEL'] = np.where(cta_ref_creditavel_mask, "sim", "não")
+
+    # Create a deterministic row key for stable identity in the editor
+    df_REG_I355_ECD["ROW_KEY"] = chave_linha_i355(df_REG_I355_ECD)
+
+    return df_REG_I355_ECD
+
+
+@st.cache_data(show_spinner=False)
+def resumos_vendas_reforma(df_saidas_reforma):
+    """Group the Área 5 sales (all vendas, produção própria and revendas) into the tables of '1) Análise Débitos'."""
+    # mascaras de CFOP das saidas, avaliadas so nas descricoes distintas
+    sai_is_venda, sai_is_venda_prod, sai_is_revenda = processors.descr_startswith(
+        df_saidas_reforma['cfop_descr'], "venda de", "venda de produção", "venda de mercadoria adquirida"
+    )
+
+    # um unico groupby das vendas na chave mais fina; o resumo por CFOP e reagrupado a partir
+    # dele (poucos milhares de linhas) em vez de varrer de novo o df_saidas_reforma
+    vendas_por_ncm_cfop_cst = df_saidas_reforma[sai_is_venda].groupby(['uf_empresa','part_uf','CFOP', 'cfop_descr','ncm', 'CST_ICMS', 'ALIQ_ICMS','CST_PIS','ALIQ_PIS','ALIQ_COFINS'], dropna=False, observed=True, sort=False)[['VL_ITEM', 'VL_DESC', 'VL_ICMS', 'VL_ICMS_ST', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum()
+    df_C170_SF_cfop = vendas_por_ncm_cfop_cst.groupby(level=['CFOP', 'cfop_descr'], dropna=False, observed=True, sort=False)[['VL_ITEM', 'VL_ICMS', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+    df_vendas_reforma = vendas_por_ncm_cfop_cst.round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+
+    # producao propria e revendas sao subconjuntos disjuntos das vendas: um unico groupby com o
+    # grupo de cada linha na chave, e cada secao e fatiada do resultado (pequeno)
+    valor_cols = ['VL_ITEM', 'VL_ICMS', 'VL_PIS', 'VL_COFINS', 'IBS', 'CBS']
+    grupo = np.select([sai_is_venda_prod, sai_is_revenda], ['prod', 'revenda'], default='')
+    sel = grupo != ''
+    por_grupo = (df_saidas_reforma.loc[sel, ['ie_estab', 'CFOP', 'cfop_descr'] + valor_cols]
+                 .assign(grupo=grupo[sel])
+                 .groupby(['grupo', 'ie_estab', 'CFOP', 'cfop_descr'], dropna=False, observed=True, sort=False)[valor_cols].sum())
+    grupos = por_grupo.index.get_level_values('grupo')
+    vendas_prod = por_grupo[grupos == 'prod'].droplevel('grupo')
+
+    df_vendas_prod_reforma_por_cfop = vendas_prod.groupby(level=['ie_estab', 'CFOP'], dropna=False, observed=True, sort=False).sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+    # totais da secao numa unica reducao; cabecalho e graficos leem daqui
+    totais_prod = vendas_prod.sum()
+
+    df_reforma_revendas = por_grupo[grupos == 'revenda'].droplevel('grupo').round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+
+    return {
+        "resumo_cfop": df_C170_SF_cfop,
+        "base_vendas": df_vendas_reforma,
+        "n_prod": int(sai_is_venda_prod.sum()),
+        "prod_por_cfop": df_vendas_prod_reforma_por_cfop,
+        "totais_prod": totais_prod,
+        "revendas": df_reforma_revendas,
+    }
+
+
+@st.cache_data(show_spinner=False)
+def resumos_compras_reforma(df_C170_SF_compras):
+    """Group the Área 5 purchases by NCMxCFOPxCSTxALIQ and by CFOP (sections 2.2 and 2.3)."""
+    # mesmo esquema das vendas: um groupby fino, e o resumo por CFOP (2.3) sai dele
+    compras_por_ncm_cfop_cst = df_C170_SF_compras.groupby(['uf_estab','part_uf','CFOP', 'cfop_descr','ncm', 'CST_ICMS', 'ALIQ_ICMS','CST_PIS','ALIQ_PIS','ALIQ_COFINS'], dropna=False, observed=True, sort=False)[['VL_ITEM', 'VL_DESC', 'VL_ICMS', 'VL_ICMS_ST', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum()
+    df_C170_SF_por_ncm_cfop_cst = compras_por_ncm_cfop_cst.round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+    df_C170_SF_cfop = compras_por_ncm_cfop_cst.groupby(level=['CFOP', 'cfop_descr'], dropna=False, observed=True, sort=False)[['VL_ITEM', 'VL_ICMS', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+    return df_C170_SF_por_ncm_cfop_cst, df_C170_SF_cfop
+
+
+
+# --------------------------------------------------------------------------------------------------------------------
+# PIPELINE DE PROCESSAMENTO (cacheado pelo conteudo dos arquivos)
+# --------------------------------------------------------------------------------------------------------------------
+
+# Streamlit hashes each UploadedFile by name, offset and bytes, so re-processing the same
+# uploads is a cache hit; each stage returns its frames keyed by their session_state name.
+# The derived frames are also kept on disk (next to the loaders' Feather cache), so a new
+# session or a restarted server skips the Bloco_* processing for files it has already seen
+
+def executar_em_paralelo(tarefas):
+    """Run independent ``(fn, *args)`` tasks and return their results in order.
+
+    With more than one CPU the tasks share a thread pool (the Arrow/NumPy
+    kernels under the Bloco_* functions release the GIL); otherwise they
+    simply run one after the other.
+    """
+    workers = min(len(tarefas), os.cpu_count() or 1)
+    if workers <= 1:
+        return [fn(*args) for fn, *args in tarefas]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fn, *args) for fn, *args in tarefas]
+        return [future.result() for future in futures]
+
+
+def carregar_ou_calcular(kind, files, build):
+    """Return the derived tables of ``files``: the bundle stored on disk for them, or ``build(files)``
+    (stored for the next run). The bundle's content key comes along as 'chave_arquivos'."""
+    # tabelas derivadas ja gravadas em disco para estes mesmos arquivos: a chave cobre o conteudo
+    # dos arquivos e o codigo que as monta (este app, dicts e processors)
+    chave = bundle_key(kind, files, (__file__, dicts.__file__))
+    cache_path = bundle_cache_path(chave)
+    bundle = read_bundle_cache(cache_path)
+    if bundle is None:
+        bundle = build(files)
+        write_bundle_cache(cache_path, bundle)
+    return {**bundle, "chave_arquivos": chave}
+
+
+def montar_bundle_fiscal(fiscal_files):
+    """Build the derived SPED Fiscal tables (registers used by the dashboard) from the raw files."""
+    # o SPED bruto so e lido para extrair os registros; nao fica no session_state
+    df_sped_fiscal = load_and_process_sped_fiscal(fiscal_files)
+    REG_0150_SF, REG_0200_SF = processors.Bloco_0_Sped_Fiscal(df_sped_fiscal)
+    # blocos C, D, E e 1 so leem o df_sped_fiscal (e o bloco 0): independentes entre si
+    bloco_c, bloco_d, bloco_e, bloco_1 = executar_em_paralelo([
+        (processors.Bloco_C_Sped_Fiscal, df_sped_fiscal, REG_0150_SF, REG_0200_SF, cfop_cod_descr, cod_uf, cst_icms, sped_fiscal_tab_5_3_AM),
+        (processors.Bloco_D_Sped_Fiscal, df_sped_fiscal, cst_icms, cfop_cod_descr),
+        (processors.Bloco_E_Sped_Fiscal, df_sped_fiscal, sped_fiscal_tab_5_1_1, sped_fiscal_tab_5_4, sped_fiscal_cod_receita_AM),
+        (processors.Bloco_1_Sped_Fiscal, df_sped_fiscal, sped_fiscal_tab_ind_apur_icms_AM, sped_fiscal_tab_5_1_1, sped_fiscal_tab_5_2, sped_fiscal_tab_5_4, sped_fiscal_cod_receita_AM),
+    ])
+    C100_SF, C170_SF, C190_SF, C197_SF, C590_SF = bloco_c
+    D190_SF, D590_SF = bloco_d
+    E110_SF, E111_SF, E116_SF = bloco_e
+    REG_1900_SF, REG_1920_SF, REG_1921_SF, REG_1925_SF, REG_1926_SF = bloco_1
+
+    bundle = {
+        "REG_0150_SF": REG_0150_SF,
+        "REG_0200_SF": REG_0200_SF,
+        "C100_SF": C100_SF,
+        "C170_SF": C170_SF,
+        "C190_SF": C190_SF,
+        "C197_SF": C197_SF,
+        "C590_SF": C590_SF,
+        "D190_SF": D190_SF,
+        "D590_SF": D590_SF,
+        "E110_SF": E110_SF,
+        "E111_SF": E111_SF,
+        "E116_SF": E116_SF,
+        "REG_1900_SF": REG_1900_SF,
+        "REG_1920_SF": REG_1920_SF,
+        "REG_1921_SF": REG_1921_SF,
+        "REG_1925_SF": REG_1925_SF,
+        "REG_1926_SF": REG_1926_SF,
+    }
+    return bundle
+
+
+@st.cache_data(show_spinner=False)
+def processar_sped_fiscal(fiscal_files):
+    """Load the SPED Fiscal files and extract the registers used by the dashboard."""
+    return carregar_ou_calcular("fiscal-bundle", fiscal_files, montar_bundle_fiscal)
+
+
+def montar_bundle_contribuicoes(contrib_files):
+    """Build the derived SPED Contribuições tables (PIS/COFINS analysis) from the raw files."""
+    # o SPED bruto so e lido para extrair os registros; do cabecalho ficam so empresa e CNPJ
+    df_contrib = load_and_process_data(contrib_files)
+    reg_0140, reg_0150, reg_0200 = processors.Bloco_0(df_contrib)
+    # blocos M, A e C so leem o df_contrib (e o bloco 0): independentes entre si
+    bloco_m, bloco_a, bloco_c = executar_em_paralelo([
+        (processors.Bloco_M, df_contrib, tab_4_3_7, tab_4_3_8, tab_4_3_5, cst_pis_cofins),
+        (processors.Bloco_A, df_contrib, reg_0140, reg_0150, reg_0200, cod_uf),
+        (processors.Bloco_C, df_contrib, reg_0140, reg_0150, reg_0200, cfop_cod_descr, cod_uf, cst_pis_cofins),
+    ])
+    M100, M105, M110, M210, M400, M510, M610 = bloco_m
+    A100, A170 = bloco_a
+    C100, C170, C175, C181, C185 = bloco_c
+    (df_cred_por_tipo_all, df_cred_por_tipo, cred_bc_total, cred_total, df_receitas_com_debito,
+    df_receitas_sem_debito, df_ajuste_acresc_pis, vlr_ajuste_acresc_pis,
+    df_ajuste_acresc_cofins, vlr_ajuste_acresc_cofins, vlr_receita_tributada,
+    vlr_receita_nao_tributada, vlr_debito_pis_cofins) = processors.bloco_M_filtering(M105, M110, M210, M400, M510, M610, tab_4_3_7)
+    df_serv_tomados, df_serv_prestados = processors.bloco_A_filtering(A100, A170)
+    (df_C170_por_mod55_aliq, df_C170_COMPRA_por_item_cfop_cst_aliq_ncm,
+    df_C175_por_mod65_aliq, df_C170_venda_por_ncm, df_final_venda_por_estab,
+    df_final_venda_por_uf_estab, df_final_venda_por_cfop, df_C170_saidas) = processors.bloco_C_filtering(C100, C170, C175, C181, C185)
+
+    bundle = {
+        "empresa": df_contrib.iloc[0, 11],
+        "raiz_cnpj": df_contrib.iloc[0, 12],
+        "C170": C170,
+        "df_cred_por_tipo_all": df_cred_por_tipo_all,
+        "df_receitas_com_debito": df_receitas_com_debito,
+        "df_receitas_sem_debito": df_receitas_sem_debito,
+        "df_cred_por_tipo": df_cred_por_tipo,
+        "cred_bc_total": cred_bc_total,
+        "cred_total": cred_total,
+        "df_serv_tomados": df_serv_tomados,
+        "df_serv_prestados": df_serv_prestados,
+        "df_ajuste_acresc_pis": df_ajuste_acresc_pis,
+        "vlr_ajuste_acresc_pis": vlr_ajuste_acresc_pis,
+        "df_ajuste_acresc_cofins": df_ajuste_acresc_cofins,
+        "vlr_ajuste_acresc_cofins": vlr_ajuste_acresc_cofins,
+        "vlr_receita_tributada": vlr_receita_tributada,
+        "vlr_receita_nao_tributada": vlr_receita_nao_tributada,
+        "vlr_debito_pis_cofins": vlr_debito_pis_cofins,
+        "df_C170_por_mod55_aliq": df_C170_por_mod55_aliq,
+        "df_C170_COMPRA_por_item_cfop_cst_aliq_ncm": df_C170_COMPRA_por_item_cfop_cst_aliq_ncm,
+        "df_C170_venda_por_ncm": df_C170_venda_por_ncm,
+        "df_C175_por_mod65_aliq": df_C175_por_mod65_aliq,
+        "df_final_venda_por_estab": df_final_venda_por_estab,
+        "df_final_venda_por_uf_estab": df_final_venda_por_uf_estab,
+        "df_final_venda_por_cfop": df_final_venda_por_cfop,
+        "df_C170_saidas": df_C170_saidas,
+    }
+    return bundle
+
+
+@st.cache_data(show_spinner=False)
+def processar_sped_contribuicoes(contrib_files):
+    """Load the SPED Contribuições files and build the PIS/COFINS analysis tables."""
+    bundle = carregar_ou_calcular("contrib-bundle", contrib_files, montar_bundle_contribuicoes)
+    # CNPJ formatado junto do resultado cacheado: a tela so le os escalares prontos
+    return {**bundle, "cnpj_fmt": formatar_cnpj(bundle["raiz_cnpj"])}
+
+
+def montar_bundle_ecd(ecd_files):
+    """Build the derived ECD tables (I-block registers) from the raw files."""
+    # a ECD bruta so e lida para extrair o bloco I; num acerto do cache em disco nao e relida
+    df_ecd = load_and_process_ecd(ecd_files)
+    REG_I050_ECD, REG_I051_ECD, REG_I150_ECD, REG_I155_ECD, REG_I200_ECD, REG_I250_ECD, REG_I355_ECD = processors.Bloco_I_ECD(df_ecd, PLANO_CONTAS_REF)
+
+    bundle = {
+        "REG_I155_ECD": REG_I155_ECD,
+        "REG_I355_ECD": REG_I355_ECD,
+    }
+    return bundle
+
+
+@st.cache_data(show_spinner=False)
+def processar_ecd(ecd_files):
+    """Load the ECD files and extract the I-block registers used by the dashboard."""
+    return carregar_ou_calcular("ecd-bundle", ecd_files, montar_bundle_ecd)
+
+
+@st.cache_data(show_spinner=False)
+def processar_saidas_reforma(chave_fiscal, chave_contrib, _C100_SF, _C197_SF, _C170):
+    """Build the Área 5 saídas base (``base_saidas_reforma``) for the SPED Fiscal/Contribuições bundles
+    with these content keys (their 'chave_arquivos').
+
+    The ``_``-prefixed frames come from those bundles and are not hashed again; the keys do not
+    depend on the upload objects' read offsets, so a repeated import hits this cache.
+    """
+    return base_saidas_reforma(_C100_SF, _C197_SF, _C170)
+
 
 # ----------------------------------------------------------------
 # Streamlit
@@ -546,37 +893,16 @@ if selected_area == "Área 1: Importar Arquivos SPED":
             ph_fiscal_prog.progress(10, text="Lendo SPED Fiscal…")
 
 
-            # carregar arquivos efd-fiscal
-            df_sped_fiscal = load_and_process_sped_fiscal(fiscal_files)
+            # carregar e filtrar registros efd-fiscal
+            fiscal = processar_sped_fiscal(fiscal_files)
             ph_fiscal_prog.progress(100, text="SPED Fiscal importado com sucesso.")
             ph_fiscal_msg.success(":material/task_alt: SPED Fiscal concluído")
 
-            # filtrar registros efd-fiscal
-            REG_0150_SF, REG_0200_SF = processors.Bloco_0_Sped_Fiscal(df_sped_fiscal)
-            C100_SF, C170_SF, C190_SF, C197_SF, C590_SF = processors.Bloco_C_Sped_Fiscal(df_sped_fiscal, REG_0150_SF, REG_0200_SF, cfop_cod_descr, cod_uf, cst_icms, sped_fiscal_tab_5_3_AM)
-            D190_SF, D590_SF = processors.Bloco_D_Sped_Fiscal(df_sped_fiscal, cst_icms, cfop_cod_descr)
-            E110_SF, E111_SF, E116_SF = processors.Bloco_E_Sped_Fiscal(df_sped_fiscal, sped_fiscal_tab_5_1_1, sped_fiscal_tab_5_4, sped_fiscal_cod_receita_AM)
-            REG_1900_SF, REG_1920_SF, REG_1921_SF, REG_1925_SF, REG_1926_SF = processors.Bloco_1_Sped_Fiscal(df_sped_fiscal, sped_fiscal_tab_ind_apur_icms_AM, sped_fiscal_tab_5_1_1, sped_fiscal_tab_5_2, sped_fiscal_tab_5_4, sped_fiscal_cod_receita_AM)
-
-            # sessions
-            st.session_state["df_sped_fiscal"] = df_sped_fiscal
-            st.session_state["REG_0150_SF"] = REG_0150_SF
-            st.session_state["REG_0200_SF"] = REG_0200_SF
-            st.session_state["C100_SF"] = C100_SF
-            st.session_state["C170_SF"] = C170_SF
-            st.session_state["C190_SF"] = C190_SF
-            st.session_state["C197_SF"] = C197_SF
-            st.session_state["C590_SF"] = C590_SF
-            st.session_state["D190_SF"] = D190_SF
-            st.session_state["D590_SF"] = D590_SF
-            st.session_state["E110_SF"] = E110_SF
-            st.session_state["E111_SF"] = E111_SF
-            st.session_state["E116_SF"] = E116_SF
-            st.session_state["REG_1900_SF"] = REG_1900_SF
-            st.session_state["REG_1920_SF"] = REG_1920_SF
-            st.session_state["REG_1921_SF"] = REG_1921_SF
-            st.session_state["REG_1925_SF"] = REG_1925_SF
-            st.session_state["REG_1926_SF"] = REG_1926_SF
+            # sessions: tudo o que vai para o session_state e juntado aqui e gravado
+            # num unico update no fim da importacao.
+            # Dos registros do SPED Fiscal as Áreas so leem o C170
+            # (C100/C197 sao usados abaixo, direto do resultado, na base de saidas)
+            resultados = {"C170_SF": fiscal["C170_SF"]}
 
 
 
@@ -587,26 +913,13 @@ if selected_area == "Área 1: Importar Arquivos SPED":
             ph_contrib_prog.progress(10, text="Lendo SPED Contribuições…")
 
             # Process the files
-            df_contrib = load_and_process_data(contrib_files)
+            contrib = processar_sped_contribuicoes(contrib_files)
             ph_contrib_prog.progress(100, text="SPED Contribuições importado com sucesso.")
             ph_contrib_msg.success(":material/task_alt: SPED Contribuições concluído")
 
-            # Example: extract company details from SPED Contribuições
-            empresa = df_contrib.iloc[0, 11]
-            raiz_cnpj = df_contrib.iloc[0, 12]
-
-            # Process SPED Contribuições blocks
-            reg_0140, reg_0150, reg_0200 = processors.Bloco_0(df_contrib)
-            M100, M105, M110, M210, M400, M510, M610 = processors.Bloco_M(df_contrib, tab_4_3_7, tab_4_3_8, tab_4_3_5, cst_pis_cofins)
-            (df_cred_por_tipo_all, df_cred_por_tipo, cred_bc_total, cred_total, df_receitas_com_debito, 
-            df_receitas_sem_debito, df_ajuste_acresc_pis, vlr_ajuste_acresc_pis, 
-            df_ajuste_acresc_cofins, vlr_ajuste_acresc_cofins) = processors.bloco_M_filtering(M105, M110, M210, M400, M510, M610, tab_4_3_7)
-            A100, A170 = processors.Bloco_A(df_contrib, reg_0140, reg_0150, reg_0200, cod_uf)
-            df_serv_tomados, df_serv_prestados = processors.bloco_A_filtering(A100, A170)
-            C100, C170, C175, C181, C185 = processors.Bloco_C(df_contrib, reg_0140, reg_0150, reg_0200, cfop_cod_descr, cod_uf, cst_pis_cofins)
-            (df_C170_por_mod55_aliq, df_C170_COMPRA_por_item_cfop_cst_aliq_ncm,
-            df_C175_por_mod65_aliq, df_C170_venda_por_ncm, df_final_venda_por_estab,
-            df_final_venda_por_uf_estab, df_final_venda_por_cfop, df_C170_saidas) = processors.bloco_C_filtering(C100, C170, C175, C181, C185)
+            # company details from the SPED Contribuições header (already in the cached result)
+            empresa = contrib["empresa"]
+            cnpj_fmt = contrib["cnpj_fmt"]
             #-----------------------------------------------------
             # importar ECD
             #-----------------------------------------------------
@@ -619,15 +932,12 @@ if selected_area == "Área 1: Importar Arquivos SPED":
 
             # Process the files (only if ECD provided)
             if ecd_files and len(ecd_files) > 0:
-                df_ecd = load_and_process_ecd(ecd_files)
+                ecd = processar_ecd(ecd_files)
                 ph_ecd_prog.progress(100, text="ECD importado com sucesso.")
                 ph_ecd_msg.success(":material/task_alt: ECD concluído")
 
-                REG_I050_ECD, REG_I051_ECD, REG_I150_ECD, REG_I155_ECD, REG_I200_ECD, REG_I250_ECD, REG_I355_ECD = processors.Bloco_I_ECD(df_ecd, PLANO_CONTAS_REF)
-
-                st.session_state["df_ecd"] = df_ecd
-                st.session_state["REG_I155_ECD"] = REG_I155_ECD
-                st.session_state["REG_I355_ECD"] = REG_I355_ECD
+                # do bloco I as Áreas so leem o I355
+                resultados["REG_I355_ECD"] = ecd["REG_I355_ECD"]
 
 
 
@@ -641,46 +951,24 @@ if selected_area == "Área 1: Importar Arquivos SPED":
             # importar funções para REFORMA TRIBUTARIA
             #-----------------------------------------------------
 
-            df_saidas_reforma = base_saidas_reforma(C100_SF, C197_SF, C170)
-
-            st.session_state["df_saidas_reforma"] = df_saidas_reforma
-
-            st.session_state["df_cred_por_tipo_all"] = df_cred_por_tipo_all
-
-            # Store results in session_state
-            st.session_state["processing_done"] = True
-
-            st.session_state["df"] = df_contrib
-            st.session_state["empresa"] = empresa
-            st.session_state["raiz_cnpj"] = raiz_cnpj
-            st.session_state["df_sped_fiscal"] = df_sped_fiscal
-            st.session_state["C170"] = C170
-            st.session_state["df_receitas_com_debito"] = df_receitas_com_debito
-            st.session_state["df_receitas_sem_debito"] = df_receitas_sem_debito
-            st.session_state["df_cred_por_tipo"] = df_cred_por_tipo
-            st.session_state["cred_bc_total"] = cred_bc_total
-            st.session_state["cred_total"] = cred_total
-            st.session_state["df_serv_tomados"] = df_serv_tomados
-            st.session_state["df_serv_prestados"] = df_serv_prestados
-            st.session_state["df_ajuste_acresc_pis"] = df_ajuste_acresc_pis
-            st.session_state["vlr_ajuste_acresc_pis"] = vlr_ajuste_acresc_pis
-            st.session_state["df_ajuste_acresc_cofins"] = df_ajuste_acresc_cofins
-            st.session_state["vlr_ajuste_acresc_cofins"] = vlr_ajuste_acresc_cofins
-            st.session_state["df_C170_por_mod55_aliq"] = df_C170_por_mod55_aliq
-            st.session_state["df_C170_COMPRA_por_item_cfop_cst_aliq_ncm"] = df_C170_COMPRA_por_item_cfop_cst_aliq_ncm
-            st.session_state["df_C170_venda_por_ncm"] = df_C170_venda_por_ncm
-            st.session_state["df_C175_por_mod65_aliq"] = df_C175_por_mod65_aliq
-            st.session_state["df_final_venda_por_estab"] = df_final_venda_por_estab
-            st.session_state["df_final_venda_por_uf_estab"] = df_final_venda_por_uf_estab
-            st.session_state["df_final_venda_por_cfop"] = df_final_venda_por_cfop
-            st.session_state["df_C170_saidas"] = df_C170_saidas
+            resultados["df_saidas_reforma"] = processar_saidas_reforma(
+                fiscal["chave_arquivos"], contrib["chave_arquivos"], fiscal["C100_SF"], fiscal["C197_SF"], contrib["C170"]
+            )
+
+            # o C170 (base da Reforma), o df_C170_saidas e a chave dos arquivos nao sao lidos pelas
+            # Áreas; empresa, raiz_cnpj e cnpj_fmt vem junto do resultado
+            resultados.update((k, v) for k, v in contrib.items() if k not in ("C170", "df_C170_saidas", "chave_arquivos"))
+
+            # Store results in session_state (one update, processing_done together with the data)
+            resultados["processing_done"] = True
+            st.session_state.update(resultados)
 
 
             st.toast("✅ Importação concluída.")
             st.success("Arquivos processados com sucesso!")
 
             st.header(f"Empresa: {empresa}")
-            st.subheader(f"CNPJ: {raiz_cnpj[:2]}.{raiz_cnpj[2:5]}.{raiz_cnpj[5:8]}/{raiz_cnpj[8:12]}-{raiz_cnpj[-2:]}")
+            st.subheader(f"CNPJ: {cnpj_fmt}")
             #st.info("Dados já processados. Abaixo você pode ir para o Cenário Atual ou Reforma Tributária.")
 
 
@@ -697,6 +985,9 @@ elif selected_area == "Área 2: Compras/Entradas":
         st.warning("⚠️ Por favor, importe e processe os arquivos SPED na Área 1 primeiro.")
         st.stop()
 
+    empresa = st.session_state["empresa"]
+    cnpj_fmt = st.session_state["cnpj_fmt"]
+
     # Show the tabs relevant to Área 2
     tab_entrada_resumo_pc, tab_entrada_resumo_icms, tab_entrada_industria, tab_entrada_revenda, tab_entrada_uso_consumo, tab_entrada_ativo, tab_entrada_tranf, tab_entrada_outras  = st.tabs([
         "Resumo PIS/Cofins",
@@ -712,138 +1003,124 @@ elif selected_area == "Área 2: Compras/Entradas":
     # ---------------------------------------------------------------------------------------------
 
     with tab_entrada_resumo_pc:
-        
-        if not st.session_state["processing_done"]:
+        # abas com toggles sao fragmentos (aqui e nas abas seguintes): um toggle reexecuta so a
+        # propria aba, nao o script inteiro
+        @st.fragment
+        def exibir_aba_entrada_resumo_pc():
+            # Access the already-processed DataFrames
+            df_receitas_com_debito = st.session_state["df_receitas_com_debito"] 
+            df_receitas_sem_debito = st.session_state["df_receitas_sem_debito"]
+            df_cred_por_tipo = st.session_state["df_cred_por_tipo"]
+            cred_bc_total = st.session_state["cred_bc_total"]
+            cred_total = st.session_state["cred_total"]
+            df_ajuste_acresc_pis = st.session_state["df_ajuste_acresc_pis"]
+            vlr_ajuste_acresc_pis = st.session_state["vlr_ajuste_acresc_pis"]
+            df_ajuste_acresc_cofins = st.session_state["df_ajuste_acresc_cofins"]
+            vlr_ajuste_acresc_cofins = st.session_state["vlr_ajuste_acresc_cofins"]
+            df_cred_por_tipo_all = st.session_state["df_cred_por_tipo_all"]
+
+            # PAGE HEADER
+            st.write(f"**Empresa:** {empresa}")
+            st.write(f"**CNPJ:** {cnpj_fmt}")
+            st.divider()
+
+            # RECEITAS
+            st.header("Débitos")
             st.write('\n')
-            st.warning("Por favor, vá para a Página Inicial e processe o arquivo primeiro.")
-            st.stop()
-        
-        # Access the already-processed DataFrame
-        df = st.session_state["df"]
-        empresa = st.session_state["empresa"]
-        raiz_cnpj = st.session_state["raiz_cnpj"]
-        df_receitas_com_debito = st.session_state["df_receitas_com_debito"] 
-        df_receitas_sem_debito = st.session_state["df_receitas_sem_debito"]
-        df_cred_por_tipo = st.session_state["df_cred_por_tipo"]
-        cred_bc_total = st.session_state["cred_bc_total"]
-        cred_total = st.session_state["cred_total"]
-        df_ajuste_acresc_pis = st.session_state["df_ajuste_acresc_pis"]
-        vlr_ajuste_acresc_pis = st.session_state["vlr_ajuste_acresc_pis"]
-        df_ajuste_acresc_cofins = st.session_state["df_ajuste_acresc_cofins"]
-        vlr_ajuste_acresc_cofins = st.session_state["vlr_ajuste_acresc_cofins"]
-        df_cred_por_tipo_all = st.session_state["df_cred_por_tipo_all"]
-
-        # PAGE HEADER
-        st.write(f"**Empresa:** {empresa}")
-        st.write(f"**CNPJ:** {raiz_cnpj[:2]}.{raiz_cnpj[2:5]}.{raiz_cnpj[5:8]}/{raiz_cnpj[8:12]}-{raiz_cnpj[-2:]}")
-        st.divider()
 
-        # RECEITAS
-        st.header("Débitos")
-        st.write('\n')
-
-        receita_total = df_receitas_com_debito['3'].sum() + df_receitas_sem_debito['3'].sum()
-        st.write("**Receita Total:**", f"R$ {receita_total:,.2f}")
+            # totais ja somados no processamento (bloco_M_filtering)
+            bc_pis_cofins = st.session_state["vlr_receita_tributada"]
+            receita_não_tributada = st.session_state["vlr_receita_nao_tributada"]
+            receita_total = bc_pis_cofins + receita_não_tributada
+            st.write("**Receita Total:**", f"R$ {receita_total:,.2f}")
 
-        receita_não_tributada = df_receitas_sem_debito['3'].sum()
-        st.write("**Receitas Não Tributadas:**", f"R$ {receita_não_tributada:,.2f}", f"({(receita_não_tributada/receita_total*100):.0f}%)")
+            st.write("**Receitas Não Tributadas:**", f"R$ {receita_não_tributada:,.2f}", f"({(receita_não_tributada/receita_total*100):.0f}%)")
 
-        if not df_receitas_sem_debito.empty:
-            on = st.toggle("_Ver detalhamento das 'Receitas Não Tributadas'_", key="toggle_receitas_nao_tributadas")
-            if on:
-                display_table_with_download(df_receitas_sem_debito, "receitas_nao_tributadas.csv")
+            if not df_receitas_sem_debito.empty:
+                on = st.toggle("_Ver detalhamento das 'Receitas Não Tributadas'_", key="toggle_receitas_nao_tributadas")
+                if on:
+                    display_table_with_download(df_receitas_sem_debito, "receitas_nao_tributadas.csv")
 
 
-        bc_pis_cofins = df_receitas_com_debito['3'].sum()
-        st.write("**Receitas Tributadas:**", f"R$ {bc_pis_cofins:,.2f}", f"({(bc_pis_cofins/receita_total*100):.0f}%)")
+            st.write("**Receitas Tributadas:**", f"R$ {bc_pis_cofins:,.2f}", f"({(bc_pis_cofins/receita_total*100):.0f}%)")
 
-        if not df_receitas_com_debito.empty:
-            on = st.toggle("_Ver detalhamento da 'Receitas Tributadas'_", key="toggle_receitas_tributadas")
-            if on:
-                display_table_with_download(df_receitas_com_debito, "receitas_tributadas.csv")
+            if not df_receitas_com_debito.empty:
+                on = st.toggle("_Ver detalhamento da 'Receitas Tributadas'_", key="toggle_receitas_tributadas")
+                if on:
+                    display_table_with_download(df_receitas_com_debito, "receitas_tributadas.csv")
 
-        debito_pis_cofins = df_receitas_com_debito['11'].sum() + df_receitas_com_debito['valor_cofins'].sum()     
-        st.write("**Débito Total de PIS/Cofins no período:**", f"R$ {debito_pis_cofins:,.2f}")
+            debito_pis_cofins = st.session_state["vlr_debito_pis_cofins"]
+            st.write("**Débito Total de PIS/Cofins no período:**", f"R$ {debito_pis_cofins:,.2f}")
 
 
-        st.write('\n')
-        st.write('\n')
-        st.write('\n')
-        st.write('\n')
+            st.write('\n')
+            st.write('\n')
+            st.write('\n')
+            st.write('\n')
 
 
-        # CREDITOS
-        col1, col2, col3  = st.columns([1,1,1])  
+            # CREDITOS
+            col1, col2, col3  = st.columns([1,1,1])  
 
-        with col1:
-            st.header("Créditos")
-            st.write('\n')
+            with col1:
+                st.header("Créditos")
+                st.write('\n')
 
-            if df_cred_por_tipo.empty:
-                st.write("**Valor Base do Crédito:**", f"R$ {cred_bc_total:,.2f}")
-            else:
-                st.write("**Valor Base do Crédito:**", f"R$ {cred_bc_total:,.2f}")
-                on = st.toggle("_Ver detalhamento por 'Tipo de Crédito' escriturado_", key="toggle_credito_por_tipo")
-                if on:
-                    # Create a styled DataFrame
-                    display_table_with_download(df_cred_por_tipo_all, "credito_por_tipo.csv")
+                if df_cred_por_tipo.empty:
+                    st.write("**Valor Base do Crédito:**", f"R$ {cred_bc_total:,.2f}")
+                else:
+                    st.write("**Valor Base do Crédito:**", f"R$ {cred_bc_total:,.2f}")
+                    on = st.toggle("_Ver detalhamento por 'Tipo de Crédito' escriturado_", key="toggle_credito_por_tipo")
+                    if on:
+                        # Create a styled DataFrame
+                        display_table_with_download(df_cred_por_tipo_all, "credito_por_tipo.csv")
 
     
 
-            if not df_ajuste_acresc_pis.empty:
-                st.write("**Lançamentos de Ajuste no Crédito:**", f"R$ {(vlr_ajuste_acresc_pis + vlr_ajuste_acresc_cofins):,.2f}")
-                on = st.toggle("_Ver detalhamento dos 'Ajustes no Crédito'_", key="toggle_ajustes_credito")
-                if on:
-                    st.write("Lançamentos de PIS")
-                    display_table_with_download(df_ajuste_acresc_pis, "ajustes_pis.csv")
-                    st.write("Lançamentos de COFINS")
-                    display_table_with_download(df_ajuste_acresc_cofins, "ajustes_cofins.csv")
-
-            st.write("**Crédito Total de PIS/Cofins no período:**", f"R$ {cred_total:,.2f}")
-
-
-        with col2:
-            fig, ax = plt.subplots()
-            wedges, texts = ax.pie(
-                df_cred_por_tipo['BC_CRED_PIS_COFINS'],
-                labels=None,
-                autopct=None,
-                labeldistance=1.2,
-                pctdistance=1.3
-            )
-            ax.axis('equal')
-            ax.legend(
-                wedges,
-                (df_cred_por_tipo['NAT_BC_CRED'].astype(str) + ' ' + df_cred_por_tipo['proporção']).tolist(),
-                title="Tipo de Crédito",
-                loc="center left",
-                bbox_to_anchor=(1, 0, 0.5, 1)
-            )
-            st.pyplot(fig)
+                if not df_ajuste_acresc_pis.empty:
+                    st.write("**Lançamentos de Ajuste no Crédito:**", f"R$ {(vlr_ajuste_acresc_pis + vlr_ajuste_acresc_cofins):,.2f}")
+                    on = st.toggle("_Ver detalhamento dos 'Ajustes no Crédito'_", key="toggle_ajustes_credito")
+                    if on:
+                        st.write("Lançamentos de PIS")
+                        display_table_with_download(df_ajuste_acresc_pis, "ajustes_pis.csv")
+                        st.write("Lançamentos de COFINS")
+                        display_table_with_download(df_ajuste_acresc_cofins, "ajustes_cofins.csv")
+
+                st.write("**Crédito Total de PIS/Cofins no período:**", f"R$ {cred_total:,.2f}")
+
+
+            with col2:
+                # a figura so e redesenhada quando os creditos mudam (cache por valores/legendas)
+                st.image(grafico_pizza_png(
+                    tuple(df_cred_por_tipo['BC_CRED_PIS_COFINS'].tolist()),
+                    tuple((df_cred_por_tipo['NAT_BC_CRED'].astype(str) + ' ' + df_cred_por_tipo['proporção']).tolist()),
+                    "Tipo de Crédito"
+                ), width="stretch")
+
+        exibir_aba_entrada_resumo_pc()
 
     # ---------------------------------------------------------------------------------------------
 
     with tab_entrada_industria:
-        st.header("Compras")
-        st.divider()
+        @st.fragment
+        def exibir_aba_entrada_industria():
+            st.header("Compras")
+            st.divider()
 
-        if not st.session_state["processing_done"]:
-            st.warning("Por favor, vá para Página Inicial e processe o arquivo primeiro.")
-            st.stop()
-
-        empresa = st.session_state["empresa"]
-        raiz_cnpj = st.session_state["raiz_cnpj"]
-        df = st.session_state["df"]
-        
-        df_C170_COMPRA_por_item_cfop_cst_aliq_ncm = st.session_state["df_C170_COMPRA_por_item_cfop_cst_aliq_ncm"]
+            df_C170_COMPRA_por_item_cfop_cst_aliq_ncm = st.session_state["df_C170_COMPRA_por_item_cfop_cst_aliq_ncm"]
 
         
         
-        st.write(f"**Empresa:** {empresa}")
-        st.write(f"**CNPJ:** {raiz_cnpj[:2]}.{raiz_cnpj[2:5]}.{raiz_cnpj[5:8]}/{raiz_cnpj[8:12]}-{raiz_cnpj[-2:]}")
-        st.divider()
+            st.write(f"**Empresa:** {empresa}")
+            st.write(f"**CNPJ:** {cnpj_fmt}")
+            st.divider()
 
-        display_table_with_download(df_C170_COMPRA_por_item_cfop_cst_aliq_ncm, "compras_por_item.csv")
+            # a tabela (e o CSV) so e montada quando o usuario abre o detalhamento
+            on = st.toggle(f"_Ver detalhamento das compras por item ({len(df_C170_COMPRA_por_item_cfop_cst_aliq_ncm):,} linhas)_", key="toggle_compras_por_item")
+            if on:
+                display_table_with_download(df_C170_COMPRA_por_item_cfop_cst_aliq_ncm, "compras_por_item.csv")
+
+        exibir_aba_entrada_industria()
 
     # ---------------------------------------------------------------------------------------------
 
@@ -866,6 +1143,9 @@ elif selected_area == "Área 3: Vendas/Saídas":
         st.warning("⚠️ Por favor, importe e processe os arquivos SPED na Área 1 primeiro.")
         st.stop()
 
+    empresa = st.session_state["empresa"]
+    cnpj_fmt = st.session_state["cnpj_fmt"]
+
     tab_saida_resumo_pc, tab_saida_resumo_icms, tab_saida_venda_producao, tab_saida_revenda, tab_saida_transf, tab_saida_outras = st.tabs([
         "Resumo PIS/Cofins",
         "Resumo ICMS",
@@ -881,12 +1161,6 @@ elif selected_area == "Área 3: Vendas/Saídas":
         st.header("Vendas")
         st.divider()
 
-        if not st.session_state["processing_done"]:
-            st.warning("Por favor, vá para Página Inicial e processe o arquivo primeiro.")
-            st.stop()
-
-        empresa = st.session_state["empresa"]
-        raiz_cnpj = st.session_state["raiz_cnpj"]
         df_C170_por_mod55_aliq = st.session_state["df_C170_por_mod55_aliq"]
         df_C175_por_mod65_aliq = st.session_state["df_C175_por_mod65_aliq"]
         df_C170_venda_por_ncm = st.session_state["df_C170_venda_por_ncm"]
@@ -897,22 +1171,19 @@ elif selected_area == "Área 3: Vendas/Saídas":
 
 
         st.write(f"**Empresa:** {empresa}")
-        st.write(f"**CNPJ:** {raiz_cnpj[:2]}.{raiz_cnpj[2:5]}.{raiz_cnpj[5:8]}/{raiz_cnpj[8:12]}-{raiz_cnpj[-2:]}")
+        st.write(f"**CNPJ:** {cnpj_fmt}")
         st.divider()
 
         # 1.1) NF-e (Modelo 55)
 
 
-        vlr_venda_mod_55 = df_C170_por_mod55_aliq[(df_C170_por_mod55_aliq['ind_oper'] == '1') & (df_C170_por_mod55_aliq['mod_nf'] == '55')]['7'].sum()
-        vlr_bc_mod_55 = df_C170_por_mod55_aliq[(df_C170_por_mod55_aliq['ind_oper'] == '1') & (df_C170_por_mod55_aliq['mod_nf'] == '55')]['26'].sum()
-        vlr_pis_venda_mod_55 = df_C170_por_mod55_aliq[(df_C170_por_mod55_aliq['ind_oper'] == '1') & (df_C170_por_mod55_aliq['mod_nf'] == '55')]['30'].sum()
-        vlr_cofins_venda_mod_55 = df_C170_por_mod55_aliq[(df_C170_por_mod55_aliq['ind_oper'] == '1') & (df_C170_por_mod55_aliq['mod_nf'] == '55')]['36'].sum()
+        # um unico filtro por tabela; as somas saem na ordem das colunas
+        venda_mod_55 = df_C170_por_mod55_aliq.loc[(df_C170_por_mod55_aliq['ind_oper'] == '1') & (df_C170_por_mod55_aliq['mod_nf'] == '55'), ['7', '26', '30', '36']].sum()
+        vlr_venda_mod_55, vlr_bc_mod_55, vlr_pis_venda_mod_55, vlr_cofins_venda_mod_55 = venda_mod_55
 
         # 1.2) NFC-e (Modelo 65)
-        vlr_venda_mod_65 = df_C175_por_mod65_aliq[(df_C175_por_mod65_aliq['ind_oper'] == '1') & (df_C175_por_mod65_aliq['mod_nf'] == '65')]['3'].sum()
-        vlr_bc_mod_65 = df_C175_por_mod65_aliq[(df_C175_por_mod65_aliq['ind_oper'] == '1') & (df_C175_por_mod65_aliq['mod_nf'] == '65')]['6'].sum()
-        vlr_pis_venda_mod_65 = df_C175_por_mod65_aliq[(df_C175_por_mod65_aliq['ind_oper'] == '1') & (df_C175_por_mod65_aliq['mod_nf'] == '65')]['10'].sum()
-        vlr_cofins_venda_mod_65 = df_C175_por_mod65_aliq[(df_C175_por_mod65_aliq['ind_oper'] == '1') & (df_C175_por_mod65_aliq['mod_nf'] == '65')]['16'].sum()
+        venda_mod_65 = df_C175_por_mod65_aliq.loc[(df_C175_por_mod65_aliq['ind_oper'] == '1') & (df_C175_por_mod65_aliq['mod_nf'] == '65'), ['3', '6', '10', '16']].sum()
+        vlr_venda_mod_65, vlr_bc_mod_65, vlr_pis_venda_mod_65, vlr_cofins_venda_mod_65 = venda_mod_65
 
 
         st.header("1) Vendas por Tipo de Nota Fiscal")
@@ -993,6 +1264,9 @@ elif selected_area == "Área 4: Serviços":
         st.warning("⚠️ Por favor, importe e processe os arquivos SPED na Área 1 primeiro.")
         st.stop()
 
+    empresa = st.session_state["empresa"]
+    cnpj_fmt = st.session_state["cnpj_fmt"]
+
     tab_serv_tomados, tab_serv_prestados = st.tabs([
         "Serviços Tomados", 
         "Serviços Prestados"
@@ -1001,125 +1275,128 @@ elif selected_area == "Área 4: Serviços":
     # ---------------------------------------------------------------------------------------------
 
     with tab_serv_tomados:
-        st.header("Serviços")
-        st.divider()
-
-        if not st.session_state["processing_done"]:
-            st.warning("Por favor, vá para Página Inicial e processe o arquivo primeiro.")
-            st.stop()
-
-        empresa = st.session_state["empresa"]
-        raiz_cnpj = st.session_state["raiz_cnpj"]
-        df_serv_tomados = st.session_state["df_serv_tomados"]
-        df_serv_prestados = st.session_state["df_serv_prestados"]
-
-        st.write(f"**Empresa:** {empresa}")
-        st.write(f"**CNPJ:** {raiz_cnpj[:2]}.{raiz_cnpj[2:5]}.{raiz_cnpj[5:8]}/{raiz_cnpj[8:12]}-{raiz_cnpj[-2:]}")
-        st.divider()
+        @st.fragment
+        def exibir_aba_serv_tomados():
+            st.header("Serviços")
+            st.divider()
 
+            df_serv_tomados = st.session_state["df_serv_tomados"]
 
-        vlr_total_serv_tom = df_serv_tomados['vlr_servico'].sum()
+            st.write(f"**Empresa:** {empresa}")
+            st.write(f"**CNPJ:** {cnpj_fmt}")
+            st.divider()
 
-        df_serv_tomados_com_cred = df_serv_tomados[df_serv_tomados['cst_pis_cofins'].isin(["50","51","52","53","54","55","56","60","61","62","63","64","65","66"])]
-        vlr_total_serv_tom_com_cred = df_serv_tomados_com_cred['vlr_servico'].sum()
-        vlr_bc_serv_tom = df_serv_tomados_com_cred['pis_cofins_bc'].sum()
-        vlr_pis_serv_tom = df_serv_tomados_com_cred['pis_vlr'].sum()
-        vlr_cofins_serv_tom = df_serv_tomados_com_cred['cofins_vlr'].sum()
 
-        df_serv_tomados_sem_cred = df_serv_tomados[~df_serv_tomados['cst_pis_cofins'].isin(["50","51","52","53","54","55","56","60","61","62","63","64","65","66"])]
-        vlr_total_serv_tom_sem_cred = df_serv_tomados_sem_cred['vlr_servico'].sum()
+            vlr_total_serv_tom = df_serv_tomados['vlr_servico'].sum()
 
+            # mascara calculada uma unica vez para as duas fatias (com/sem credito)
+            tem_credito = df_serv_tomados['cst_pis_cofins'].isin(config.CST_PIS_COFINS_COM_CREDITO)
+            df_serv_tomados_com_cred = df_serv_tomados[tem_credito]
+            vlr_total_serv_tom_com_cred = df_serv_tomados_com_cred['vlr_servico'].sum()
+            vlr_bc_serv_tom = df_serv_tomados_com_cred['pis_cofins_bc'].sum()
+            vlr_pis_serv_tom = df_serv_tomados_com_cred['pis_vlr'].sum()
+            vlr_cofins_serv_tom = df_serv_tomados_com_cred['cofins_vlr'].sum()
 
-        st.header("1) Serviços Tomados")
+            df_serv_tomados_sem_cred = df_serv_tomados[~tem_credito]
+            vlr_total_serv_tom_sem_cred = df_serv_tomados_sem_cred['vlr_servico'].sum()
 
-        if df_serv_tomados.empty:
-            st.warning("Não foi declarado nenhum serviço tomado.")
-        else:
 
-            if df_serv_tomados_com_cred.empty:
-                st.subheader("**1.1) Serviços com Crédito**")
-                st.warning("Não foi declarado nenhum serviço com crédito de PIS/Cofins.")
-                st.write('\n')
+            st.header("1) Serviços Tomados")
 
+            if df_serv_tomados.empty:
+                st.warning("Não foi declarado nenhum serviço tomado.")
             else:
-                st.write("**Valor Total de Serviços Tomados:**", f"R$ {vlr_total_serv_tom:,.2f}")
-                st.write('\n')
 
-                st.subheader("**1.1) Serviços com Crédito**")
-                st.write("**Valor Total de Serviços Tomados com crédito:**", f"R$ {vlr_total_serv_tom_com_cred:,.2f}", f"({(vlr_total_serv_tom_com_cred/vlr_total_serv_tom*100):.0f}% do total)")
-                st.write("**Valor BC de Serviços Tomados:**", f"R$ {vlr_bc_serv_tom:,.2f}")
-                st.write("**Valor PIS/Cofins:**", f"R$ {(vlr_pis_serv_tom + vlr_cofins_serv_tom):,.2f}")
-                on = st.toggle("_Ver detalhamento dos 'Serviços que geraram créditos'_", key="toggle_serv_tom_com_cred")
-                if on:
-                    display_table_with_download(df_serv_tomados_com_cred, "servicos_tomados_com_credito.csv")
-                st.write('\n')
-                st.write('\n')
+                if df_serv_tomados_com_cred.empty:
+                    st.subheader("**1.1) Serviços com Crédito**")
+                    st.warning("Não foi declarado nenhum serviço com crédito de PIS/Cofins.")
+                    st.write('\n')
+
+                else:
+                    st.write("**Valor Total de Serviços Tomados:**", f"R$ {vlr_total_serv_tom:,.2f}")
+                    st.write('\n')
+
+                    st.subheader("**1.1) Serviços com Crédito**")
+                    st.write("**Valor Total de Serviços Tomados com crédito:**", f"R$ {vlr_total_serv_tom_com_cred:,.2f}", f"({(vlr_total_serv_tom_com_cred/vlr_total_serv_tom*100):.0f}% do total)")
+                    st.write("**Valor BC de Serviços Tomados:**", f"R$ {vlr_bc_serv_tom:,.2f}")
+                    st.write("**Valor PIS/Cofins:**", f"R$ {(vlr_pis_serv_tom + vlr_cofins_serv_tom):,.2f}")
+                    on = st.toggle("_Ver detalhamento dos 'Serviços que geraram créditos'_", key="toggle_serv_tom_com_cred")
+                    if on:
+                        display_table_with_download(df_serv_tomados_com_cred, "servicos_tomados_com_credito.csv")
+                    st.write('\n')
+                    st.write('\n')
                 
 
-            if df_serv_tomados_sem_cred.empty:
-                st.subheader("1.2) Serviços sem Crédito")
-                st.warning("Não foi declarado nenhum serviço sem crédito de PIS/Cofins.")
-                st.write('\n')
+                if df_serv_tomados_sem_cred.empty:
+                    st.subheader("1.2) Serviços sem Crédito")
+                    st.warning("Não foi declarado nenhum serviço sem crédito de PIS/Cofins.")
+                    st.write('\n')
 
-            else:
-                st.subheader("1.2) Serviços sem Crédito")
-                st.write("**Valor Total de Serviços Tomados sem crédito:**", f"R$ {vlr_total_serv_tom_sem_cred:,.2f}", f"({(vlr_total_serv_tom_sem_cred/vlr_total_serv_tom*100):.0f}% do total)")
-                on = st.toggle("_Ver detalhamento dos 'Serviços que não geraram créditos'_", key="toggle_serv_tom_sem_cred")
-                if on:
-                    display_table_with_download(df_serv_tomados_sem_cred, "servicos_tomados_sem_credito.csv")
+                else:
+                    st.subheader("1.2) Serviços sem Crédito")
+                    st.write("**Valor Total de Serviços Tomados sem crédito:**", f"R$ {vlr_total_serv_tom_sem_cred:,.2f}", f"({(vlr_total_serv_tom_sem_cred/vlr_total_serv_tom*100):.0f}% do total)")
+                    on = st.toggle("_Ver detalhamento dos 'Serviços que não geraram créditos'_", key="toggle_serv_tom_sem_cred")
+                    if on:
+                        display_table_with_download(df_serv_tomados_sem_cred, "servicos_tomados_sem_credito.csv")
+
+        exibir_aba_serv_tomados()
 
 
     # ---------------------------------------------------------------------------------------------
 
     with tab_serv_prestados:
+        @st.fragment
+        def exibir_aba_serv_prestados():
+            df_serv_prestados = st.session_state["df_serv_prestados"]
 
+            vlr_serv_prest = df_serv_prestados['vlr_servico'].sum()
 
-        vlr_serv_prest = df_serv_prestados['vlr_servico'].sum()
+            df_serv_prest_com_tribut = df_serv_prestados[(df_serv_prestados['pis_vlr'] > 0) | (df_serv_prestados['cofins_vlr'] > 0)]
+            vlr_serv_com_tributo = df_serv_prest_com_tribut['vlr_servico'].sum()
+            vlr_bc_serv_com_tributo = df_serv_prest_com_tribut['pis_cofins_bc'].sum()
+            vlr_pis_serv_com_tributo = df_serv_prest_com_tribut['pis_vlr'].sum()
+            vlr_cofins_serv_com_tributo = df_serv_prest_com_tribut['cofins_vlr'].sum()
 
-        df_serv_prest_com_tribut = df_serv_prestados[(df_serv_prestados['pis_vlr'] > 0) | (df_serv_prestados['cofins_vlr'] > 0)]
-        vlr_serv_com_tributo = df_serv_prest_com_tribut['vlr_servico'].sum()
-        vlr_bc_serv_com_tributo = df_serv_prest_com_tribut['pis_cofins_bc'].sum()
-        vlr_pis_serv_com_tributo = df_serv_prest_com_tribut['pis_vlr'].sum()
-        vlr_cofins_serv_com_tributo = df_serv_prest_com_tribut['cofins_vlr'].sum()
+            df_serv_prest_sem_tribut = df_serv_prestados[(df_serv_prestados['pis_vlr'] == 0) & (df_serv_prestados['cofins_vlr'] == 0)]
+            vlr_serv_sem_tributo = df_serv_prest_sem_tribut['vlr_servico'].sum()
 
-        df_serv_prest_sem_tribut = df_serv_prestados[(df_serv_prestados['pis_vlr'] == 0) & (df_serv_prestados['cofins_vlr'] == 0)]
-        vlr_serv_sem_tributo = df_serv_prest_sem_tribut['vlr_servico'].sum()
 
-
-        st.header("2) Serviços Prestados")
+            st.header("2) Serviços Prestados")
         
-        if df_serv_prestados.empty:
-            st.warning("Não foi declarado nenhum serviço prestado.")
-        else:
-            if df_serv_prest_com_tribut.empty:
-                st.warning("Não foi declarado nenhum serviço com débito de PIS/Cofins.")
-                st.write('\n')
-
+            if df_serv_prestados.empty:
+                st.warning("Não foi declarado nenhum serviço prestado.")
             else:
-                st.write("**Valor Total de Serviços Prestados:**", f"R$ {vlr_serv_prest:,.2f}")
-                st.write('\n')
+                if df_serv_prest_com_tribut.empty:
+                    st.warning("Não foi declarado nenhum serviço com débito de PIS/Cofins.")
+                    st.write('\n')
 
-                st.subheader("**2.1) Serviços com Dédito**")
-                st.write("**Valor Total de Serviços Prestados com débito:**", f"R$ {vlr_serv_com_tributo:,.2f}", f"({(vlr_serv_com_tributo/vlr_serv_prest*100):.0f}% do total)")
-                st.write("**Valor BC de Serviços Prestados:**", f"R$ {vlr_bc_serv_com_tributo:,.2f}")
-                st.write("**Valor PIS/Cofins:**", f"R$ {(vlr_pis_serv_com_tributo + vlr_cofins_serv_com_tributo):,.2f}")
-                on = st.toggle("_Ver detalhamento dos 'Serviços que geraram déditos'_", key="toggle_serv_prest_com_debito")
-                if on:
-                    display_table_with_download(df_serv_prest_com_tribut, "servicos_prestados_com_debito.csv")
-                st.write('\n')
-                st.write('\n')
+                else:
+                    st.write("**Valor Total de Serviços Prestados:**", f"R$ {vlr_serv_prest:,.2f}")
+                    st.write('\n')
 
-            if df_serv_prest_sem_tribut.empty:
-                st.subheader("2.2) Serviços sem Dédito")
-                st.warning("Não foi declarado nenhum serviço sem débito de PIS/Cofins.")
-                st.write('\n')
+                    st.subheader("**2.1) Serviços com Dédito**")
+                    st.write("**Valor Total de Serviços Prestados com débito:**", f"R$ {vlr_serv_com_tributo:,.2f}", f"({(vlr_serv_com_tributo/vlr_serv_prest*100):.0f}% do total)")
+                    st.write("**Valor BC de Serviços Prestados:**", f"R$ {vlr_bc_serv_com_tributo:,.2f}")
+                    st.write("**Valor PIS/Cofins:**", f"R$ {(vlr_pis_serv_com_tributo + vlr_cofins_serv_com_tributo):,.2f}")
+                    on = st.toggle("_Ver detalhamento dos 'Serviços que geraram déditos'_", key="toggle_serv_prest_com_debito")
+                    if on:
+                        display_table_with_download(df_serv_prest_com_tribut, "servicos_prestados_com_debito.csv")
+                    st.write('\n')
+                    st.write('\n')
 
-            else:
-                st.subheader("2.2) Serviços sem Dédito")
-                st.write("**Valor Total de Serviços Prestados sem dédito:**", f"R$ {vlr_serv_sem_tributo:,.2f}", f"({(vlr_serv_sem_tributo/vlr_serv_prest*100):.0f}% do total)")
-                on = st.toggle("_Ver detalhamento dos 'Serviços que não geraram déditos'_", key="toggle_serv_prest_sem_debito")
-                if on:
-                    display_table_with_download(df_serv_prest_sem_tribut, "servicos_prestados_sem_debito.csv")
+                if df_serv_prest_sem_tribut.empty:
+                    st.subheader("2.2) Serviços sem Dédito")
+                    st.warning("Não foi declarado nenhum serviço sem débito de PIS/Cofins.")
+                    st.write('\n')
+
+                else:
+                    st.subheader("2.2) Serviços sem Dédito")
+                    st.write("**Valor Total de Serviços Prestados sem dédito:**", f"R$ {vlr_serv_sem_tributo:,.2f}", f"({(vlr_serv_sem_tributo/vlr_serv_prest*100):.0f}% do total)")
+                    on = st.toggle("_Ver detalhamento dos 'Serviços que não geraram déditos'_", key="toggle_serv_prest_sem_debito")
+                    if on:
+                        display_table_with_download(df_serv_prest_sem_tribut, "servicos_prestados_sem_debito.csv")
+
+        exibir_aba_serv_prestados()
 
 
 
@@ -1137,9 +1414,9 @@ elif selected_area == "Área 5: Reforma Tributária":
         st.stop()
 
     empresa = st.session_state["empresa"]
-    raiz_cnpj = st.session_state["raiz_cnpj"]
+    cnpj_fmt = st.session_state["cnpj_fmt"]
     st.write(f"**Empresa:** {empresa}")
-    st.write(f"**CNPJ:** {raiz_cnpj[:2]}.{raiz_cnpj[2:5]}.{raiz_cnpj[5:8]}/{raiz_cnpj[8:12]}-{raiz_cnpj[-2:]}")
+    st.write(f"**CNPJ:** {cnpj_fmt}")
     st.divider()
 
     #(tab_reforma,) = st.tabs(["Resumo"])
@@ -1151,8 +1428,7 @@ elif selected_area == "Área 5: Reforma Tributária":
     #    st.stop()
 
     
-    df_ecd = st.session_state["df_ecd"]
-    df_sped_fiscal = st.session_state["df_sped_fiscal"]
+    # so os registros usados nesta area (ECD e opcional: lido na secao 2.5)
     df_saidas_reforma = st.session_state["df_saidas_reforma"]
 
     df_cred_por_tipo_all = st.session_state["df_cred_por_tipo_all"]
@@ -1164,24 +1440,7 @@ elif selected_area == "Área 5: Reforma Tributária":
     df_ajuste_acresc_cofins = st.session_state["df_ajuste_acresc_cofins"]
     vlr_ajuste_acresc_cofins = st.session_state["vlr_ajuste_acresc_cofins"]
     
-    C100_SF = st.session_state["C100_SF"]
     C170_SF = st.session_state["C170_SF"]
-    C190_SF = st.session_state["C190_SF"]
-    C197_SF = st.session_state["C197_SF"]
-    C590_SF = st.session_state["C590_SF"]
-    D190_SF = st.session_state["D190_SF"]
-    D590_SF = st.session_state["D590_SF"]
-    E110_SF = st.session_state["E110_SF"]
-    E111_SF = st.session_state["E111_SF"]
-    E116_SF = st.session_state["E116_SF"]
-    REG_1900_SF = st.session_state["REG_1900_SF"]
-    REG_1920_SF = st.session_state["REG_1920_SF"]
-    REG_1921_SF = st.session_state["REG_1921_SF"]
-    REG_1925_SF = st.session_state["REG_1925_SF"]
-    REG_1926_SF = st.session_state["REG_1926_SF"]
-
-    REG_I155_ECD = st.session_state["REG_I155_ECD"]
-    REG_I355_ECD = st.session_state["REG_I355_ECD"]
 
     df_serv_prestados = st.session_state["df_serv_prestados"]
 
@@ -1220,17 +1479,17 @@ elif selected_area == "Área 5: Reforma Tributária":
 
     st.header("1) Análise Débitos")
 
+    # resumos das vendas cacheados pelo df_saidas_reforma: nas reruns (ex.: edicao do I355)
+    # nao ha groupby a refazer
+    vendas = resumos_vendas_reforma(df_saidas_reforma)
 
-    
     # -------------------------------------------------------------------
     st.subheader("**> Resumo por CFOPs de Venda**")
-    df_C170_SF_cfop = df_saidas_reforma[df_saidas_reforma['cfop_descr'].str.lower().fillna('').str.startswith("venda de")].groupby(['CFOP', 'cfop_descr'], dropna=False)[['VL_ITEM', 'VL_ICMS', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
-    display_table_with_download(df_C170_SF_cfop, "resumo_cfop_venda.csv")
+    display_table_with_download(vendas["resumo_cfop"], "resumo_cfop_venda.csv")
 
     # -------------------------------------------------------------------
     st.subheader("**> Base de Vendas (NCMxCFOPxCSTxALIQ)**")
-    df_vendas_reforma = df_saidas_reforma[df_saidas_reforma['cfop_descr'].str.lower().fillna('').str.startswith("venda de")].groupby(['uf_empresa','part_uf','CFOP', 'cfop_descr','ncm', 'CST_ICMS', 'ALIQ_ICMS','CST_PIS','ALIQ_PIS','ALIQ_COFINS'], dropna=False)[['VL_ITEM', 'VL_DESC', 'VL_ICMS', 'VL_ICMS_ST', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
-    display_table_with_download(df_vendas_reforma, "base_vendas_reforma.csv")
+    display_table_with_download(vendas["base_vendas"], "base_vendas_reforma.csv")
 
     # -------------------------------------------------------------------
     st.subheader("> Base Completa de Saídas")
@@ -1240,63 +1499,15 @@ elif selected_area == "Área 5: Reforma Tributária":
     st.divider()
 
     # -----  Venda de Produção Própria --------------------------------
-    df_vendas_prod_reforma = df_saidas_reforma[df_saidas_reforma['cfop_descr'].str.lower().fillna('').str.startswith("venda de produção")]
-    df_vendas_prod_reforma_por_cfop = df_vendas_prod_reforma.groupby(['ie_estab','CFOP'], dropna=False)[['VL_ITEM', 'VL_ICMS', 'VL_PIS', 'VL_COFINS', 'IBS', 'CBS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index() 
-
     st.subheader("**1.1) Venda de Produção Própria**")
-    venda_prod_prop_icms = df_vendas_prod_reforma['VL_ICMS'].sum()
-    venda_prod_prop_ibs = df_vendas_prod_reforma['IBS'].sum()
-    st.markdown(f"""
-        <div style="line-height:1.45; margin: 0;">
-            <strong>Valor Total:</strong> R$ {df_vendas_prod_reforma['VL_ITEM'].sum():,.2f}<br>
-            <strong>ICMS Destacado:</strong> R$ {venda_prod_prop_icms:,.2f}<br>
-            <strong>PIS/Cofins Destacado:</strong> R$ {(df_vendas_prod_reforma['VL_PIS'].sum() + df_vendas_prod_reforma['VL_COFINS'].sum()):,.2f}<br>
-            <strong>IBS Projetado:</strong> R$ {venda_prod_prop_ibs:,.2f}<br>
-            <strong>CBS Projetado:</strong> R$ {df_vendas_prod_reforma['CBS'].sum():,.2f}
-        </div>
-        """, unsafe_allow_html=True)
-    st.markdown('#####')
-
-    if not df_vendas_prod_reforma.empty:
-        display_table_with_download(df_vendas_prod_reforma_por_cfop, "venda_producao_propria.csv")
-        st.markdown('#####')
-
-
-
-
-    col1, col2, col3 = st.columns([1,1,2])
-
-    with col1:
-        fig, ax = plt.subplots()
-        bars = ax.bar(
-            ['ICMS Destacado', 'IBS a ser destacado'],
-            [(venda_prod_prop_icms), venda_prod_prop_ibs],
-            color=["#2099d2", '#0eff93']  
-        )
-        ax.set_ylabel('Valor (R$)')
-        ax.set_title('ICMS vs IBS')
-        ax.tick_params(left=False, bottom=False)
-        for side in ('top','right','left'):
-            ax.spines[side].set_visible(False)
-        ax.bar_label(bars, fmt='R$ %.2f')  
-
-        st.pyplot(fig)
-
-    with col2:
-        fig, ax = plt.subplots()
-        bars = ax.bar(
-            ['PIS/Cofins Destacado', 'CBS a ser destacada'],
-            [(df_vendas_prod_reforma['VL_PIS'].sum() + df_vendas_prod_reforma['VL_COFINS'].sum()), df_vendas_prod_reforma['CBS'].sum()],
-            color=['#2099d2', "#0eff93"]  
-        )
-        ax.set_ylabel('Valor (R$)')
-        ax.set_title('PIS/Cofins vs CBS')
-        ax.tick_params(left=False, bottom=False)
-        for side in ('top','right','left'):
-            ax.spines[side].set_visible(False)
-        ax.bar_label(bars, fmt='R$ %.2f')  
-
-        st.pyplot(fig)
+    totais_prod = vendas["totais_prod"]
+    exibir_secao_reforma("ICMS", {
+        "total": totais_prod['VL_ITEM'],
+        "imposto": totais_prod['VL_ICMS'],
+        "piscofins": totais_prod['VL_PIS'] + totais_prod['VL_COFINS'],
+        "ibs": totais_prod['IBS'],
+        "cbs": totais_prod['CBS'],
+    }, vendas["prod_por_cfop"], "venda_producao_propria.csv", vendas["n_prod"])
 
 
 
@@ -1304,66 +1515,15 @@ elif selected_area == "Área 5: Reforma Tributária":
 
     st.markdown('##')
     st.subheader("**1.2) Revendas**")
-    df_reforma_revendas = df_saidas_reforma[df_saidas_reforma['cfop_descr'].str.lower().fillna('').str.startswith("venda de mercadoria adquirida")].groupby(['ie_estab', 'CFOP','cfop_descr'], dropna=False)[['VL_ITEM','VL_ICMS','VL_PIS','VL_COFINS','IBS','CBS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
-    
-
-    vlr_total_revendas = df_reforma_revendas['VL_ITEM'].sum()
-    vlr_icms_revendas = df_reforma_revendas['VL_ICMS'].sum()
-    vlr_piscofins_revendas = (df_reforma_revendas['VL_PIS'].sum() + df_reforma_revendas['VL_COFINS'].sum())
-    vlr_ibs_revendas = df_reforma_revendas['IBS'].sum()
-    vlr_cbs_revendas = df_reforma_revendas['CBS'].sum()
-
-    st.markdown(f"""
-        <div style="line-height:1.45; margin: 0;">
-            <strong>Valor Total:</strong> R$ {vlr_total_revendas:,.2f}<br>
-            <strong>ICMS Destacado:</strong> R$ {vlr_icms_revendas:,.2f}<br>
-            <strong>PIS/Cofins Destacado:</strong> R$ {vlr_piscofins_revendas:,.2f}<br>
-            <strong>IBS Projetado:</strong> R$ {vlr_ibs_revendas:,.2f}<br>
-            <strong>CBS Projetado:</strong> R$ {vlr_cbs_revendas:,.2f}
-        </div>
-        """, unsafe_allow_html=True)
-    st.markdown('#####')
-
-
-    if not df_vendas_prod_reforma.empty:
-        display_table_with_download(df_reforma_revendas, "revendas.csv")
-        st.markdown('#####')
-
-            
-    
-    col1, col2, col3 = st.columns([1,1,2])
-
-    with col1:
-        fig, ax = plt.subplots()
-        bars = ax.bar(
-            ['ICMS Destacado', 'IBS a ser destacado'],
-            [df_reforma_revendas['VL_ICMS'].sum(), df_reforma_revendas['IBS'].sum()],
-            color=['#2099d2', '#0eff93']  
-        )
-        ax.set_ylabel('Valor (R$)')
-        ax.set_title('ICMS vs IBS')
-        ax.tick_params(left=False, bottom=False)
-        for side in ('top','right','left'):
-            ax.spines[side].set_visible(False)
-        ax.bar_label(bars, fmt='R$ %.2f')  
-
-        st.pyplot(fig)
-
-    with col2:
-        fig, ax = plt.subplots()
-        bars = ax.bar(
-            ['PIS/Cofins Destacado', 'CBS a ser destacada'],
-            [(df_reforma_revendas['VL_PIS'].sum() + df_reforma_revendas['VL_COFINS'].sum()), df_reforma_revendas['CBS'].sum()],
-            color=['#2099d2', '#0eff93'] 
-        )
-        ax.set_ylabel('Valor (R$)')
-        ax.set_title('PIS/Cofins vs CBS')
-        ax.tick_params(left=False, bottom=False)
-        for side in ('top','right','left'):
-            ax.spines[side].set_visible(False)
-        ax.bar_label(bars, fmt='R$ %.2f')  
-
-        st.pyplot(fig)
+    df_reforma_revendas = vendas["revendas"]
+    totais_revendas = df_reforma_revendas[['VL_ITEM', 'VL_ICMS', 'VL_PIS', 'VL_COFINS', 'IBS', 'CBS']].sum()
+    exibir_secao_reforma("ICMS", {
+        "total": totais_revendas['VL_ITEM'],
+        "imposto": totais_revendas['VL_ICMS'],
+        "piscofins": totais_revendas['VL_PIS'] + totais_revendas['VL_COFINS'],
+        "ibs": totais_revendas['IBS'],
+        "cbs": totais_revendas['CBS'],
+    }, df_reforma_revendas, "revendas.csv", not df_reforma_revendas.empty)
 
 
 
@@ -1393,62 +1553,18 @@ elif selected_area == "Área 5: Reforma Tributária":
 
     st.markdown('##')
     st.subheader("**1.3) Serviços Prestados**")
-    df_serv_prestados['IBS'] = (df_serv_prestados['vlr_servico'] * 0.187).round(2)
-    df_serv_prestados['CBS'] = (df_serv_prestados['vlr_servico'] * 0.093).round(2)
-
-    vlr_total_serv_prestados = df_serv_prestados['vlr_servico'].sum()
-    vlr_iss_serv_prestados = df_serv_prestados['iss'].sum()
-    vlr_piscofins_serv_prestados = (df_serv_prestados['pis_vlr'].sum() + df_serv_prestados['cofins_vlr'].sum())
-    vlr_ibs_serv_prestados = df_serv_prestados['IBS'].sum()
-    vlr_cbs_serv_prestados = df_serv_prestados['CBS'].sum()
-
-    st.markdown(f"""
-    <div style="line-height:1.45; margin: 0;">
-      <strong>Valor Total:</strong> R$ {vlr_total_serv_prestados:,.2f}<br>
-      <strong>ISS Destacado:</strong> R$ {vlr_iss_serv_prestados:,.2f}<br>
-      <strong>PIS/Cofins Destacado:</strong> R$ {vlr_piscofins_serv_prestados:,.2f}<br>
-      <strong>IBS Projetado:</strong> R$ {vlr_ibs_serv_prestados:,.2f}<br>
-      <strong>CBS Projetada:</strong> R$ {vlr_cbs_serv_prestados:,.2f}
-    </div>
-    """, unsafe_allow_html=True)
-    st.markdown('#####')
+    vlr_servico = df_serv_prestados['vlr_servico'].to_numpy(dtype=float)
+    df_serv_prestados['IBS'] = np.round(vlr_servico * 0.187, 2)
+    df_serv_prestados['CBS'] = np.round(vlr_servico * 0.093, 2)
 
-    if not df_vendas_prod_reforma.empty:
-        display_table_with_download(df_serv_prestados, "servicos_prestados_reforma.csv")
-        st.markdown('#####')
-    
-
-    col1, col2, col3 = st.columns([1,1,2])
-
-    with col1:
-        fig, ax = plt.subplots()
-        bars = ax.bar(
-            ['ISS Destacado', 'IBS a ser destacado'],
-            [vlr_iss_serv_prestados, vlr_ibs_serv_prestados],
-            color=['#2099d2', '#0eff93']  
-        )
-        ax.set_ylabel('Valor (R$)')
-        ax.set_title('ISS vs IBS')
-        ax.tick_params(left=False, bottom=False)
-        for side in ('top','right','left'):
-            ax.spines[side].set_visible(False)
-        ax.bar_label(bars, fmt='R$ %.2f')  
-        st.pyplot(fig)
-
-    with col2:
-        fig, ax = plt.subplots()
-        bars = ax.bar(
-            ['PIS/Cofins Destacado', 'CBS a ser destacada'],
-            [vlr_piscofins_serv_prestados, vlr_cbs_serv_prestados],
-            color=['#2099d2', '#0eff93']  
-        )
-        ax.set_ylabel('Valor (R$)')
-        ax.set_title('PIS/Cofins vs CBS')
-        ax.tick_params(left=False, bottom=False)
-        for side in ('top','right','left'):
-            ax.spines[side].set_visible(False)
-        ax.bar_label(bars, fmt='R$ %.2f') 
-        st.pyplot(fig)
+    totais_serv_prestados = df_serv_prestados[['vlr_servico', 'iss', 'pis_vlr', 'cofins_vlr', 'IBS', 'CBS']].sum()
+    exibir_secao_reforma("ISS", {
+        "total": totais_serv_prestados['vlr_servico'],
+        "imposto": totais_serv_prestados['iss'],
+        "piscofins": totais_serv_prestados['pis_vlr'] + totais_serv_prestados['cofins_vlr'],
+        "ibs": totais_serv_prestados['IBS'],
+        "cbs": totais_serv_prestados['CBS'],
+    }, df_serv_prestados, "servicos_prestados_reforma.csv", not df_serv_prestados.empty, rotulo_cbs="CBS Projetada")
 
 
     
@@ -1471,18 +1587,19 @@ elif selected_area == "Área 5: Reforma Tributária":
     
     # -------------------------------------------------------------------
     st.subheader("**2.1) Base de Entradas C170 Sped Fiscal (apenas CFOP de compra)**")
-    df_C170_SF_compras = C170_SF[C170_SF['cfop_descr'].str.lower().fillna('').str.startswith("compra")]
+    # mascara de CFOP de compra calculada uma unica vez para as secoes 2.1 a 2.3
+    c170_is_compra, = processors.descr_startswith(C170_SF['cfop_descr'], "compra")
+    df_C170_SF_compras = C170_SF[c170_is_compra]
     st.write(f"Total de registros: {len(df_C170_SF_compras):,}")
     display_table_with_download(df_C170_SF_compras, "base_completa_compras.csv")
 
     # -------------------------------------------------------------------
     st.subheader("**2.2) Compras (NCMxCFOPxCSTxALIQ)**")
-    df_C170_SF_por_ncm_cfop_cst = C170_SF[C170_SF['cfop_descr'].str.lower().fillna('').str.startswith("compra")].groupby(['uf_estab','part_uf','CFOP', 'cfop_descr','ncm', 'CST_ICMS', 'ALIQ_ICMS','CST_PIS','ALIQ_PIS','ALIQ_COFINS'], dropna=False)[['VL_ITEM', 'VL_DESC', 'VL_ICMS', 'VL_ICMS_ST', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
+    df_C170_SF_por_ncm_cfop_cst, df_C170_SF_cfop = resumos_compras_reforma(df_C170_SF_compras)
     display_table_with_download(df_C170_SF_por_ncm_cfop_cst, "compras_ncm_cfop_cst.csv")
 
     # -------------------------------------------------------------------
     st.subheader("**2.3) Resumo por CFOPs de Compra**")
-    df_C170_SF_cfop = C170_SF[C170_SF['cfop_descr'].str.lower().fillna('').str.startswith("compra")].groupby(['CFOP', 'cfop_descr'], dropna=False)[['VL_ITEM', 'VL_ICMS', 'VL_IPI', 'VL_PIS', 'VL_COFINS']].sum().round(2).sort_values(by='VL_ITEM', ascending=False).reset_index()
     display_table_with_download(df_C170_SF_cfop, "resumo_cfop_compra.csv")
 
     # -------------------------------------------------------------------
@@ -1515,40 +1632,15 @@ elif selected_area == "Área 5: Reforma Tributária":
     st.write('_A coluna "CREDITAVEL" pode ser editada._')
     st.write('\n')
 
-    # Build base I355 table (one-time), including initial 'CREDITAVEL' guess
-    df_REG_I355_ECD = REG_I355_ECD.loc[
-        REG_I355_ECD['VL_CTA'].fillna(0) != 0,
-        ['ano', 'COD_CTA', 'CTA_DESCR', 'CTA_REF', 'CTA_REF_DESCR', 'VL_CTA', 'IND_DC']
-    ].sort_values(by='CTA_REF', ascending=True).reset_index(drop=True)
-
-    # ensure numeric
-    df_REG_I355_ECD['VL_CTA'] = pd.to_numeric(df_REG_I355_ECD['VL_CTA'], errors='coerce')
-
-    # Make debit values negative (D = expenses, C = revenues)
-    df_REG_I355_ECD['VL_CTA'] = np.where(
-        df_REG_I355_ECD['IND_DC'] == 'D',
-        -df_REG_I355_ECD['VL_CTA'],
-        df_REG_I355_ECD['VL_CTA']
-    )
-
-    # seed CREDITAVEL from your reference list
-    df_REG_I355_ECD['CREDITAVEL'] = np.where(
-        df_REG_I355_ECD['CTA_REF'].isin(cta_ref_creditavel),
-        "sim",
-        "não"
-    )
+    REG_I355_ECD = st.session_state.get("REG_I355_ECD")
+    if REG_I355_ECD is None:
+        st.info("ECD não informado na Área 1.")
+        st.stop()
 
-    # Create a deterministic row key for stable identity in the editor
-    if "ROW_KEY" not in df_REG_I355_ECD.columns:
-        df_REG_I355_ECD["ROW_KEY"] = (
-            df_REG_I355_ECD["ano"].astype(str) + "|" +
-            df_REG_I355_ECD["COD_CTA"].astype(str) + "|" +
-            df_REG_I355_ECD["CTA_REF"].astype(str)
-        ).astype("string")
-
-    # Keep a single source of truth in session_state
+    # Keep a single source of truth in session_state; the base (with the initial 'CREDITAVEL'
+    # guess) comes from the cache, so it is only rebuilt when the ECD changes
     if "ecd_i355_df" not in st.session_state:
-        st.session_state["ecd_i355_df"] = df_REG_I355_ECD.copy()
+        st.session_state["ecd_i355_df"] = montar_base_i355(REG_I355_ECD, tuple(cta_ref_creditavel))
 
     state_df = st.session_state["ecd_i355_df"]
 
@@ -1556,24 +1648,19 @@ elif selected_area == "Área 5: Reforma Tributária":
     if "CREDITAVEL" not in state_df.columns:
         state_df["CREDITAVEL"] = "sim"
     if "ROW_KEY" not in state_df.columns:
-        state_df["ROW_KEY"] = (
-            state_df["ano"].astype(str) + "|" +
-            state_df["COD_CTA"].astype(str) + "|" +
-            state_df["CTA_REF"].astype(str)
-        ).astype("string")
-    state_df["VL_CTA"] = pd.to_numeric(state_df["VL_CTA"], errors="coerce")
-
-    # ----- Build VIEW (computed columns) from current state; do not mutate state directly
-    view_df = state_df.copy()
-    mask_live = view_df["CREDITAVEL"].astype(str).eq("sim")
-    view_df["CREDITO_CBS"] = np.where(mask_live, view_df["VL_CTA"] * 0.093, np.nan)
-    view_df["CREDITO_IBS"] = np.where(mask_live, view_df["VL_CTA"] * 0.187, np.nan)
-    view_df[["CREDITO_CBS", "CREDITO_IBS"]] = view_df[["CREDITO_CBS", "CREDITO_IBS"]].round(2)
+        state_df["ROW_KEY"] = chave_linha_i355(state_df)
+
+    # ----- Build VIEW (computed columns) from current state; do not mutate state directly.
+    # Use stable index (older Streamlit doesn't accept row_key=...); set_index already returns
+    # a new frame, so the state is not copied a second time
+    view_df = state_df.set_index("ROW_KEY", drop=False)
+    # base dos creditos montada uma unica vez em numpy (NaN onde nao e creditavel)
+    mask_live = view_df["CREDITAVEL"].astype(str).to_numpy() == "sim"
+    base_credito = np.where(mask_live, view_df["VL_CTA"].to_numpy(dtype=float), np.nan)
+    view_df["CREDITO_CBS"] = np.round(base_credito * 0.093, 2)
+    view_df["CREDITO_IBS"] = np.round(base_credito * 0.187, 2)
     view_df["STATUS"] = np.where(mask_live, "🧮 calculado", "—")
 
-    # Use stable index (older Streamlit doesn't accept row_key=...)
-    view_df = view_df.set_index("ROW_KEY", drop=False)
-
     # Render the editor; capture edited result
     edited_ecd = st.data_editor(
         view_df,
@@ -1614,20 +1701,16 @@ elif selected_area == "Área 5: Reforma Tributária":
         },
     )
 
-    # If user changed CREDITAVEL, sync it back by the index (ROW_KEY) and refresh immediately
+    # If user changed CREDITAVEL, sync it back and refresh immediately. The editor has fixed rows
+    # and returns them in the order of ecd_i355_df, so the sync is positional (no ROW_KEY lookup)
     try:
         if isinstance(edited_ecd, pd.DataFrame) and "CREDITAVEL" in edited_ecd.columns:
             dest = st.session_state["ecd_i355_df"]
-            dest_idx = dest.set_index("ROW_KEY", drop=False)
+            before = dest["CREDITAVEL"].astype(str).to_numpy()
+            after = edited_ecd["CREDITAVEL"].astype(str).to_numpy()
 
-            before = dest_idx["CREDITAVEL"].astype(str).copy()
-            # Align assignment by index; keep existing where not present
-            dest_idx.loc[edited_ecd.index, "CREDITAVEL"] = edited_ecd["CREDITAVEL"].astype(str)
-
-            # Write back to session state preserving original row order
-            st.session_state["ecd_i355_df"]["CREDITAVEL"] = dest_idx.loc[dest["ROW_KEY"], "CREDITAVEL"].values
-
-            if not before.equals(dest_idx["CREDITAVEL"].astype(str)):
+            if len(after) == len(before) and not np.array_equal(before, after):
+                dest["CREDITAVEL"] = after
                 st.rerun()
     except Exception:
         pass
@@ -1638,9 +1721,13 @@ elif selected_area == "Área 5: Reforma Tributária":
     st.write("**Crédito CBS (calculado automaticamente):**", f"{tot_cbs:,.2f}")
     st.write("**Crédito IBS (calculado automaticamente):**", f"{tot_ibs:,.2f}")
 
-    # Download button for the edited table
-    csv_ecd = convert_df_to_csv(edited_ecd.reset_index(drop=True))
-    st.download_button("📥 Baixar CSV", csv_ecd, "ecd_i355_plano_referencial.csv", "text/csv")
+    # Download button for the edited table (ROW_KEY e so a chave interna do editor: fica fora do CSV)
+    st.download_button(
+        "📥 Baixar CSV",
+        lambda: convert_df_to_csv(edited_ecd.drop(columns="ROW_KEY").reset_index(drop=True)),
+        "ecd_i355_plano_referencial.csv",
+        "text/csv",
+    )
 
 
 
@@ -2,11 +2,16 @@ from .loaders import (
     load_and_process_data,
     load_and_process_sped_fiscal,
     load_and_process_ecd,
+    bundle_key,
+    bundle_cache_path,
+    read_bundle_cache,
+    write_bundle_cache,
 )
 from .utils import (
     convert_numeric_columns,
     clean_decimal_separators,
     clean_and_convert_numeric,
+    csv_via_arrow,
 )
 from . import processors
 
@@ -14,8 +19,13 @@ __all__ = [
     "load_and_process_data",
     "load_and_process_sped_fiscal",
     "load_and_process_ecd",
+    "bundle_key",
+    "bundle_cache_path",
+    "read_bundle_cache",
+    "write_bundle_cache",
     "convert_numeric_columns",
     "clean_decimal_separators",
     "clean_and_convert_numeric",
+    "csv_via_arrow",
     "processors",
 ]
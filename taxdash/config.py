@@ -5,6 +5,8 @@ This module centralizes all configuration values that were previously hardcoded
 throughout the codebase.
 """
 
+import os
+
 # File encoding and parsing
 ENCODING = 'latin-1'
 DELIMITER = '|'
@@ -15,9 +17,29 @@ COLUMN_COUNT_CONTRIB = 40  # SPED Contribuições
 COLUMN_COUNT_FISCAL = 42   # SPED Fiscal
 COLUMN_COUNT_ECD = 40      # ECD
 
+# Fields actually read by the Bloco_* slices (field 0 is the empty text
+# before the leading pipe); later fields are never loaded
+USED_COLUMN_COUNT_CONTRIB = 38  # fields 1..37, widest is C170
+USED_COLUMN_COUNT_FISCAL = 39   # fields 1..38, widest is C170
+USED_COLUMN_COUNT_ECD = 10      # fields 1..9, widest is I250
+
+# On-disk cache of loaded frames (Feather), keyed on the uploaded file contents.
+# Off unless TAXDASH_CACHE_DIR points at a directory: the frames hold client tax
+# data, so the directory is private to the user (0700, files 0600) and pruned on
+# every write, oldest entries first, beyond the age and size caps below
+DISK_CACHE_DIR = os.environ.get("TAXDASH_CACHE_DIR", "")
+DISK_CACHE_MAX_AGE = 7 * 24 * 3600      # seconds since an entry was last written or read
+DISK_CACHE_MAX_BYTES = 2 * 1024 ** 3    # total size of the cache directory
+
 # Tax rates
 PIS_COFINS_RATE = 0.0925  # Combined PIS/COFINS rate (9.25%)
 
+# CSTs PIS/COFINS that grant credit on acquisitions (50-56 and 60-66)
+CST_PIS_COFINS_COM_CREDITO = frozenset([
+    "50", "51", "52", "53", "54", "55", "56",
+    "60", "61", "62", "63", "64", "65", "66"
+])
+
 # Parent register codes for SPED Contribuições
 PARENT_REG_CONTRIB = [
     "0000", "0140", "A100", "C100", "C180", "C190", "C380", "C400", "C500",
@@ -27,6 +49,10 @@ PARENT_REG_CONTRIB = [
     "1050", "1100", "1200", "1300", "1500", "1600", "1700", "1800", "1900"
 ]
 
+# SPED Contribuições registers that carry the CNPJ used to tag child rows
+CNPJ_HEADER_REG_CONTRIB = ["0000", "C001", "D001", "M001", "1001"]  # CNPJ from the 0000 header
+CNPJ_ESTAB_REG_CONTRIB = ["A010", "C010", "D010", "F010", "I010", "P010"]  # CNPJ in field 2
+
 # Parent register codes for SPED Fiscal
 PARENT_REG_FISCAL = [
     "0000",
@@ -44,3 +70,46 @@ PARENT_REG_FISCAL = [
 PARENT_REG_ECD = [
     "0000", "0001", "C001", "C040", "C050", "C150", "C600", "I001", "I010", "I050", "I150"
 ]
+
+# C170 field names (same layout in SPED Fiscal and SPED Contribuições; field 38
+# only exists in SPED Fiscal and is simply not renamed when absent)
+C170_COLUMN_NAMES = {
+    '1': 'REG',
+    '2': 'NUM_ITEM',
+    '3': 'COD_ITEM',
+    '4': 'DESCR_COMPL',
+    '5': 'QTD',
+    '6': 'UNID',
+    '7': 'VL_ITEM',
+    '8': 'VL_DESC',
+    '9': 'IND_MOV',
+    '10': 'CST_ICMS',
+    '11': 'CFOP',
+    '12': 'COD_NAT',
+    '13': 'VL_BC_ICMS',
+    '14': 'ALIQ_ICMS',
+    '15': 'VL_ICMS',
+    '16': 'VL_BC_ICMS_ST',
+    '17': 'ALIQ_ST',
+    '18': 'VL_ICMS_ST',
+    '19': 'IND_APUR',
+    '20': 'CST_IPI',
+    '21': 'COD_ENQ',
+    '22': 'VL_BC_IPI',
+    '23': 'ALIQ_IPI',
+    '24': 'VL_IPI',
+    '25': 'CST_PIS',
+    '26': 'VL_BC_PIS',
+    '27': 'ALIQ_PIS',
+    '28': 'QUANT_BC_PIS',
+    '29': 'ALIQ_PIS_QUANT',
+    '30': 'VL_PIS',
+    '31': 'CST_COFINS',
+    '32': 'VL_BC_COFINS',
+    '33': 'ALIQ_COFINS',
+    '34': 'QUANT_BC_COFINS',
+    '35': 'ALIQ_COFINS_QUANT',
+    '36': 'VL_COFINS',
+    '37': 'COD_CTA',
+    '38': 'VL_ABAT_NT'
+}
@@ -1,387 +1,679 @@
 import csv
 import gc
+import hashlib
 import io
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
 import streamlit as st
 
-from . import config
+from . import config, processors
 
 
-@st.cache_data
-def load_and_process_data(uploaded_file):
-    """Load one or more SPED Contribuições files and build stable, cross-file unique IDs."""
-    if uploaded_file is None or (isinstance(uploaded_file, list) and len(uploaded_file) == 0):
-        st.error("Por favor, carregue pelo menos um arquivo .txt")
-        st.stop()
+logger = logging.getLogger(__name__)
 
-    delimiter = config.DELIMITER
-    encoding = config.ENCODING
-    column_names = [str(i) for i in range(config.COLUMN_COUNT_CONTRIB)]
-    parent_reg_codes = config.PARENT_REG_CONTRIB
+# Register code sets, hashed once at import instead of on every .isin call
+_PARENT_REG_CONTRIB = frozenset(config.PARENT_REG_CONTRIB)
+_PARENT_REG_FISCAL = frozenset(config.PARENT_REG_FISCAL)
+_PARENT_REG_ECD = frozenset(config.PARENT_REG_ECD)
+_CNPJ_HEADER_REG_CONTRIB = frozenset(config.CNPJ_HEADER_REG_CONTRIB)
+_CNPJ_ESTAB_REG_CONTRIB = frozenset(config.CNPJ_ESTAB_REG_CONTRIB)
 
-    files = uploaded_file if isinstance(uploaded_file, list) else [uploaded_file]
-    dfs = []
+# Strings pd.read_csv turns into NaN by default (its na_values list)
+_PANDAS_NA_STRINGS = pa.array([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
 
-    for i, f in enumerate(files):
-        f.seek(0)
-        # Memory-efficient approach: stream file and stop at |9999| marker
-        # Avoids loading entire file into memory
-        valid_lines = []
-        file_content = f.read()
-        if isinstance(file_content, bytes):
-            file_content = file_content.decode(encoding, errors='ignore')
-
-        # Stream lines and stop at |9999|
-        for line in file_content.splitlines():
-            valid_lines.append(line)
-            if line.startswith('|9999|'):
-                break
 
-        # Join only valid lines
-        valid_content = '\n'.join(valid_lines)
-        del valid_lines  # Free memory immediately
-        del file_content  # Free memory immediately
+def _read_raw_bytes(uploaded_file):
+    """Return the full raw content of an uploaded SPED file as bytes."""
+    uploaded_file.seek(0)
+    raw = uploaded_file.read()
+    if isinstance(raw, str):
+        raw = raw.encode(config.ENCODING, errors='ignore')
+    return raw
 
-        # Now read the cleaned content with fast C engine
-        from io import StringIO
-        f_clean = StringIO(valid_content)
 
-        try:
-            reader = pd.read_csv(
-                f_clean,
-                header=None,
-                delimiter=delimiter,
-                names=column_names,
-                encoding=None,  # Already decoded
-                dtype=str,
-                engine="c",
-                on_bad_lines="skip",
-                chunksize=config.CHUNK_SIZE
-            )
-            parts = []
-            for chunk in reader:
-                parts.append(chunk)
-        except (pd.errors.ParserError, ValueError) as e:
-            # Fallback to Python engine if C engine still fails
-            f_clean.seek(0)
-            reader = pd.read_csv(
-                f_clean,
-                header=None,
-                delimiter=delimiter,
-                names=column_names,
-                encoding=None,
-                dtype=str,
-                engine="python",
-                on_bad_lines="skip",
-                chunksize=config.CHUNK_SIZE,
-                quoting=csv.QUOTE_NONE
-            )
-            parts = []
-            for chunk in reader:
-                parts.append(chunk)
-
-        df_temp = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=column_names)
-        if not df_temp.empty and '1' in df_temp.columns:
-            mask_all = df_temp['1'].astype(str).eq('9999')
-            if mask_all.any():
-                cut = int(np.argmax(mask_all.to_numpy()))
-                df_temp = df_temp.iloc[:cut+1].copy()
-        if df_temp.empty:
-            continue
+def _find_register(raw, register, start=0):
+    """Return the byte offset of the first line starting with |register|, or -1."""
+    tag = b'|' + register + b'|'
+    if start == 0 and raw.startswith(tag):
+        return 0
+    pos = raw.find(b'\n' + tag, start)
+    return pos + 1 if pos != -1 else -1
 
-        # Bounds check: ensure df_temp has at least one row before accessing row 0
-        if len(df_temp) == 0:
-            continue
-
-        data_efd = df_temp.loc[0, '7'][2:] if pd.notna(df_temp.loc[0, '7']) else None
-        cnpj_header = df_temp.loc[0, '9'] if pd.notna(df_temp.loc[0, '9']) else None
 
-        if '0' in df_temp.columns:
-            df_temp.drop(columns=['0'], inplace=True)
+def _line_end(raw, pos):
+    """Return the byte offset just past the line that contains pos."""
+    end = raw.find(b'\n', pos)
+    return len(raw) if end == -1 else end + 1
 
-        # Vectorized ID generation with numpy (faster than pandas string ops)
-        prefix_file = str(i)
-        prefix_periodo = str(data_efd) if data_efd is not None else "NA"
-        prefix_cnpj = str(cnpj_header) if cnpj_header is not None else "NA"
-        prefix_combined = f"{prefix_file}|{prefix_periodo}|{prefix_cnpj}|"
-        row_no_array = np.char.zfill(np.arange(len(df_temp)).astype(str), 7)
-        composite_id = np.char.add(prefix_combined, row_no_array)
 
-        df_temp.insert(0, 'cnpj', None)
-        df_temp.insert(0, 'periodo', data_efd)
-        df_temp.insert(0, 'id_pai', None)
-        df_temp.insert(0, 'id', composite_id)
+class _ByteWindow(io.RawIOBase):
+    """Read-only binary file over one or more slices of the uploaded bytes.
 
-        df_temp.loc[df_temp['1'].isin(["0000", "C001", "D001", "M001", "1001"]), 'cnpj'] = cnpj_header
-        df_temp.loc[df_temp['1'] == "0140", 'cnpj'] = df_temp['4']
-        df_temp.loc[df_temp['1'].isin(["A010", "C010", "D010", "F010", "I010", "P010"]), 'cnpj'] = df_temp['2']
+    Lets pandas parse a cut of the upload without first copying that cut into
+    a new bytes object (which doubled peak memory on large files); the parser
+    pulls its own small chunks through readinto.
+    """
 
-        df_temp.loc[df_temp['1'].isin(parent_reg_codes), 'id_pai'] = df_temp['id']
-        df_temp['id_pai'] = df_temp['id_pai'].ffill()
-        df_temp['cnpj'] = df_temp['cnpj'].ffill()
+    def __init__(self, segments):
+        self._segments = [memoryview(seg) for seg in segments]
+        self._size = sum(len(seg) for seg in self._segments)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = min(max(offset, 0), self._size)
+        return self._pos
+
+    def readinto(self, buffer):
+        out = memoryview(buffer).cast('B')
+        written = 0
+        skip = self._pos
+        for seg in self._segments:
+            if skip >= len(seg):
+                skip -= len(seg)
+                continue
+            n = min(len(seg) - skip, len(out) - written)
+            out[written:written + n] = seg[skip:skip + n]
+            written += n
+            skip = 0
+            if written == len(out):
+                break
+        self._pos += written
+        return written
+
+
+def _read_until_marker(uploaded_file, register=b'9999'):
+    """Return the raw bytes up to and including the first |register| line (e.g. |9999|)."""
+    raw = _read_raw_bytes(uploaded_file)
+    cut = _find_register(raw, register)
+    if cut != -1:
+        return _ByteWindow([memoryview(raw)[:_line_end(raw, cut)]])
+    return _ByteWindow([raw])
+
+
+def _read_ecd_window(uploaded_file):
+    """Return the raw ECD bytes up to |I990|, without the I200..I350 journal lines."""
+    raw = _read_raw_bytes(uploaded_file)
+    view = memoryview(raw)
+
+    pos_i200 = _find_register(raw, b'I200')
+    pos_i350 = _find_register(raw, b'I350')
+    if pos_i200 != -1 and pos_i350 == -1:
+        ranges = [(0, pos_i200)]
+    elif pos_i200 != -1 and pos_i200 < pos_i350:
+        ranges = [(0, pos_i200), (pos_i350, len(raw))]
+    else:
+        ranges = [(0, len(raw))]
+
+    # Stop at the I990 line (end of block I) inside the last kept range
+    start, stop = ranges[-1]
+    pos_i990 = _find_register(raw, b'I990', start)
+    if pos_i990 != -1 and pos_i990 < stop:
+        ranges[-1] = (start, _line_end(raw, pos_i990))
+
+    return _ByteWindow([view[a:b] for a, b in ranges])
+
+
+def _build_row_ids(prefix, n_rows):
+    """Return ``prefix + zero-padded row number`` ids as an object ndarray."""
+    # Arrow kernels format, pad and join in C++ (no per-row Python strings)
+    row_no = pc.utf8_lpad(pc.cast(pa.array(np.arange(n_rows)), pa.string()), width=7, padding='0')
+    return pc.binary_join_element_wise(prefix, row_no, '').to_numpy(zero_copy_only=False)
+
+
+def _register_masks(reg_col, *code_sets):
+    """Return one boolean mask per code set, hashing the register column only once."""
+    codes, uniques = pd.factorize(reg_col)
+    masks = []
+    for code_set in code_sets:
+        # Lookup table over the few distinct registers; the trailing False catches NaN (-1)
+        lut = np.fromiter((u in code_set for u in uniques), dtype=bool, count=len(uniques))
+        masks.append(np.append(lut, False)[codes])
+    return masks
+
+
+def _ffill_from(mask, values):
+    """Forward-fill ``values`` taken at the ``mask`` positions (one pass, no pandas ffill)."""
+    pos = np.where(mask, np.arange(len(mask)), -1)
+    np.maximum.accumulate(pos, out=pos)
+    filled = values[pos]
+    filled[pos < 0] = None
+    return filled
+
+
+def _compact_columns(df):
+    """Store the register code as a category (about 50 codes across millions of rows).
+
+    The remaining text columns stay object on purpose: the C parser already
+    reuses one str object per distinct value, the per-file header fields are
+    broadcast from a single scalar, and id_pai points at the id strings, so
+    those columns cost a pointer per row. Making them categorical would also
+    change multi-key groupby(dropna=False) output downstream (unobserved
+    combinations), and Arrow strings turn == masks into nullable booleans.
+    """
+    if '1' in df.columns:
+        df['1'] = df['1'].astype('category')
 
-        dfs.append(df_temp)
-        del df_temp  # Free memory immediately
-        gc.collect()  # Force garbage collection
 
-    df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=column_names + ['id', 'id_pai', 'periodo', 'cnpj'])
-    del dfs  # Free list of DataFrames
-    gc.collect()
+@st.cache_resource
+def _disk_cache_dir():
+    """Create the on-disk frame cache directory once; None if caching is off.
 
-    if df.empty:
-        st.error("Falha ao ler o SPED Contribuições: nenhum arquivo válido ou todas as linhas foram descartadas como inválidas.")
-        st.stop()
+    The directory is made private to the current user (0700); one owned by
+    someone else is never used.
+    """
+    if not config.DISK_CACHE_DIR:
+        return None
+    try:
+        os.makedirs(config.DISK_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.stat(config.DISK_CACHE_DIR)
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            return None
+        if info.st_mode & 0o077:
+            os.chmod(config.DISK_CACHE_DIR, 0o700)
+    except OSError:
+        return None
+    return config.DISK_CACHE_DIR
 
-    # Convert register code to categorical for memory efficiency (50 unique values, millions of rows)
-    if '1' in df.columns:
-        df['1'] = df['1'].astype('category')
 
-    return df
+def _open_private(path):
+    """Create ``path`` for writing, readable only by the current user (0600)."""
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb")
 
 
-@st.cache_data
-def load_and_process_sped_fiscal(uploaded_files):
-    if not uploaded_files:
-        st.error("Por favor, carregue no mínimo um arquivo .txt")
-        st.stop()
+def _entry_size(path):
+    """Size in bytes of a cache entry (a Feather file or a bundle directory)."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
 
-    delimiter = config.DELIMITER
-    encoding = config.ENCODING
-    column_names = [str(i) for i in range(config.COLUMN_COUNT_FISCAL)]
-    parent_reg_codes = config.PARENT_REG_FISCAL
 
-    dfs = []
-    for i, single_file in enumerate(uploaded_files):
-        single_file.seek(0)
-        # Memory-efficient approach: stream file and stop at |9999| marker
-        valid_lines = []
-        file_content = single_file.read()
-        if isinstance(file_content, bytes):
-            file_content = file_content.decode(encoding, errors='ignore')
-
-        # Stream lines and stop at |9999|
-        for line in file_content.splitlines():
-            valid_lines.append(line)
-            if line.startswith('|9999|'):
-                break
+def _remove_entry(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
 
-        # Join only valid lines
-        valid_content = '\n'.join(valid_lines)
-        del valid_lines  # Free memory immediately
-        del file_content  # Free memory immediately
 
-        # Now read the cleaned content with fast C engine
-        from io import StringIO
-        f_clean = StringIO(valid_content)
+def _prune_disk_cache(cache_dir):
+    """Evict cache entries older than DISK_CACHE_MAX_AGE, then the least recently
+    used ones until the directory fits in DISK_CACHE_MAX_BYTES.
 
+    Entries keyed on an older version of the code are never hit again, so they
+    age out here as well.
+    """
+    now = time.time()
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                try:
+                    mtime = entry.stat().st_mtime
+                    if now - mtime > config.DISK_CACHE_MAX_AGE:
+                        _remove_entry(entry.path)
+                    elif not entry.name.endswith(".tmp"):
+                        entries.append((mtime, _entry_size(entry.path), entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= config.DISK_CACHE_MAX_BYTES:
+            break
         try:
-            df_temp = pd.read_csv(
-                f_clean,
-                header=None,
-                delimiter=delimiter,
-                names=column_names,
-                low_memory=False,
-                encoding=None,  # Already decoded
-                dtype=str,
-                engine="c",
-                on_bad_lines="skip"
-            )
-        except pd.errors.ParserError:
-            # Fallback to Python engine if C engine still fails
-            f_clean.seek(0)
-            reader = pd.read_csv(
-                f_clean,
-                header=None,
-                delimiter=delimiter,
-                names=column_names,
-                encoding=None,
-                dtype=str,
-                engine="python",
-                on_bad_lines="skip",
-                chunksize=config.CHUNK_SIZE,
-                quoting=csv.QUOTE_NONE
-            )
-            parts = []
-            for chunk in reader:
-                parts.append(chunk)
-            df_temp = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=column_names)
-        if df_temp.empty:
+            _remove_entry(path)
+        except OSError:
             continue
+        total -= size
 
-        # Bounds check: ensure df_temp has at least one row before accessing row 0
-        if len(df_temp) == 0:
-            continue
-
-        data_efd = df_temp.loc[0, '4'][2:] if pd.notna(df_temp.loc[0, '4']) else None
-        cnpj_estab = df_temp.loc[0, '7'] if pd.notna(df_temp.loc[0, '7']) else None
-        ie_estab = df_temp.loc[0, '10'] if pd.notna(df_temp.loc[0, '10']) else None
-        uf_estab = df_temp.loc[0, '9'] if pd.notna(df_temp.loc[0, '9']) else None
-
-        if '0' in df_temp.columns:
-            df_temp.drop(columns=['0'], inplace=True)
-
-        # Vectorized ID generation with numpy (faster than pandas string ops)
-        prefix_file = str(i)
-        prefix_periodo = str(data_efd) if data_efd is not None else "NA"
-        prefix_cnpj = str(cnpj_estab) if cnpj_estab is not None else "NA"
-        prefix_combined = f"{prefix_file}|{prefix_periodo}|{prefix_cnpj}|"
-        row_no_array = np.char.zfill(np.arange(len(df_temp)).astype(str), 7)
-        composite_id = np.char.add(prefix_combined, row_no_array)
-
-        df_temp.insert(0, 'uf_estab', uf_estab)
-        df_temp.insert(0, 'ie_estab', ie_estab)
-        df_temp.insert(0, 'cnpj_estab', cnpj_estab)
-        df_temp.insert(0, 'periodo', data_efd)
-        df_temp.insert(0, 'id_pai', None)
-        df_temp.insert(0, 'id', composite_id)
-
-        df_temp.loc[df_temp['1'].isin(parent_reg_codes), 'id_pai'] = df_temp['id']
-        df_temp['id_pai'] = df_temp['id_pai'].ffill()
-        df_temp['cnpj_estab'] = df_temp['cnpj_estab'].ffill()
-
-        dfs.append(df_temp)
-        del df_temp  # Free memory immediately
-        gc.collect()  # Force garbage collection
 
-    df_sped_fiscal = pd.concat(dfs, ignore_index=True)
-    del dfs  # Free list of DataFrames
-    gc.collect()
-
-    if "id" in df_sped_fiscal.columns:
-        df_sped_fiscal = df_sped_fiscal.drop_duplicates(subset=["id"], keep="last")
+def _touch(path):
+    """Mark a cache entry as just used (pruning is least recently used first)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _content_key(kind, files, sources=()):
+    """Return ``kind-<digest>`` over the full file contents (in order) together with
+    this module, config and any extra ``sources``, so a code change never matches
+    an older key."""
+    h = hashlib.blake2b(kind.encode(), digest_size=20)
+    for source in (__file__, config.__file__, *sources):
+        with open(source, 'rb') as fh:
+            h.update(fh.read())
+    for f in files:
+        raw = _read_raw_bytes(f)
+        h.update(len(raw).to_bytes(8, 'little'))
+        h.update(raw)
+    return f"{kind}-{h.hexdigest()}"
+
+
+def _disk_cache_path(kind, files):
+    """Return the cache file for ``files`` loaded as ``kind``, or None if caching is off."""
+    cache_dir = _disk_cache_dir()
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, f"{_content_key(kind, files)}.feather")
+
+
+def _read_feather(path, restore_nan):
+    """Read a Feather file back into pandas, with NaN for missing values in the ``restore_nan`` columns."""
+    table = feather.read_table(path, memory_map=True)
+    df = table.to_pandas()
+    # Arrow hands missing strings back as None; the pandas code produced NaN
+    for col in df.columns:
+        if restore_nan(col) and df[col].dtype == object:
+            nulls = table.column(col).is_null().to_numpy(zero_copy_only=False)
+            if nulls.any():
+                values = df[col].to_numpy(copy=True)
+                values[nulls] = np.nan
+                df[col] = values
+    return df
 
-    # Convert register code to categorical for memory efficiency (50 unique values, millions of rows)
-    if '1' in df_sped_fiscal.columns:
-        df_sped_fiscal['1'] = df_sped_fiscal['1'].astype('category')
 
-    return df_sped_fiscal
+def _read_disk_cache(path):
+    """Load a cached frame, or None on a miss or an unreadable file."""
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        df = _read_feather(path, str.isdigit)
+    except (OSError, pa.ArrowException):
+        return None
+    _touch(path)
+    return df
 
 
-def _process_single_ecd_file(uploaded_file, file_index):
-    delimiter = config.DELIMITER
-    encoding = config.ENCODING
-    column_names = [str(i) for i in range(config.COLUMN_COUNT_ECD)]
-    parent_reg_codes = config.PARENT_REG_ECD
+def _write_disk_cache(path, df):
+    """Store a loaded frame as zstd Feather; caching failures never break a load."""
+    if path is None:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with _open_private(tmp_path) as fh:
+            feather.write_feather(df, fh, compression='zstd', compression_level=3)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError, TypeError, pa.ArrowException):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _prune_disk_cache(os.path.dirname(path))
+
+
+def bundle_key(kind, files, sources=()):
+    """Return the content key of the frames derived from ``files`` as ``kind``.
+
+    Besides the file contents, the key covers the loaders, config, the
+    processors and the extra ``sources`` (typically the module that builds
+    the bundle). It is computed whether or not the disk cache is on, so it can
+    also key in-memory caches of later stages.
+    """
+    return _content_key(kind, files, (processors.__file__, *sources))
 
-    # Memory-efficient approach: stream file and stop at |9999| marker
-    uploaded_file.seek(0)
-    valid_lines = []
-    file_content = uploaded_file.read()
-    if isinstance(file_content, bytes):
-        file_content = file_content.decode(encoding, errors='ignore')
-
-    # Stream lines and stop at |9999|
-    for line in file_content.splitlines():
-        valid_lines.append(line)
-        if line.startswith('|9999|'):
-            break
 
-    # Join only valid lines
-    valid_content = '\n'.join(valid_lines)
-    del valid_lines  # Free memory immediately
-    del file_content  # Free memory immediately
+def bundle_cache_path(key):
+    """Return the on-disk cache directory for the bundle with this ``bundle_key``, or None if caching is off."""
+    cache_dir = _disk_cache_dir()
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, f"{key}.bundle")
 
-    # Now read the cleaned content with fast C engine
-    from io import StringIO
-    f_clean = StringIO(valid_content)
 
+def read_bundle_cache(path):
+    """Load a bundle stored by write_bundle_cache, or None on a miss or an unreadable cache."""
+    if path is None or not os.path.isdir(path):
+        return None
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        bundle = {}
+        for name in manifest["order"]:
+            if name in manifest["scalars"]:
+                bundle[name] = manifest["scalars"][name]
+            else:
+                bundle[name] = _read_feather(os.path.join(path, f"{name}.feather"), lambda col: True)
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return None
+    _touch(path)
+    return bundle
+
+
+def _bundle_scalar(value):
+    """JSON form of a bundle scalar; TypeError for anything that would not read back as the same value."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError(f"unsupported bundle value {type(value).__name__}")
+
+
+def write_bundle_cache(path, bundle):
+    """Store a dict of DataFrames (plus None, bool, numeric or string scalars) as one zstd Feather file each.
+
+    The directory is written under a temporary name and renamed into place,
+    so readers never see a partial bundle. A bundle that cannot be stored is
+    logged and skipped; the caller keeps its in-memory result.
+    """
+    if path is None:
+        return
+    tmp_dir = f"{path}.{os.getpid()}.tmp"
+    manifest = {"order": list(bundle), "scalars": {}}
+    try:
+        os.makedirs(tmp_dir, mode=0o700, exist_ok=True)
+        for name, value in bundle.items():
+            if isinstance(value, pd.DataFrame):
+                with _open_private(os.path.join(tmp_dir, f"{name}.feather")) as fh:
+                    feather.write_feather(value, fh, compression='zstd', compression_level=3)
+            else:
+                manifest["scalars"][name] = _bundle_scalar(value)
+        with _open_private(os.path.join(tmp_dir, "manifest.json")) as fh:
+            fh.write(json.dumps(manifest).encode("utf-8"))
+        os.replace(tmp_dir, path)
+    except (OSError, ValueError, TypeError, pa.ArrowException) as exc:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # a concurrent run storing the same bundle first is not a miss
+        if not os.path.isdir(path):
+            logger.warning("bundle cache not written to %s: %s", path, exc)
+        return
+    _prune_disk_cache(os.path.dirname(path))
+
+
+def _prepend_columns(df, columns):
+    """Prepend ``columns`` (name -> array or scalar) to ``df`` in a single concat."""
+    front = pd.DataFrame(columns, index=df.index)
+    return pd.concat([front, df], axis=1, copy=False)
+
+
+def _parse_files(process, files):
+    """Run ``process(window, file_index)`` over every file, preserving input order.
+
+    The raw windows are taken up front on the calling thread (so a file object
+    listed twice is never read concurrently); parsing then runs in a thread
+    pool, since the Arrow kernels and the C parser release the GIL.
+    """
+    windows = [_read_until_marker(f) for f in files]
+    if len(windows) == 1:
+        return [process(windows[0], 0)]
+    with ThreadPoolExecutor(max_workers=min(len(windows), os.cpu_count() or 1)) as executor:
+        return list(executor.map(process, windows, range(len(windows))))
+
+
+def _split_sped_lines(f_clean, column_names, used_count):
+    """Split pipe-delimited SPED lines into a frame of string columns with Arrow kernels.
+
+    Matches the pandas read below (rows padded with NaN up to ``column_names``,
+    wider rows skipped, the default NA strings as NaN, one shared str object per
+    distinct value), but the line split and the value interning run in Arrow.
+    Quotes are plain characters, as in the SPED layout and the python fallback.
+    Only the first ``used_count`` columns are built; the full ``column_names``
+    width still decides which rows are too wide.
+    """
+    n_cols = len(column_names)
+    lines = pacsv.read_csv(
+        f_clean,
+        read_options=pacsv.ReadOptions(column_names=['line'], encoding=config.ENCODING),
+        parse_options=pacsv.ParseOptions(delimiter='\x1f', quote_char=False),
+        convert_options=pacsv.ConvertOptions(column_types={'line': pa.large_string()}, strings_can_be_null=False),
+    ).column('line').combine_chunks()
+    fields = pc.split_pattern(lines, config.DELIMITER)
+    # Release the lines before the dictionary encoding, the Arrow-side peak
+    del lines
+    counts = np.diff(fields.offsets.to_numpy())
+    encoded = pc.dictionary_encode(fields.values)
+    codes = encoded.indices.to_numpy()
+
+    fits = counts <= n_cols
+    if not fits.all():
+        # on_bad_lines="skip": drop rows with more fields than names
+        codes = codes[np.repeat(fits, counts)]
+        counts = counts[fits]
+
+    # True where a row has a field, in the same row-major order as the codes
+    filled = np.arange(n_cols) < counts[:, None]
+    if (counts > used_count).any():
+        # Drop the fields past used_count
+        codes = codes[np.broadcast_to(np.arange(n_cols) < used_count, filled.shape)[filled]]
+    filled = filled[:, :used_count]
+
+    # One str object per distinct value; the extra last slot pads short rows
+    lookup = np.empty(len(encoded.dictionary) + 1, dtype=object)
+    lookup[:-1] = encoded.dictionary.to_numpy(zero_copy_only=False)
+    lookup[:-1][pc.is_in(encoded.dictionary, value_set=_PANDAS_NA_STRINGS).to_numpy(zero_copy_only=False)] = np.nan
+    lookup[-1] = np.nan
+
+    # Scatter the codes (kept as the int32 dictionary indices) into a rows x columns
+    # grid through the mask, then gather the strings once
+    grid = np.full(filled.shape, len(lookup) - 1, dtype=codes.dtype)
+    grid[filled] = codes
+    return pd.DataFrame(lookup[grid], columns=column_names[:used_count])
+
+
+def _read_sped_frame(f_clean, column_names, used_count):
+    """Parse the raw bytes of one SPED file into a frame of its first ``used_count`` string columns.
+
+    Rows with more fields than ``column_names`` are skipped.
+    """
+    try:
+        return _split_sped_lines(f_clean, column_names, used_count)
+    except (pa.ArrowException, ValueError):
+        # Fall back to the pandas parsers (e.g. a stray \x1f inside a line)
+        f_clean.seek(0)
     try:
-        reader = pd.read_csv(
+        df = pd.read_csv(
             f_clean,
             header=None,
-            delimiter=delimiter,
+            delimiter=config.DELIMITER,
             names=column_names,
-            encoding=None,  # Already decoded
+            low_memory=False,
+            encoding=config.ENCODING,
             dtype=str,
             engine="c",
             on_bad_lines="skip",
-            chunksize=config.CHUNK_SIZE
+            quoting=csv.QUOTE_NONE
         )
-    except (pd.errors.ParserError, UnicodeDecodeError, csv.Error) as e:
-        # Fallback to Python engine if C engine fails
+    except (pd.errors.ParserError, UnicodeDecodeError):
+        # Quotes are literal and wide rows are skipped, so the C engine only
+        # gives up on tokenizer/decoding failures; the Python engine is the
+        # (much slower) last resort for those
         f_clean.seek(0)
-        reader = pd.read_csv(
+        df = pd.read_csv(
             f_clean,
             header=None,
-            delimiter=delimiter,
+            delimiter=config.DELIMITER,
             names=column_names,
-            encoding=None,
+            encoding=config.ENCODING,
             dtype=str,
             engine="python",
             on_bad_lines="skip",
-            chunksize=config.CHUNK_SIZE,
             quoting=csv.QUOTE_NONE
         )
+    return df.iloc[:, :used_count]
 
-    dfs = []
-    in_skip = False
-    after_resume = False
 
-    try:
-        for chunk in reader:
-            codes = chunk['1'].astype(str)
-            mask_i200 = codes.eq('I200')
-            mask_i350 = codes.eq('I350')
+def _process_single_contrib_file(window, file_index):
+    column_names = [str(i) for i in range(config.COLUMN_COUNT_CONTRIB)]
+    df_temp = _read_sped_frame(window, column_names, config.USED_COLUMN_COUNT_CONTRIB)
 
-            if not in_skip and not after_resume:
-                has200 = mask_i200.any()
-                has350 = mask_i350.any()
+    if not df_temp.empty and '1' in df_temp.columns:
+        mask_all = df_temp['1'].to_numpy() == '9999'
+        if mask_all.any():
+            cut = int(mask_all.argmax())
+            # A view is enough: nothing writes into df_temp and the final concat copies
+            df_temp = df_temp.iloc[:cut+1]
 
-                if not has200 and not has350:
-                    dfs.append(chunk)
-                    continue
+    # Bounds check: ensure df_temp has at least one row before accessing row 0
+    if len(df_temp) == 0:
+        return pd.DataFrame()
 
-                if has200 and not has350:
-                    first200 = int(np.argmax(mask_i200.to_numpy()))
-                    if first200 > 0:
-                        dfs.append(chunk.iloc[:first200])
-                    in_skip = True
-                    continue
+    data_efd = df_temp.loc[0, '7'][2:] if pd.notna(df_temp.loc[0, '7']) else None
+    cnpj_header = df_temp.loc[0, '9'] if pd.notna(df_temp.loc[0, '9']) else None
 
-                if not has200 and has350:
-                    dfs.append(chunk)
-                    after_resume = True
-                    continue
+    # Keep only the fields the Bloco_* functions read (a view; the concat below copies)
+    df_temp = df_temp.iloc[:, 1:config.USED_COLUMN_COUNT_CONTRIB]
 
-                first200 = int(np.argmax(mask_i200.to_numpy()))
-                first350 = int(np.argmax(mask_i350.to_numpy()))
-                if first200 < first350:
-                    if first200 > 0:
-                        dfs.append(chunk.iloc[:first200])
-                    dfs.append(chunk.iloc[first350:])
-                    after_resume = True
-                    in_skip = False
-                else:
-                    dfs.append(chunk)
-                    after_resume = True
-                    in_skip = False
-                continue
+    # Vectorized ID generation with Arrow kernels (faster than pandas string ops)
+    prefix_file = str(file_index)
+    prefix_periodo = str(data_efd) if data_efd is not None else "NA"
+    prefix_cnpj = str(cnpj_header) if cnpj_header is not None else "NA"
+    prefix_combined = f"{prefix_file}|{prefix_periodo}|{prefix_cnpj}|"
+    composite_id = _build_row_ids(prefix_combined, len(df_temp))
+
+    # Tag parent ids and establishment CNPJs, then forward-fill both in one pass
+    mask_header, mask_0140, mask_estab, mask_parent = _register_masks(
+        df_temp['1'], _CNPJ_HEADER_REG_CONTRIB, {"0140"}, _CNPJ_ESTAB_REG_CONTRIB, _PARENT_REG_CONTRIB
+    )
+
+    cnpj_src = np.full(len(df_temp), None, dtype=object)
+    cnpj_src[mask_header] = cnpj_header
+    cnpj_src[mask_0140] = df_temp['4'].to_numpy()[mask_0140]
+    cnpj_src[mask_estab] = df_temp['2'].to_numpy()[mask_estab]
+
+    return _prepend_columns(df_temp, {
+        'id': composite_id,
+        'id_pai': _ffill_from(mask_parent, composite_id),
+        'periodo': data_efd,
+        'cnpj': _ffill_from(pd.notna(cnpj_src), cnpj_src),
+    })
+
+
+def _process_single_fiscal_file(window, file_index):
+    column_names = [str(i) for i in range(config.COLUMN_COUNT_FISCAL)]
+    df_temp = _read_sped_frame(window, column_names, config.USED_COLUMN_COUNT_FISCAL)
 
-            if in_skip and not after_resume:
-                if mask_i350.any():
-                    first350 = int(np.argmax(mask_i350.to_numpy()))
-                    dfs.append(chunk.iloc[first350:])
-                    in_skip = False
-                    after_resume = True
-                continue
+    # Bounds check: ensure df_temp has at least one row before accessing row 0
+    if len(df_temp) == 0:
+        return pd.DataFrame()
 
-            if after_resume:
-                dfs.append(chunk)
-                continue
-    except (pd.errors.ParserError, UnicodeDecodeError, csv.Error, StopIteration) as e:
-        # Fallback: read entire file at once if chunk processing fails
-        uploaded_file.seek(0)
-        raw = uploaded_file.read()
-        text = raw.decode(encoding, errors='ignore') if isinstance(raw, (bytes, bytearray)) else str(raw)
-
-        trimmed_lines = []
-        for ln in text.splitlines():
-            trimmed_lines.append(ln)
-            if ln.startswith('|I990|'):
-                break
-        buf = io.StringIO('\n'.join(trimmed_lines))
+    data_efd = df_temp.loc[0, '4'][2:] if pd.notna(df_temp.loc[0, '4']) else None
+    cnpj_estab = df_temp.loc[0, '7'] if pd.notna(df_temp.loc[0, '7']) else None
+    ie_estab = df_temp.loc[0, '10'] if pd.notna(df_temp.loc[0, '10']) else None
+    uf_estab = df_temp.loc[0, '9'] if pd.notna(df_temp.loc[0, '9']) else None
+
+    # Keep only the fields the Bloco_* functions read (a view; the concat below copies)
+    df_temp = df_temp.iloc[:, 1:config.USED_COLUMN_COUNT_FISCAL]
+
+    # Vectorized ID generation with Arrow kernels (faster than pandas string ops)
+    prefix_file = str(file_index)
+    prefix_periodo = str(data_efd) if data_efd is not None else "NA"
+    prefix_cnpj = str(cnpj_estab) if cnpj_estab is not None else "NA"
+    prefix_combined = f"{prefix_file}|{prefix_periodo}|{prefix_cnpj}|"
+    composite_id = _build_row_ids(prefix_combined, len(df_temp))
+
+    # cnpj_estab is constant per file, so only id_pai needs a forward-fill
+    (mask_parent,) = _register_masks(df_temp['1'], _PARENT_REG_FISCAL)
+
+    return _prepend_columns(df_temp, {
+        'id': composite_id,
+        'id_pai': _ffill_from(mask_parent, composite_id),
+        'periodo': data_efd,
+        'cnpj_estab': cnpj_estab,
+        'ie_estab': ie_estab,
+        'uf_estab': uf_estab,
+    })
+
+
+@st.cache_data
+def load_and_process_data(uploaded_file):
+    """Load one or more SPED Contribuições files and build stable, cross-file unique IDs."""
+    if uploaded_file is None or (isinstance(uploaded_file, list) and len(uploaded_file) == 0):
+        st.error("Por favor, carregue pelo menos um arquivo .txt")
+        st.stop()
+
+    kept_columns = [str(i) for i in range(1, config.USED_COLUMN_COUNT_CONTRIB)]
+
+    files = uploaded_file if isinstance(uploaded_file, list) else [uploaded_file]
+    cache_path = _disk_cache_path("contrib", files)
+    cached = _read_disk_cache(cache_path)
+    if cached is not None:
+        return cached
+
+    dfs = [df_temp for df_temp in _parse_files(_process_single_contrib_file, files) if not df_temp.empty]
+
+    df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=kept_columns + ['id', 'id_pai', 'periodo', 'cnpj'])
+    del dfs  # Free list of DataFrames
+    gc.collect()
+
+    if df.empty:
+        st.error("Falha ao ler o SPED Contribuições: nenhum arquivo válido ou todas as linhas foram descartadas como inválidas.")
+        st.stop()
+
+    _compact_columns(df)
+    _write_disk_cache(cache_path, df)
+
+    return df
+
+
+@st.cache_data
+def load_and_process_sped_fiscal(uploaded_files):
+    if not uploaded_files:
+        st.error("Por favor, carregue no mínimo um arquivo .txt")
+        st.stop()
+
+    cache_path = _disk_cache_path("fiscal", uploaded_files)
+    cached = _read_disk_cache(cache_path)
+    if cached is not None:
+        return cached
+
+    dfs = [df_temp for df_temp in _parse_files(_process_single_fiscal_file, uploaded_files) if not df_temp.empty]
+
+    df_sped_fiscal = pd.concat(dfs, ignore_index=True)
+    del dfs  # Free list of DataFrames
+    gc.collect()
+
+    # No drop_duplicates on "id": ids embed the file index and row number, so
+    # they are unique by construction (re-uploads are filtered by the file registry)
+
+    _compact_columns(df_sped_fiscal)
+    _write_disk_cache(cache_path, df_sped_fiscal)
+
+    return df_sped_fiscal
+
+
+def _process_single_ecd_file(uploaded_file, file_index):
+    delimiter = config.DELIMITER
+    encoding = config.ENCODING
+    column_names = [str(i) for i in range(config.COLUMN_COUNT_ECD)]
+    kept_columns = column_names[1:config.USED_COLUMN_COUNT_ECD]
+
+    # Cut the raw bytes to the useful window (up to |I990|, without the
+    # I200..I350 journal lines) so pandas parses only the kept lines
+    f_clean = _read_ecd_window(uploaded_file)
+
+    try:
+        df = _read_sped_frame(f_clean, column_names, config.USED_COLUMN_COUNT_ECD)
+    except (pd.errors.ParserError, UnicodeDecodeError, csv.Error) as e:
+        # Fallback: parse everything up to |I990| with the Python engine,
+        # straight from the raw bytes (no decode/splitlines/join round trip)
+        buf = _read_until_marker(uploaded_file, b'I990')
 
         df_fallback = pd.read_csv(
             buf,
@@ -396,59 +688,58 @@ def _process_single_ecd_file(uploaded_file, file_index):
         )
 
         if not df_fallback.empty and '1' in df_fallback.columns:
-            codes = df_fallback['1'].astype(str)
-            has200 = codes.eq('I200').any()
-            has350 = codes.eq('I350').any()
+            codes = df_fallback['1'].to_numpy()
+            mask_i200 = codes == 'I200'
+            mask_i350 = codes == 'I350'
+            has200 = mask_i200.any()
+            has350 = mask_i350.any()
             if has200 and not has350:
-                first200 = int(np.argmax(codes.eq('I200').to_numpy()))
+                first200 = int(mask_i200.argmax())
                 if first200 > 0:
                     df_fallback = df_fallback.iloc[:first200].copy()
             elif has200 and has350:
-                first200 = int(np.argmax(codes.eq('I200').to_numpy()))
-                first350 = int(np.argmax(codes.eq('I350').to_numpy()))
+                first200 = int(mask_i200.argmax())
+                first350 = int(mask_i350.argmax())
                 if first200 < first350:
                     df_fallback = pd.concat([
                         df_fallback.iloc[:first200],
                         df_fallback.iloc[first350:]
                     ], ignore_index=True)
-        dfs = [df_fallback]
-
-    df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=column_names)
+        df = df_fallback
 
     if not df.empty and '1' in df.columns:
-        mask_all = df['1'].astype(str).eq('I990')
+        mask_all = df['1'].to_numpy() == 'I990'
         if mask_all.any():
-            cut = int(np.argmax(mask_all.to_numpy()))
-            df = df.iloc[:cut+1].copy()
+            cut = int(mask_all.argmax())
+            # A view is enough: nothing writes into df and the final concat copies
+            df = df.iloc[:cut+1]
 
     # Bounds check: ensure df has at least one row before accessing row 0
     if len(df) == 0:
-        return pd.DataFrame(columns=['id', 'id_pai', 'ano', 'cnpj'] + [str(i) for i in range(1, 40)])
+        return pd.DataFrame(columns=['id', 'id_pai', 'ano', 'cnpj'] + kept_columns)
 
     ano_ecd = df.loc[0, '3'][4:] if pd.notna(df.loc[0, '3']) else None
     cnpj = df.loc[0, '6'] if pd.notna(df.loc[0, '6']) else None
 
-    if '0' in df.columns:
-        df.drop(columns=['0'], inplace=True)
+    # Keep only the fields Bloco_I_ECD reads (a view; the concat below copies)
+    df = df.iloc[:, 1:config.USED_COLUMN_COUNT_ECD]
 
-    # Build deterministic, cross-file row id (vectorized with numpy for speed)
+    # Build deterministic, cross-file row id (vectorized with Arrow kernels)
     # id := "<fileidx>|<ano>|<cnpj>|<row_no_zfilled>"
     prefix_file = str(file_index)
     prefix_ano = str(ano_ecd) if ano_ecd is not None else "NA"
     prefix_cnpj = str(cnpj) if cnpj is not None else "NA"
     prefix_combined = f"{prefix_file}|{prefix_ano}|{prefix_cnpj}|"
-    row_no_array = np.char.zfill(np.arange(len(df)).astype(str), 7)
-    composite_id = np.char.add(prefix_combined, row_no_array)
-
-    df.insert(0, 'cnpj', cnpj)
-    df.insert(0, 'ano', ano_ecd)
-    df.insert(0, 'id_pai', None)
-    df.insert(0, 'id', composite_id)
+    composite_id = _build_row_ids(prefix_combined, len(df))
 
-    df.loc[df['1'].isin(parent_reg_codes), 'id_pai'] = df['id']
-    df['id_pai'] = df['id_pai'].ffill()
+    (mask_parent,) = _register_masks(df['1'], _PARENT_REG_ECD)
 
-    return df
+    return _prepend_columns(df, {
+        'id': composite_id,
+        'id_pai': _ffill_from(mask_parent, composite_id),
+        'ano': ano_ecd,
+        'cnpj': cnpj,
+    })
 
 
 @st.cache_data
@@ -466,6 +757,11 @@ def load_and_process_ecd(uploaded_files):
         st.error("Por favor, carregue pelo menos um arquivo .txt válido")
         st.stop()
 
+    cache_path = _disk_cache_path("ecd", files)
+    cached = _read_disk_cache(cache_path)
+    if cached is not None:
+        return cached
+
     dfs = []
     for idx, single_file in enumerate(files):
         df_single = _process_single_ecd_file(single_file, idx)
@@ -482,8 +778,7 @@ def load_and_process_ecd(uploaded_files):
     del dfs  # Free list of DataFrames
     gc.collect()
 
-    # Convert register code to categorical for memory efficiency (50 unique values, millions of rows)
-    if '1' in df_ecd.columns:
-        df_ecd['1'] = df_ecd['1'].astype('category')
+    _compact_columns(df_ecd)
+    _write_disk_cache(cache_path, df_ecd)
 
     return df_ecd
@@ -7,6 +7,8 @@ and transform data from SPED Contribuições, SPED Fiscal, and ECD files.
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 from taxdash import config
 
 
@@ -14,39 +16,150 @@ def _get_register_group(groups, register_code, columns=None):
     """
     Safely extract a register group from grouped DataFrame.
 
+    The block processors group the frame by register once and pull every register
+    from that grouping, instead of scanning the whole frame for each one.
+
     Args:
         groups: DataFrameGroupBy object (result of df.groupby('1'))
         register_code: Register code to extract (e.g., 'C100')
         columns: Number of columns to slice (optional)
 
     Returns:
-        DataFrame with the requested register, or empty DataFrame if not found
+        DataFrame with the requested register, or an empty one (same columns) if not found
     """
-    if register_code not in groups.groups:
-        return pd.DataFrame()
-
-    df = groups.get_group(register_code)
+    positions = groups.indices.get(register_code)
+    if positions is None:
+        # Empty slice that still carries the frame's columns
+        df = groups.obj.iloc[0:0]
+    else:
+        df = groups.obj.take(positions)
     if columns is not None:
         df = df.iloc[:, :columns]
 
     return df
 
 
-def _replace_comma_decimal(df, numeric_columns):
+def _insert_columns(df, new_columns):
+    """
+    Insert several derived columns into a DataFrame with one concat.
+
+    Equivalent to calling ``df.insert(loc, name, values)`` for each entry in
+    order, without reshuffling the frame's blocks once per column.
+
+    Args:
+        df: DataFrame receiving the columns
+        new_columns: List of ``(loc, name, values)`` tuples, applied in order
+
+    Returns:
+        New DataFrame with the columns in their final positions
+    """
+    order = list(df.columns)
+    for loc, name, _ in new_columns:
+        order.insert(loc, name)
+    added = pd.DataFrame({name: values for _, name, values in new_columns}, index=df.index)
+    return pd.concat([df, added], axis=1, copy=False)[order]
+
+
+_LOOKUP_SERIES = {}
+
+
+def _lookup(mapping):
+    """
+    Return a code table (dict) as a Series ready for ``Series.map``.
+
+    ``Series.map(dict)`` rebuilds a Series from the dict on every call; the
+    tables in dicts.py are constants, so each one is converted only once.
+
+    Args:
+        mapping: Dict of code -> description
+
+    Returns:
+        Series indexed by code
+    """
+    cached = _LOOKUP_SERIES.get(id(mapping))
+    if cached is None or cached[0] is not mapping:
+        # Keep the dict alongside its Series so the id cannot be reused
+        cached = (mapping, pd.Series(mapping))
+        _LOOKUP_SERIES[id(mapping)] = cached
+    return cached[1]
+
+
+def _participant_uf(reg_0150_idx, cod_uf):
+    """
+    Map each participant code to its UF.
+
+    The UF comes from the first two digits of the participant's COD_MUN
+    (field '8' of 0150), resolved on the small 0150 table so the big child
+    registers need a single ``map`` per call.
+
+    Args:
+        reg_0150_idx: 0150 register indexed by COD_PART (field '2')
+        cod_uf: Dict of IBGE state code -> UF
+
+    Returns:
+        Series of UFs indexed by COD_PART
+    """
+    return reg_0150_idx['8'].astype(str).str[:2].map(_lookup(cod_uf))
+
+
+def descr_startswith(descr, *prefixes):
+    """
+    Return one boolean mask per prefix for a description column (case-insensitive).
+
+    The lower/startswith work runs on the distinct descriptions only (a few
+    hundred CFOPs) and is broadcast back to the rows; missing values are False.
+
+    Args:
+        descr: Series of descriptions (e.g. C170['cfop_descr'])
+        prefixes: Lower-case prefixes to test (e.g. 'venda', 'compra')
+
+    Returns:
+        List of boolean ndarrays aligned with ``descr``
+    """
+    codes, uniques = pd.factorize(descr)
+    lowered = pd.Series(uniques, dtype=object).str.lower().fillna('')
+    # the trailing False catches missing descriptions (code -1)
+    return [np.append(lowered.str.startswith(prefix).to_numpy(dtype=bool), False)[codes]
+            for prefix in prefixes]
+
+
+def _to_numeric(df, numeric_columns):
     """
-    Replace comma with dot for numeric columns (fast non-regex version).
+    Convert comma-decimal string columns to numbers using Arrow compute kernels.
+
+    Only the listed columns are touched; text columns keep their original commas. Like
+    pd.to_numeric, a column with no nulls whose values are all integer literals stays int64;
+    everything else becomes float64.
 
     Args:
         df: DataFrame to process
         numeric_columns: List of column names/numbers that contain numeric values
 
     Returns:
-        Modified DataFrame
+        New DataFrame with the numeric columns converted
     """
+    converted = {}
     for col in numeric_columns:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(',', '.', regex=False)
-
+        if col not in df.columns:
+            continue
+        try:
+            values = pa.array(df[col].to_numpy(), type=pa.string(), from_pandas=True)
+            if values.null_count == 0:
+                try:
+                    converted[col] = pc.cast(values, pa.int64()).to_numpy()
+                    continue
+                except pa.ArrowInvalid:
+                    pass
+            values = pc.replace_substring(values, ',', '.')
+            converted[col] = pc.cast(values, pa.float64()).to_numpy(zero_copy_only=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Malformed values: keep pd.to_numeric(errors='coerce') semantics
+            converted[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.', regex=False), errors='coerce')
+
+    # assign() would deep-copy every column; a shallow copy only swaps the converted ones
+    df = df.copy(deep=False)
+    for col, values in converted.items():
+        df[col] = values
     return df
 
 
@@ -78,78 +191,69 @@ def Bloco_0(df):
 
 def Bloco_M(df, tab_4_3_7, tab_4_3_8, tab_4_3_5, cst_pis_cofins):
     """Extract and process M-block registers."""
-    M100 = (df[df['1'] == 'M100']
-            .iloc[:,0:19]
-            .replace(',', '.', regex=True))
-    M100[['4', '5', '6', '8', '9', '10', '11', '12', '14', '15']] = M100[['4', '5', '6', '8', '9', '10', '11', '12', '14', '15']].apply(pd.to_numeric, errors='coerce')
+    groups = df.groupby('1', sort=False, observed=True)
 
-    M105 = (df[df['1'] == 'M105']
-        .iloc[:,0:14]
-        .replace(',', '.', regex=True))
-    M105[['4', '5', '6', '7', '8', '9']] = M105[['4', '5', '6', '7', '8', '9']].apply(pd.to_numeric, errors='coerce')
-    M105.insert(6, 'NAT_BC_CRED', M105['2'].map(tab_4_3_7))      # incluido a descrição do NAT_BC_CRED (tabela 4.3.7)
+    M100 = _to_numeric(_get_register_group(groups, 'M100', columns=19),
+            ['4', '5', '6', '8', '9', '10', '11', '12', '14', '15'])
+
+    M105 = _to_numeric(_get_register_group(groups, 'M105', columns=14),
+            ['4', '5', '6', '7', '8', '9'])
+    M105.insert(6, 'NAT_BC_CRED', M105['2'].map(_lookup(tab_4_3_7)))      # incluido a descrição do NAT_BC_CRED (tabela 4.3.7)
 
     # Registro M110: Ajustes do Crédito de PIS/Pasep Apurado
-    M110 = (df[df['1'] == 'M110']
-        .iloc[:,0:11]
-        .replace(',', '.', regex=True))
-    M110['3'] = M110['3'].apply(pd.to_numeric, errors='coerce')
-    M110.insert(8, 'tipo_ajuste', M110['4'].map(tab_4_3_8))      # incluido a descrição do COD_AJUSTE (tabela 4.3.8)
-
-    M210 = (df[df['1'] == 'M210']
-            .iloc[:,:20]
-            .replace(',', '.', regex=True))
-    M210[['3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16']] = M210[['3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16']].apply(pd.to_numeric, errors='coerce')
-    M210.insert(6, 'cod_contribuicao', M210['2'].map(tab_4_3_5))      # incluido a descrição do cod_contribuicao (tabela 4.3.5)
+    M110 = _to_numeric(_get_register_group(groups, 'M110', columns=11),
+            ['3'])
+    M110.insert(8, 'tipo_ajuste', M110['4'].map(_lookup(tab_4_3_8)))      # incluido a descrição do COD_AJUSTE (tabela 4.3.8)
+
+    M210 = _to_numeric(_get_register_group(groups, 'M210', columns=20),
+            ['3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16'])
+    M210.insert(6, 'cod_contribuicao', M210['2'].map(_lookup(tab_4_3_5)))      # incluido a descrição do cod_contribuicao (tabela 4.3.5)
 
     # Registro M510: Ajustes do Crédito de COFINS Apurado
-    M510 = (df[df['1'] == 'M510']
-        .iloc[:,0:11]
-        .replace(',', '.', regex=True))
-    M510['3'] = M510['3'].apply(pd.to_numeric, errors='coerce')
-    M510.insert(8, 'tipo_ajuste', M510['4'].map(tab_4_3_8))      # incluido a descrição do COD_AJUSTE (tabela 4.3.8)
-
-    M610 = (df[df['1'] == 'M610']
-            .iloc[:,:20]
-            .replace(',', '.', regex=True))
-    M610[['3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16']] = M610[['3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16']].apply(pd.to_numeric, errors='coerce')
-    M610.insert(6, 'cod_contribuicao', M610['2'].map(tab_4_3_5))      # incluido a descrição do cod_contribuicao (tabela 4.3.5)
-
-    M400 = (df[df['1'] == 'M400']
-            .iloc[:,:9]
-            .replace(',', '.', regex=True))
-    M400['3'] = M400['3'].apply(pd.to_numeric, errors='coerce')
-    M400.insert(6, 'cst_descr', M400['2'].map(cst_pis_cofins))      # incluido a descrição do CST
+    M510 = _to_numeric(_get_register_group(groups, 'M510', columns=11),
+            ['3'])
+    M510.insert(8, 'tipo_ajuste', M510['4'].map(_lookup(tab_4_3_8)))      # incluido a descrição do COD_AJUSTE (tabela 4.3.8)
+
+    M610 = _to_numeric(_get_register_group(groups, 'M610', columns=20),
+            ['3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16'])
+    M610.insert(6, 'cod_contribuicao', M610['2'].map(_lookup(tab_4_3_5)))      # incluido a descrição do cod_contribuicao (tabela 4.3.5)
+
+    M400 = _to_numeric(_get_register_group(groups, 'M400', columns=9),
+            ['3'])
+    M400.insert(6, 'cst_descr', M400['2'].map(_lookup(cst_pis_cofins)))      # incluido a descrição do CST
 
     return M100, M105, M110, M210, M400, M510, M610
 
 
 def Bloco_A(df, reg_0140, reg_0150, reg_0200, cod_uf):
     """Extract and process A-block registers."""
+    groups = df.groupby('1', sort=False, observed=True)
+
     ###  A100
-    A100 = (df[df['1'] == 'A100']
-            .iloc[:,0:25]
-            .replace(',', '.', regex=True))
-    A100[['12', '14', '15', '16', '17', '18', '19', '20', '21']] = A100[['12', '14', '15', '16', '17', '18', '19', '20', '21']].apply(pd.to_numeric, errors='coerce')
+    A100 = _to_numeric(_get_register_group(groups, 'A100', columns=25),
+            ['12', '14', '15', '16', '17', '18', '19', '20', '21'])
 
 
     ###  A170
-    A170 = (df[df['1'] == 'A170']
-            .iloc[:,0:22]
-            .replace(',', '.', regex=True))
-    A170[['5', '6', '10', '11', '12', '14', '15', '16']] = A170[['5', '6', '10', '11', '12', '14', '15', '16']].apply(pd.to_numeric, errors='coerce')
-    A170.insert(4, 'ind_emit', A170['id_pai'].map(A100.set_index('id')['3']))       # incluido IND_EMIT (0-propria; 1-terceiros)
-    A170.insert(4, 'ind_oper', A170['id_pai'].map(A100.set_index('id')['2']))       # incluido IND_OPER (0-entrada; 1-saida)
-    A170.insert(4, 'part_cod', A170['id_pai'].map(A100.set_index('id')['4']))       # incluido COD_PART
-    A170.insert(5, 'part_nome', A170['part_cod'].map(reg_0150.set_index('2')['3']))       # incluido a Descrição do Participante
-    A170.insert(5, 'part_cnpj', A170['part_cod'].map(reg_0150.set_index('2')['5']))       # incluido o CNPJ do Participante
-    A170.insert(4, 'part_uf_cod', A170['part_cod'].map(reg_0150.set_index('2')['8'].astype(str).str[:2]))       # incluido a UF do Participante
-    A170.insert(5, 'part_uf', A170['part_uf_cod'].map(cod_uf))      # incluido a UF do Participante
-    A170.insert(14, 'descr_serv_0200', A170['3'].map(reg_0200.drop_duplicates(subset='2').set_index('2')['3']))    # inserindo a descricao do serviço do 0200
-    A170.drop('part_uf_cod', axis=1, inplace=True)
-    A170.insert(4, 'uf_empresa', A170['cnpj'].map(reg_0140.set_index('4')['5']))       # incluido a UF da Empresa em análise
-
-    A170.insert(28, 'iss', A170['id_pai'].map(A100.set_index('id')['21']))       # incluido ISS
+    A170 = _to_numeric(_get_register_group(groups, 'A170', columns=22),
+            ['5', '6', '10', '11', '12', '14', '15', '16'])
+    # Parent lookup tables are indexed once, with only the looked-up columns, and
+    # shared by the child registers below
+    A100_idx = A100[['id', '2', '3', '4', '21']].set_index('id')
+    reg_0150_idx = reg_0150[['2', '3', '5', '8']].set_index('2')
+    part_cod = A170['id_pai'].map(A100_idx['4'])
+    part_uf = part_cod.map(_participant_uf(reg_0150_idx, cod_uf))
+    A170 = _insert_columns(A170, [
+        (4, 'ind_emit', A170['id_pai'].map(A100_idx['3'])),       # incluido IND_EMIT (0-propria; 1-terceiros)
+        (4, 'ind_oper', A170['id_pai'].map(A100_idx['2'])),       # incluido IND_OPER (0-entrada; 1-saida)
+        (4, 'part_cod', part_cod),       # incluido COD_PART
+        (5, 'part_nome', part_cod.map(reg_0150_idx['3'])),       # incluido a Descrição do Participante
+        (5, 'part_cnpj', part_cod.map(reg_0150_idx['5'])),       # incluido o CNPJ do Participante
+        (4, 'part_uf', part_uf),      # incluido a UF do Participante
+        (13, 'descr_serv_0200', A170['3'].map(reg_0200[['2', '3']].drop_duplicates(subset='2').set_index('2')['3'])),    # inserindo a descricao do serviço do 0200
+        (4, 'uf_empresa', A170['cnpj'].map(reg_0140[['4', '5']].set_index('4')['5'])),       # incluido a UF da Empresa em análise
+        (28, 'iss', A170['id_pai'].map(A100_idx['21'])),       # incluido ISS
+    ])
 
 
     return A100, A170
@@ -163,94 +267,98 @@ def Bloco_C(df, reg_0140, reg_0150, reg_0200, cfop_cod_descr, cod_uf, cst_pis_co
     ###  C100
     C100 = _get_register_group(groups, 'C100', columns=33)
     if not C100.empty:
-        C100 = _replace_comma_decimal(C100, ['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29'])
-        C100[['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29']] = C100[['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29']].apply(pd.to_numeric, errors='coerce')
+        C100 = _to_numeric(C100, ['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29'])
+
+    C100_idx = C100[['id', '2', '3', '4', '5', '9']].set_index('id') if not C100.empty else None
 
     ###  C170
     C170 = _get_register_group(groups, 'C170', columns=41)
     if not C170.empty:
-        C170 = _replace_comma_decimal(C170, ['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36'])
-        C170[['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36']] = C170[['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36']].apply(pd.to_numeric, errors='coerce')
-        C170.insert(15, 'cfop_descr', C170['11'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+        C170 = _to_numeric(C170, ['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36'])
+        new_columns = [(15, 'cfop_descr', C170['11'].map(_lookup(cfop_cod_descr)))]     # incluido a descrição do CFOP
         if not reg_0200.empty:
-            C170.insert(7, 'ncm', C170['3'].map(reg_0200.set_index('2')['8']))       # incluido a NCM
-            C170.insert(7, 'item_descr', C170['3'].map(reg_0200.set_index('2')['3']))       # incluido a DESCR_ITEM
+            reg_0200_idx = reg_0200[['2', '3', '8']].set_index('2')
+            new_columns += [
+                (7, 'ncm', C170['3'].map(reg_0200_idx['8'])),       # incluido a NCM
+                (7, 'item_descr', C170['3'].map(reg_0200_idx['3'])),       # incluido a DESCR_ITEM
+            ]
         else:
-            C170.insert(7, 'ncm', None)
-            C170.insert(7, 'item_descr', None)
+            new_columns += [(7, 'ncm', None), (7, 'item_descr', None)]
         # Always add these columns - downstream code expects them
         if not C100.empty:
-            C100_idx = C100.set_index('id')
-            C170.insert(4, 'mod_nf', C170['id_pai'].map(C100_idx['5']))       # incluido o Modelo da NF
-            C170.insert(4, 'ind_emit', C170['id_pai'].map(C100_idx['3']))       # incluido o IND_EMIT (0-propria; 1-terceiros)
-            C170.insert(4, 'ind_oper', C170['id_pai'].map(C100_idx['2']))       # incluido o IND_OPER (0-entrada; 1-saida)
-            C170.insert(4, 'part_cod', C170['id_pai'].map(C100_idx['4']))       # incluido COD_PART
-            C170.insert(13, 'chave_nf', C170['id_pai'].map(C100_idx['9']))       # incluido a CHAVE_NF
+            part_cod = C170['id_pai'].map(C100_idx['4'])
+            new_columns += [
+                (4, 'mod_nf', C170['id_pai'].map(C100_idx['5'])),       # incluido o Modelo da NF
+                (4, 'ind_emit', C170['id_pai'].map(C100_idx['3'])),       # incluido o IND_EMIT (0-propria; 1-terceiros)
+                (4, 'ind_oper', C170['id_pai'].map(C100_idx['2'])),       # incluido o IND_OPER (0-entrada; 1-saida)
+                (4, 'part_cod', part_cod),       # incluido COD_PART
+                (13, 'chave_nf', C170['id_pai'].map(C100_idx['9'])),       # incluido a CHAVE_NF
+            ]
         else:
-            C170.insert(4, 'mod_nf', None)
-            C170.insert(4, 'ind_emit', None)
-            C170.insert(4, 'ind_oper', None)
-            C170.insert(4, 'part_cod', None)
-            C170.insert(13, 'chave_nf', None)
+            part_cod = pd.Series(None, index=C170.index, dtype=object)
+            new_columns += [(4, 'mod_nf', None), (4, 'ind_emit', None), (4, 'ind_oper', None),
+                            (4, 'part_cod', None), (13, 'chave_nf', None)]
         if not reg_0150.empty:
-            reg_0150_idx = reg_0150.set_index('2')
-            C170.insert(5, 'part_nome', C170['part_cod'].map(reg_0150_idx['3']))       # incluido a Descrição do Participante
-            C170.insert(5, 'part_cnpj', C170['part_cod'].map(reg_0150_idx['5']))       # incluido o CNPJ do Participante
-            C170.insert(5, 'part_uf_cod', C170['part_cod'].map(reg_0150_idx['8'].astype(str).str[:2]))       # incluido a UF do Participante
-            C170.insert(5, 'part_ie', C170['part_cod'].map(reg_0150_idx['7']))       # incluido a IE do Participante
+            reg_0150_idx = reg_0150[['2', '3', '5', '7', '8']].set_index('2')
+            part_uf = part_cod.map(_participant_uf(reg_0150_idx, cod_uf))
+            new_columns += [
+                (5, 'part_nome', part_cod.map(reg_0150_idx['3'])),       # incluido a Descrição do Participante
+                (5, 'part_cnpj', part_cod.map(reg_0150_idx['5'])),       # incluido o CNPJ do Participante
+                (5, 'part_ie', part_cod.map(reg_0150_idx['7'])),       # incluido a IE do Participante
+            ]
         else:
-            C170.insert(5, 'part_nome', None)
-            C170.insert(5, 'part_cnpj', None)
-            C170.insert(5, 'part_uf_cod', None)
-            C170.insert(5, 'part_ie', None)
-        C170.insert(6, 'part_uf', C170['part_uf_cod'].map(cod_uf))
-        C170.drop('part_uf_cod', axis=1, inplace=True)
+            part_uf = pd.Series(None, index=C170.index, dtype=object)
+            new_columns += [(5, 'part_nome', None), (5, 'part_cnpj', None), (5, 'part_ie', None)]
+        new_columns.append((6, 'part_uf', part_uf))      # incluido a UF do Participante
         if not reg_0140.empty:
-            C170.insert(4, 'uf_empresa', C170['cnpj'].map(reg_0140.set_index('4')['5']))       # incluido a UF da Empresa em análise
+            new_columns.append((4, 'uf_empresa', C170['cnpj'].map(reg_0140[['4', '5']].set_index('4')['5'])))       # incluido a UF da Empresa em análise
         else:
-            C170.insert(4, 'uf_empresa', None)
+            new_columns.append((4, 'uf_empresa', None))
+        C170 = _insert_columns(C170, new_columns)
 
     ###  C175
     C175 = _get_register_group(groups, 'C175', columns=22)
     if not C175.empty:
-        C175 = _replace_comma_decimal(C175, ['3', '4', '6', '7', '8', '9', '10', '12', '13', '14', '15', '16'])
-        C175[['3', '4', '6', '7', '8', '9', '10', '12', '13', '14', '15', '16']] = C175[['3', '4', '6', '7', '8', '9', '10', '12', '13', '14', '15', '16']].apply(pd.to_numeric, errors='coerce')
-        C175.insert(6, 'cfop_descr', C175['2'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+        C175 = _to_numeric(C175, ['3', '4', '6', '7', '8', '9', '10', '12', '13', '14', '15', '16'])
+        new_columns = [(6, 'cfop_descr', C175['2'].map(_lookup(cfop_cod_descr)))]     # incluido a descrição do CFOP
         # Always add these columns (with NaN if parent is empty) - downstream code expects them
         if not C100.empty:
-            C100_idx = C100.set_index('id')
-            C175.insert(4, 'mod_nf', C175['id_pai'].map(C100_idx['5']))       # incluido o Modelo da NF
-            C175.insert(4, 'ind_emit', C175['id_pai'].map(C100_idx['3']))       # incluido o IND_EMIT (0-propria; 1-terceiros)
-            C175.insert(4, 'ind_oper', C175['id_pai'].map(C100_idx['2']))       # incluido o IND_OPER (0-entrada; 1-saida)
+            new_columns += [
+                (4, 'mod_nf', C175['id_pai'].map(C100_idx['5'])),       # incluido o Modelo da NF
+                (4, 'ind_emit', C175['id_pai'].map(C100_idx['3'])),       # incluido o IND_EMIT (0-propria; 1-terceiros)
+                (4, 'ind_oper', C175['id_pai'].map(C100_idx['2'])),       # incluido o IND_OPER (0-entrada; 1-saida)
+            ]
         else:
             # Add columns with NaN if C100 is empty
-            C175.insert(4, 'mod_nf', None)
-            C175.insert(4, 'ind_emit', None)
-            C175.insert(4, 'ind_oper', None)
+            new_columns += [(4, 'mod_nf', None), (4, 'ind_emit', None), (4, 'ind_oper', None)]
         if not reg_0140.empty:
-            reg_0140_idx = reg_0140.set_index('4')
-            C175.insert(4, 'uf_empresa', C175['cnpj'].map(reg_0140_idx['5']))       # incluido a UF da Empresa em análise
-            C175.insert(4, 'cidade_estab', C175['cnpj'].map(reg_0140_idx['7']))       # incluido a cidade do estabelecimento
+            reg_0140_idx = reg_0140[['4', '5', '7']].set_index('4')
+            new_columns += [
+                (4, 'uf_empresa', C175['cnpj'].map(reg_0140_idx['5'])),       # incluido a UF da Empresa em análise
+                (4, 'cidade_estab', C175['cnpj'].map(reg_0140_idx['7'])),       # incluido a cidade do estabelecimento
+            ]
         else:
             # Add columns with NaN if reg_0140 is empty
-            C175.insert(4, 'uf_empresa', None)
-            C175.insert(4, 'cidade_estab', None)
+            new_columns += [(4, 'uf_empresa', None), (4, 'cidade_estab', None)]
+        C175 = _insert_columns(C175, new_columns)
 
     ### C181
     C181 = _get_register_group(groups, 'C181', columns=15)
     if not C181.empty:
-        C181 = _replace_comma_decimal(C181, ['4', '5', '6','10'])
-        C181[[ '4', '5', '6','10']] = C181[[ '4', '5', '6','10']].apply(pd.to_numeric, errors='coerce')
-        C181.insert(6, 'cst_descr', C181['2'].map(cst_pis_cofins))      # incluido a descrição do CST
-        C181.insert(8, 'cfop_descr', C181['3'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+        C181 = _to_numeric(C181, ['4', '5', '6','10'])
+        C181 = _insert_columns(C181, [
+            (6, 'cst_descr', C181['2'].map(_lookup(cst_pis_cofins))),      # incluido a descrição do CST
+            (8, 'cfop_descr', C181['3'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+        ])
 
     ### C185
     C185 = _get_register_group(groups, 'C185', columns=15)
     if not C185.empty:
-        C185 = _replace_comma_decimal(C185, ['4', '5', '6','10'])
-        C185[[ '4', '5', '6','10']] = C185[[ '4', '5', '6','10']].apply(pd.to_numeric, errors='coerce')
-        C185.insert(6, 'cst_descr', C185['2'].map(cst_pis_cofins))      # incluido a descrição do CST
-        C185.insert(8, 'cfop_descr', C185['3'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+        C185 = _to_numeric(C185, ['4', '5', '6','10'])
+        C185 = _insert_columns(C185, [
+            (6, 'cst_descr', C185['2'].map(_lookup(cst_pis_cofins))),      # incluido a descrição do CST
+            (8, 'cfop_descr', C185['3'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+        ])
 
     return C100, C170, C175, C181, C185
 
@@ -259,15 +367,15 @@ def Bloco_C(df, reg_0140, reg_0150, reg_0200, cfop_cod_descr, cod_uf, cst_pis_co
 
 def Bloco_0_Sped_Fiscal(df):
     """Extract SPED Fiscal register blocks 0150 and 0200."""
+    groups = df.groupby('1', sort=False, observed=True)
+
     ### registro 0150
-    REG_0150_SF = (df[df['1'] == '0150']
-            .iloc[:,0:19]
+    REG_0150_SF = (_get_register_group(groups, '0150', columns=19)
             .sort_values(by='5', ascending=False))
     REG_0150_SF = REG_0150_SF.drop_duplicates(subset='2')
 
     ### registro 0200
-    REG_0200_SF = (df[df['1'] == '0200']
-            .iloc[:,0:19]
+    REG_0200_SF = (_get_register_group(groups, '0200', columns=19)
             .sort_values(by='8', ascending=False))
     REG_0200_SF = REG_0200_SF.drop_duplicates(subset='2')
 
@@ -276,101 +384,65 @@ def Bloco_0_Sped_Fiscal(df):
 
 def Bloco_C_Sped_Fiscal(df, REG_0150_SF, REG_0200_SF, cfop_cod_descr, cod_uf, cst_icms, sped_fiscal_tab_5_3_AM):
     """Extract and process C-block registers from SPED Fiscal."""
+    groups = df.groupby('1', sort=False, observed=True)
+
     # C100
-    C100_SF = (df[df['1'] == 'C100']
-            .iloc[:,0:35]
-            .replace(',', '.', regex=True))
-    C100_SF[['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29']] = C100_SF[['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29']].apply(pd.to_numeric, errors='coerce')
+    C100_SF = _to_numeric(_get_register_group(groups, 'C100', columns=35),
+            ['12', '14', '15', '16', '18', '19', '20', '21','22', '23', '24', '26', '27', '28', '29'])
 
 
     # C170
-    C170_SF = (df[df['1'] == 'C170']
-            .iloc[:,0:44]
-            .replace(',', '.', regex=True))
-    C170_SF[['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36', '38']] = C170_SF[['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36', '38']].apply(pd.to_numeric, errors='coerce')
-    C170_SF.insert(17, 'cfop_descr', C170_SF['11'].map(cfop_cod_descr))     # incluido a descrição do CFOP
-    C170_SF.insert(8, 'ncm', C170_SF['3'].map(REG_0200_SF.set_index('2')['8']))       # incluido a NCM
-    C170_SF.insert(10, 'item_descr', C170_SF['3'].map(REG_0200_SF.set_index('2')['3']))       # incluido a DESCR_ITEM
-    C170_SF.insert(6, 'mod_nf', C170_SF['id_pai'].map(C100_SF.set_index('id')['5']))       # incluido o Modelo da NF
-    C170_SF.insert(6, 'ind_emit', C170_SF['id_pai'].map(C100_SF.set_index('id')['3']))       # incluido o IND_EMIT (0-propria; 1-terceiros)
-    C170_SF.insert(6, 'ind_oper', C170_SF['id_pai'].map(C100_SF.set_index('id')['2']))       # incluido o IND_OPER (0-entrada; 1-saida)
-    C170_SF.insert(6, 'part_cod', C170_SF['id_pai'].map(C100_SF.set_index('id')['4']))       # incluido COD_PART
-    C170_SF.insert(7, 'part_nome', C170_SF['part_cod'].map(REG_0150_SF.set_index('2')['3']))       # incluido a Descrição do Participante
-    C170_SF.insert(7, 'part_cnpj', C170_SF['part_cod'].map(REG_0150_SF.set_index('2')['5']))       # incluido o CNPJ do Participante
-    C170_SF.insert(7, 'part_uf_cod', C170_SF['part_cod'].map(REG_0150_SF.set_index('2')['8'].astype(str).str[:2]))       # incluido a UF do Participante
-    C170_SF.insert(7, 'part_ie', C170_SF['part_cod'].map(REG_0150_SF.set_index('2')['7']))       # incluido a IE do Participante
-    C170_SF.insert(7, 'part_uf', C170_SF['part_uf_cod'].map(cod_uf))
-    C170_SF.drop('part_uf_cod', axis=1, inplace=True)
+    C170_SF = _to_numeric(_get_register_group(groups, 'C170', columns=44),
+            ['5', '7', '8', '13', '14', '15', '16', '17', '18', '22', '23', '24', '26', '27', '28', '29', '30', '32', '33', '34', '35', '36', '38'])
+    C100_SF_idx = C100_SF[['id', '2', '3', '4', '5', '9']].set_index('id')
+    REG_0150_SF_idx = REG_0150_SF[['2', '3', '5', '7', '8']].set_index('2')
+    REG_0200_SF_idx = REG_0200_SF[['2', '3', '8']].set_index('2')
+    part_cod = C170_SF['id_pai'].map(C100_SF_idx['4'])
+    part_uf = part_cod.map(_participant_uf(REG_0150_SF_idx, cod_uf))
+    C170_SF = _insert_columns(C170_SF, [
+        (17, 'cfop_descr', C170_SF['11'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+        (8, 'ncm', C170_SF['3'].map(REG_0200_SF_idx['8'])),       # incluido a NCM
+        (10, 'item_descr', C170_SF['3'].map(REG_0200_SF_idx['3'])),       # incluido a DESCR_ITEM
+        (6, 'mod_nf', C170_SF['id_pai'].map(C100_SF_idx['5'])),       # incluido o Modelo da NF
+        (6, 'ind_emit', C170_SF['id_pai'].map(C100_SF_idx['3'])),       # incluido o IND_EMIT (0-propria; 1-terceiros)
+        (6, 'ind_oper', C170_SF['id_pai'].map(C100_SF_idx['2'])),       # incluido o IND_OPER (0-entrada; 1-saida)
+        (6, 'part_cod', part_cod),       # incluido COD_PART
+        (7, 'part_nome', part_cod.map(REG_0150_SF_idx['3'])),       # incluido a Descrição do Participante
+        (7, 'part_cnpj', part_cod.map(REG_0150_SF_idx['5'])),       # incluido o CNPJ do Participante
+        (7, 'part_ie', part_cod.map(REG_0150_SF_idx['7'])),       # incluido a IE do Participante
+        (7, 'part_uf', part_uf),      # incluido a UF do Participante
+    ])
     # update column names
-    C170_SF = C170_SF.rename(columns={
-        '1': 'REG',
-        '2': 'NUM_ITEM',
-        '3': 'COD_ITEM',
-        '4': 'DESCR_COMPL',
-        '5': 'QTD',
-        '6': 'UNID',
-        '7': 'VL_ITEM',
-        '8': 'VL_DESC',
-        '9': 'IND_MOV',
-        '10': 'CST_ICMS',
-        '11': 'CFOP',
-        '12': 'COD_NAT',
-        '13': 'VL_BC_ICMS',
-        '14': 'ALIQ_ICMS',
-        '15': 'VL_ICMS',
-        '16': 'VL_BC_ICMS_ST',
-        '17': 'ALIQ_ST',
-        '18': 'VL_ICMS_ST',
-        '19': 'IND_APUR',
-        '20': 'CST_IPI',
-        '21': 'COD_ENQ',
-        '22': 'VL_BC_IPI',
-        '23': 'ALIQ_IPI',
-        '24': 'VL_IPI',
-        '25': 'CST_PIS',
-        '26': 'VL_BC_PIS',
-        '27': 'ALIQ_PIS',
-        '28': 'QUANT_BC_PIS',
-        '29': 'ALIQ_PIS_QUANT',
-        '30': 'VL_PIS',
-        '31': 'CST_COFINS',
-        '32': 'VL_BC_COFINS',
-        '33': 'ALIQ_COFINS',
-        '34': 'QUANT_BC_COFINS',
-        '35': 'ALIQ_COFINS_QUANT',
-        '36': 'VL_COFINS',
-        '37': 'COD_CTA',
-        '38': 'VL_ABAT_NT'
-    })
+    C170_SF = C170_SF.rename(columns=config.C170_COLUMN_NAMES, copy=False)
 
     # C190
-    C190_SF = (df[df['1'] == 'C190']
-            .iloc[:,0:18]
-            .replace(',', '.', regex=True))
-    C190_SF[['4', '5', '6', '7', '8', '9', '10', '11']] = C190_SF[['4', '5', '6', '7', '8', '9', '10', '11']].apply(pd.to_numeric, errors='coerce')
-    C190_SF.insert(8, 'cst_icms_descr', C190_SF['2'].map(cst_icms))     # incluido a descrição do CST ICMS
-    C190_SF.insert(10, 'cfop_descr', C190_SF['3'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+    C190_SF = _to_numeric(_get_register_group(groups, 'C190', columns=18),
+            ['4', '5', '6', '7', '8', '9', '10', '11'])
+    C190_SF = _insert_columns(C190_SF, [
+        (8, 'cst_icms_descr', C190_SF['2'].map(_lookup(cst_icms))),     # incluido a descrição do CST ICMS
+        (10, 'cfop_descr', C190_SF['3'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+    ])
 
 
     # C197
-    C197_SF = (df[df['1'] == 'C197']
-            .iloc[:,0:14]
-            .replace(',', '.', regex=True))
-    C197_SF[['5', '6', '7', '8']] = C197_SF[['5', '6', '7', '8']].apply(pd.to_numeric, errors='coerce')
-    C197_SF.insert(8, 'cod_aj_doc', C197_SF['2'].map(sped_fiscal_tab_5_3_AM))     # incluido a descrição do cod_aj_doc da NF
-    C197_SF.insert(11, 'ncm', C197_SF['4'].map(REG_0200_SF.set_index('2')['8']))       # incluido a NCM
-    C197_SF.insert(12, 'item_descr', C197_SF['4'].map(REG_0200_SF.set_index('2')['3']))       # incluido a DESCR_ITEM
-    C197_SF.insert(6, 'ind_oper', C197_SF['id_pai'].map(C100_SF.set_index('id')['2']))       # incluido o IND_OPER (0-entrada; 1-saida)
-    C197_SF.insert(7, 'chave_nf', C197_SF['id_pai'].map(C100_SF.set_index('id')['9']))       # incluido a CHAVE_NF
+    C197_SF = _to_numeric(_get_register_group(groups, 'C197', columns=14),
+            ['5', '6', '7', '8'])
+    C197_SF = _insert_columns(C197_SF, [
+        (8, 'cod_aj_doc', C197_SF['2'].map(_lookup(sped_fiscal_tab_5_3_AM))),     # incluido a descrição do cod_aj_doc da NF
+        (11, 'ncm', C197_SF['4'].map(REG_0200_SF_idx['8'])),       # incluido a NCM
+        (12, 'item_descr', C197_SF['4'].map(REG_0200_SF_idx['3'])),       # incluido a DESCR_ITEM
+        (6, 'ind_oper', C197_SF['id_pai'].map(C100_SF_idx['2'])),       # incluido o IND_OPER (0-entrada; 1-saida)
+        (7, 'chave_nf', C197_SF['id_pai'].map(C100_SF_idx['9'])),       # incluido a CHAVE_NF
+    ])
 
 
     # C590
-    C590_SF = (df[df['1'] == 'C590']
-            .iloc[:,0:17]
-            .replace(',', '.', regex=True))
-    C590_SF[['4', '5', '6', '7', '8', '9', '10']] = C590_SF[['4', '5', '6', '7', '8', '9', '10']].apply(pd.to_numeric, errors='coerce')
-    C590_SF.insert(8, 'cst_icms_descr', C590_SF['2'].map(cst_icms))     # incluido a descrição do CST ICMS
-    C590_SF.insert(10, 'cfop_descr', C590_SF['3'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+    C590_SF = _to_numeric(_get_register_group(groups, 'C590', columns=17),
+            ['4', '5', '6', '7', '8', '9', '10'])
+    C590_SF = _insert_columns(C590_SF, [
+        (8, 'cst_icms_descr', C590_SF['2'].map(_lookup(cst_icms))),     # incluido a descrição do CST ICMS
+        (10, 'cfop_descr', C590_SF['3'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+    ])
 
 
     return C100_SF, C170_SF, C190_SF, C197_SF, C590_SF
@@ -378,92 +450,86 @@ def Bloco_C_Sped_Fiscal(df, REG_0150_SF, REG_0200_SF, cfop_cod_descr, cod_uf, cs
 
 def Bloco_D_Sped_Fiscal(df, cst_icms, cfop_cod_descr):
     """Extract and process D-block registers from SPED Fiscal."""
+    groups = df.groupby('1', sort=False, observed=True)
+
     # D190 - CTe Frete
-    D190_SF = (df[df['1'] == 'D190']
-            .iloc[:,0:15]
-            .replace(',', '.', regex=True))
-    D190_SF[['4', '5', '6', '7', '8']] = D190_SF[['4', '5', '6', '7', '8']].apply(pd.to_numeric, errors='coerce')
-    D190_SF.insert(8, 'cst_icms_descr', D190_SF['2'].map(cst_icms))     # incluido a descrição do CST ICMS
-    D190_SF.insert(10, 'cfop_descr', D190_SF['3'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+    D190_SF = _to_numeric(_get_register_group(groups, 'D190', columns=15),
+            ['4', '5', '6', '7', '8'])
+    D190_SF = _insert_columns(D190_SF, [
+        (8, 'cst_icms_descr', D190_SF['2'].map(_lookup(cst_icms))),     # incluido a descrição do CST ICMS
+        (10, 'cfop_descr', D190_SF['3'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+    ])
 
     # D590 - NF Serviço Comunicação
-    D590_SF = (df[df['1'] == 'D590']
-            .iloc[:,0:17]
-            .replace(',', '.', regex=True))
-    D590_SF[['4', '5', '6', '7', '8', '9', '10']] = D590_SF[['4', '5', '6', '7', '8', '9', '10']].apply(pd.to_numeric, errors='coerce')
-    D590_SF.insert(8, 'cst_icms_descr', D590_SF['2'].map(cst_icms))     # incluido a descrição do CST ICMS
-    D590_SF.insert(10, 'cfop_descr', D590_SF['3'].map(cfop_cod_descr))     # incluido a descrição do CFOP
+    D590_SF = _to_numeric(_get_register_group(groups, 'D590', columns=17),
+            ['4', '5', '6', '7', '8', '9', '10'])
+    D590_SF = _insert_columns(D590_SF, [
+        (8, 'cst_icms_descr', D590_SF['2'].map(_lookup(cst_icms))),     # incluido a descrição do CST ICMS
+        (10, 'cfop_descr', D590_SF['3'].map(_lookup(cfop_cod_descr))),     # incluido a descrição do CFOP
+    ])
 
     return D190_SF, D590_SF
 
 
 def Bloco_E_Sped_Fiscal(df, sped_fiscal_tab_5_1_1, sped_fiscal_tab_5_4, sped_fiscal_cod_receita_AM):
     """Extract and process E-block registers from SPED Fiscal."""
+    groups = df.groupby('1', sort=False, observed=True)
+
     # E110 - Resumo Apuração Geral
-    E110_SF = (df[df['1'] == 'E110']
-            .iloc[:,0:21]
-            .replace(',', '.', regex=True))
-    E110_SF[['2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12' ,'13', '14', '15']] = E110_SF[['2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12' ,'13', '14', '15']].apply(pd.to_numeric, errors='coerce')
+    E110_SF = _to_numeric(_get_register_group(groups, 'E110', columns=21),
+            ['2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12' ,'13', '14', '15'])
 
 
     # E111 - AJUSTE/BENEFÍCIO/INCENTIVO DA APURAÇÃO DO ICMS
-    E111_SF = (df[df['1'] == 'E111']
-            .iloc[:,0:10]
-            .replace(',', '.', regex=True))
-    E111_SF['4'] = E111_SF['4'].apply(pd.to_numeric, errors='coerce')
-    E111_SF.insert(8, 'cod_aj_apur', E111_SF['2'].map(sped_fiscal_tab_5_1_1))     # incluido a descrição do cod_aj_apur
+    E111_SF = _to_numeric(_get_register_group(groups, 'E111', columns=10),
+            ['4'])
+    E111_SF.insert(8, 'cod_aj_apur', E111_SF['2'].map(_lookup(sped_fiscal_tab_5_1_1)))     # incluido a descrição do cod_aj_apur
 
 
     # E116 - OBRIGAÇÕES DO ICMS RECOLHIDO OU A RECOLHER – OPERAÇÕES PRÓPRIAS
-    E116_SF = (df[df['1'] == 'E116']
-            .iloc[:,0:16]
-            .replace(',', '.', regex=True))
-    E116_SF['4'] = E116_SF['4'].apply(pd.to_numeric, errors='coerce')
-    E116_SF.insert(8, 'cod_obg_recolher', E116_SF['2'].map(sped_fiscal_tab_5_4))     # incluido a descrição do codigo da obrigação a recolher
-    E116_SF.insert(12, 'cod_receita', E116_SF['5'].map(sped_fiscal_cod_receita_AM))     # incluido a descrição do codigo da receita
+    E116_SF = _to_numeric(_get_register_group(groups, 'E116', columns=16),
+            ['4'])
+    E116_SF = _insert_columns(E116_SF, [
+        (8, 'cod_obg_recolher', E116_SF['2'].map(_lookup(sped_fiscal_tab_5_4))),     # incluido a descrição do codigo da obrigação a recolher
+        (12, 'cod_receita', E116_SF['5'].map(_lookup(sped_fiscal_cod_receita_AM))),     # incluido a descrição do codigo da receita
+    ])
 
     return E110_SF, E111_SF, E116_SF
 
 
 def Bloco_1_Sped_Fiscal(df, sped_fiscal_tab_ind_apur_icms_AM, sped_fiscal_tab_5_1_1, sped_fiscal_tab_5_2, sped_fiscal_tab_5_4, sped_fiscal_cod_receita_AM):
     """Extract and process 1-block registers from SPED Fiscal."""
+    groups = df.groupby('1', sort=False, observed=True)
+
     # 1900 - INDICADOR DE SUB-APURAÇÃO DO ICMS
-    REG_1900_SF = (df[df['1'] == '1900']
-            .iloc[:,0:9]
-            .replace(',', '.', regex=True))
-    REG_1900_SF.insert(8, 'ind_apur_icms', REG_1900_SF['2'].map(sped_fiscal_tab_ind_apur_icms_AM))     # incluido a descrição do ind_apur_icms
+    REG_1900_SF = _get_register_group(groups, '1900', columns=9)
+    REG_1900_SF.insert(8, 'ind_apur_icms', REG_1900_SF['2'].map(_lookup(sped_fiscal_tab_ind_apur_icms_AM)))     # incluido a descrição do ind_apur_icms
 
 
     # 1920 - SUB-APURAÇÃO DO ICMS
-    REG_1920_SF = (df[df['1'] == '1920']
-            .iloc[:,0:19]
-            .replace(',', '.', regex=True))
-    REG_1920_SF[['2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12' ,'13']] = REG_1920_SF[['2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12' ,'13']].apply(pd.to_numeric, errors='coerce')
+    REG_1920_SF = _to_numeric(_get_register_group(groups, '1920', columns=19),
+            ['2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12' ,'13'])
 
 
     # 1921 - AJUSTE/BENEFÍCIO/INCENTIVO DA SUB-APURAÇÃO DO ICMS
-    REG_1921_SF = (df[df['1'] == '1921']
-            .iloc[:,0:10]
-            .replace(',', '.', regex=True))
-    REG_1921_SF['4'] = REG_1921_SF['4'].apply(pd.to_numeric, errors='coerce')
-    REG_1921_SF.insert(8, 'cod_aj_apur', REG_1921_SF['2'].map(sped_fiscal_tab_5_1_1))     # incluido a descrição do cod_aj_apur
+    REG_1921_SF = _to_numeric(_get_register_group(groups, '1921', columns=10),
+            ['4'])
+    REG_1921_SF.insert(8, 'cod_aj_apur', REG_1921_SF['2'].map(_lookup(sped_fiscal_tab_5_1_1)))     # incluido a descrição do cod_aj_apur
 
 
     # 1925 - INFORMAÇÕES ADICIONAIS DA SUB-APURAÇÃO – VALORES DECLARATÓRIOS
-    REG_1925_SF = (df[df['1'] == '1925']
-            .iloc[:,0:10]
-            .replace(',', '.', regex=True))
-    REG_1925_SF['3'] = REG_1925_SF['3'].apply(pd.to_numeric, errors='coerce')
-    REG_1925_SF.insert(8, 'cod_info_adic', REG_1925_SF['2'].map(sped_fiscal_tab_5_2))     # incluido a descrição do cod_info_adic
+    REG_1925_SF = _to_numeric(_get_register_group(groups, '1925', columns=10),
+            ['3'])
+    REG_1925_SF.insert(8, 'cod_info_adic', REG_1925_SF['2'].map(_lookup(sped_fiscal_tab_5_2)))     # incluido a descrição do cod_info_adic
 
 
     # 1926 - OBRIGAÇÕES DO ICMS A RECOLHER – OPERAÇÕES REFERENTES À SUB-APURAÇÃO
-    REG_1926_SF = (df[df['1'] == '1926']
-            .iloc[:,0:16]
-            .replace(',', '.', regex=True))
-    REG_1926_SF['3'] = REG_1926_SF['3'].apply(pd.to_numeric, errors='coerce')
-    REG_1926_SF.insert(8, 'cod_obg_recolher', REG_1926_SF['2'].map(sped_fiscal_tab_5_4))     # incluido a descrição do cod_info_adic
-    REG_1926_SF.insert(12, 'cod_receita', REG_1926_SF['5'].map(sped_fiscal_cod_receita_AM))     # incluido a descrição do codigo da receita
+    REG_1926_SF = _to_numeric(_get_register_group(groups, '1926', columns=16),
+            ['3'])
+    REG_1926_SF = _insert_columns(REG_1926_SF, [
+        (8, 'cod_obg_recolher', REG_1926_SF['2'].map(_lookup(sped_fiscal_tab_5_4))),     # incluido a descrição do cod_info_adic
+        (12, 'cod_receita', REG_1926_SF['5'].map(_lookup(sped_fiscal_cod_receita_AM))),     # incluido a descrição do codigo da receita
+    ])
 
 
 
@@ -474,31 +540,36 @@ def Bloco_1_Sped_Fiscal(df, sped_fiscal_tab_ind_apur_icms_AM, sped_fiscal_tab_5_
 
 def Bloco_I_ECD(df, PLANO_CONTAS_REF):
     """Extract and process I-block registers from ECD."""
-    REG_I050_ECD = (df[df['1'] == 'I050'].iloc[:,0:12])
-    REG_I051_ECD = (df[df['1'] == 'I051'].iloc[:,0:7])
-    REG_I150_ECD = (df[df['1'] == 'I150'].iloc[:,0:7])
-    REG_I155_ECD = (df[df['1'] == 'I155']
-                    .iloc[:,0:13]
-                    .replace(',', '.', regex=True))
-    REG_I155_ECD[['4', '6', '7', '8']] = REG_I155_ECD[['4', '6', '7', '8']].apply(pd.to_numeric, errors='coerce')
+    groups = df.groupby('1', sort=False, observed=True)
 
-    REG_I200_ECD = (df[df['1'] == 'I200'].iloc[:,0:10])
-    REG_I250_ECD = (df[df['1'] == 'I250'].iloc[:,0:13])
+    REG_I050_ECD = _get_register_group(groups, 'I050', columns=12)
+    REG_I051_ECD = _get_register_group(groups, 'I051', columns=7)
+    REG_I150_ECD = _get_register_group(groups, 'I150', columns=7)
+    REG_I155_ECD = _to_numeric(_get_register_group(groups, 'I155', columns=13),
+            ['4', '6', '7', '8'])
 
-    REG_I050_ECD.insert(10, 'CTA_REF', REG_I050_ECD['id'].map(REG_I051_ECD.set_index('id_pai')['3']))       # incluido COD_CTA_REF
-    REG_I050_ECD.insert(11, 'CTA_REF_DESCR', REG_I050_ECD['CTA_REF'].map(PLANO_CONTAS_REF))     # incluido descrição da COD_CTA_REF
+    REG_I200_ECD = _get_register_group(groups, 'I200', columns=10)
+    REG_I250_ECD = _get_register_group(groups, 'I250', columns=13)
 
-    REG_I155_ECD.insert(4, 'periodo_inicio', REG_I155_ECD['id_pai'].map(REG_I150_ECD.set_index('id')['2']))       # incluido periodo_inicio
-    REG_I155_ECD.insert(5, 'periodo_final', REG_I155_ECD['id_pai'].map(REG_I150_ECD.set_index('id')['3']))       # incluido periodo_final
+    cta_ref = REG_I050_ECD['id'].map(REG_I051_ECD[['id_pai', '3']].set_index('id_pai')['3'])
+    REG_I050_ECD = _insert_columns(REG_I050_ECD, [
+        (10, 'CTA_REF', cta_ref),       # incluido COD_CTA_REF
+        (11, 'CTA_REF_DESCR', cta_ref.map(_lookup(PLANO_CONTAS_REF))),     # incluido descrição da COD_CTA_REF
+    ])
 
     # For multiple monthly ECD files: deduplicate I050 by COD_CTA (column '6') before mapping
     # Chart of Accounts should be consistent across periods, so we keep the first occurrence
     REG_I050_unique = REG_I050_ECD.drop_duplicates(subset=['6'], keep='first')
-    REG_I050_mapping = REG_I050_unique.set_index('6')
-
-    REG_I155_ECD.insert(8, 'CTA_DESCR', REG_I155_ECD['2'].map(REG_I050_mapping['8']))       # incluido a descrição da conta contabil
-    REG_I155_ECD.insert(9, 'CTA_REF', REG_I155_ECD['2'].map(REG_I050_mapping['CTA_REF']))       # incluido COD_CTA_REF
-    REG_I155_ECD.insert(10, 'CTA_REF_DESCR', REG_I155_ECD['2'].map(REG_I050_mapping['CTA_REF_DESCR']))       # incluido descrição da COD_CTA_REF
+    REG_I050_mapping = REG_I050_unique[['6', '8', 'CTA_REF', 'CTA_REF_DESCR']].set_index('6')
+
+    REG_I150_idx = REG_I150_ECD[['id', '2', '3']].set_index('id')
+    REG_I155_ECD = _insert_columns(REG_I155_ECD, [
+        (4, 'periodo_inicio', REG_I155_ECD['id_pai'].map(REG_I150_idx['2'])),       # incluido periodo_inicio
+        (5, 'periodo_final', REG_I155_ECD['id_pai'].map(REG_I150_idx['3'])),       # incluido periodo_final
+        (8, 'CTA_DESCR', REG_I155_ECD['2'].map(REG_I050_mapping['8'])),       # incluido a descrição da conta contabil
+        (9, 'CTA_REF', REG_I155_ECD['2'].map(REG_I050_mapping['CTA_REF'])),       # incluido COD_CTA_REF
+        (10, 'CTA_REF_DESCR', REG_I155_ECD['2'].map(REG_I050_mapping['CTA_REF_DESCR'])),       # incluido descrição da COD_CTA_REF
+    ])
     REG_I155_ECD = REG_I155_ECD.rename(columns={
         '1': 'REG',
         '2': 'COD_CTA',
@@ -514,15 +585,15 @@ def Bloco_I_ECD(df, PLANO_CONTAS_REF):
     # Deduplicate I155 records from multiple file transmissions
     REG_I155_ECD = REG_I155_ECD.drop_duplicates(subset=['ano', 'COD_CTA', 'periodo_inicio', 'periodo_final'], keep='last')
 
-    REG_I350_ECD = (df[df['1'] == 'I350'].iloc[:,0:6])
-    REG_I355_ECD = (df[df['1'] == 'I355']
-                    .iloc[:,0:9]
-                    .replace(',', '.', regex=True))
-    REG_I355_ECD[['4']] = REG_I355_ECD[['4']].apply(pd.to_numeric, errors='coerce')
-    REG_I355_ECD.insert(5, 'periodo_final', REG_I355_ECD['id_pai'].map(REG_I350_ECD.set_index('id')['2']))       # incluido periodo_final
-    REG_I355_ECD.insert(7, 'CTA_DESCR', REG_I355_ECD['2'].map(REG_I050_mapping['8']))       # incluido a descrição da conta contabil
-    REG_I355_ECD.insert(8, 'CTA_REF', REG_I355_ECD['2'].map(REG_I050_mapping['CTA_REF']))       # incluido COD_CTA_REF
-    REG_I355_ECD.insert(9, 'CTA_REF_DESCR', REG_I355_ECD['2'].map(REG_I050_mapping['CTA_REF_DESCR']))       # incluido descrição da COD_CTA_REF
+    REG_I350_ECD = _get_register_group(groups, 'I350', columns=6)
+    REG_I355_ECD = _to_numeric(_get_register_group(groups, 'I355', columns=9),
+            ['4'])
+    REG_I355_ECD = _insert_columns(REG_I355_ECD, [
+        (5, 'periodo_final', REG_I355_ECD['id_pai'].map(REG_I350_ECD[['id', '2']].set_index('id')['2'])),       # incluido periodo_final
+        (7, 'CTA_DESCR', REG_I355_ECD['2'].map(REG_I050_mapping['8'])),       # incluido a descrição da conta contabil
+        (8, 'CTA_REF', REG_I355_ECD['2'].map(REG_I050_mapping['CTA_REF'])),       # incluido COD_CTA_REF
+        (9, 'CTA_REF_DESCR', REG_I355_ECD['2'].map(REG_I050_mapping['CTA_REF_DESCR'])),       # incluido descrição da COD_CTA_REF
+    ])
     REG_I355_ECD = REG_I355_ECD.rename(columns={
         '1': 'REG',
         '2': 'COD_CTA',
@@ -553,13 +624,17 @@ def bloco_M_filtering(M105, M110, M210, M400, M510, M610, tab_4_3_7):
     vlr_ajuste_acresc_cofins = df_ajuste_acresc_cofins['3'].sum()
 
     #M105
-    df_cred_por_tipo = M105.groupby(['2', 'NAT_BC_CRED'])['7'].sum().round(2).reset_index().sort_values(by='7', ascending=False)
+    df_cred_por_tipo = M105.groupby(['2', 'NAT_BC_CRED'], sort=False)['7'].sum().round(2).reset_index().sort_values(by='7', ascending=False)
         # adicionando o valor dos Ajustes de Acréscimo (M110/M550) no Dataframe
-    new_row = ['-', 'ajuste de crédito', ((vlr_ajuste_acresc_pis + vlr_ajuste_acresc_cofins)/config.PIS_COFINS_RATE)]
-    df_cred_por_tipo.loc[len(df_cred_por_tipo)] = new_row
+    ajuste_row = pd.DataFrame({
+        '2': ['-'],
+        'NAT_BC_CRED': ['ajuste de crédito'],
+        '7': [(vlr_ajuste_acresc_pis + vlr_ajuste_acresc_cofins)/config.PIS_COFINS_RATE],
+    }, index=[len(df_cred_por_tipo)])
+    df_cred_por_tipo = pd.concat([df_cred_por_tipo, ajuste_row])
     cred_bc_total = df_cred_por_tipo['7'].sum()      # soma das bc de cada tipo de credito
-    df_cred_por_tipo['VLR_CRED_PIS_COFINS'] = (df_cred_por_tipo['7'] * config.PIS_COFINS_RATE).apply(lambda x: round(x,2))
-    df_cred_por_tipo['proporção'] = (df_cred_por_tipo['7'] / cred_bc_total * 100).apply(lambda x: f"{x:.0f}%")
+    df_cred_por_tipo['VLR_CRED_PIS_COFINS'] = (df_cred_por_tipo['7'] * config.PIS_COFINS_RATE).round(2)
+    df_cred_por_tipo['proporção'] = (df_cred_por_tipo['7'] / cred_bc_total * 100).map('{:.0f}%'.format)
     df_cred_por_tipo = df_cred_por_tipo.rename(columns={
         '2': 'CST_PIS_COFINS',
         '7': 'BC_CRED_PIS_COFINS'
@@ -597,34 +672,34 @@ def bloco_M_filtering(M105, M110, M210, M400, M510, M610, tab_4_3_7):
 
 
     #M210
-    df_receitas_com_debito = M210[['2', 'cod_contribuicao', '3', '4', '8', '11']]
-    df_receitas_com_debito = df_receitas_com_debito.copy()
-
-        # Create a composite key for mapping in df_receitas_com_debito
-    df_receitas_com_debito.loc[:, 'key'] = list(zip(df_receitas_com_debito['2'], df_receitas_com_debito['3']))
-
-        # Create a mapping Series from M610 using the composite key
-    mapping_series_aliq = M610.set_index(['2', '3'])['8']
-    mapping_series_valor = M610.set_index(['2', '3'])['11']
+    df_receitas_com_debito = M210[['2', 'cod_contribuicao', '3', '4', '8', '11']].copy()
 
-        # Map the composite key to get 'valor_cofins'
-    df_receitas_com_debito.loc[:, 'aliq_cofins'] = df_receitas_com_debito['key'].map(mapping_series_aliq)
-    df_receitas_com_debito.loc[:, 'valor_cofins'] = df_receitas_com_debito['key'].map(mapping_series_valor)
-    df_receitas_com_debito = df_receitas_com_debito.drop(columns=['key'])
-    df_receitas_com_debito[['aliq_cofins', 'valor_cofins']] = df_receitas_com_debito[['aliq_cofins', 'valor_cofins']].apply(pd.to_numeric, errors='coerce')
+        # Look up aliq/valor COFINS from M610 by the composite key (cod_contribuicao, aliq_pis)
+        # ('8' e '11' do M610 ja sao numericos)
+    key = pd.MultiIndex.from_arrays([df_receitas_com_debito['2'].to_numpy(), df_receitas_com_debito['3'].to_numpy()])
+    cofins = M610[['2', '3', '8', '11']].set_index(['2', '3']).reindex(key)
+    df_receitas_com_debito['aliq_cofins'] = cofins['8'].to_numpy()
+    df_receitas_com_debito['valor_cofins'] = cofins['11'].to_numpy()
 
 
     #M400
     df_receitas_sem_debito = M400[['2', 'cst_descr', '3']].sort_values(by='3', ascending=False)
 
+    vlr_receita_tributada = df_receitas_com_debito['3'].sum()
+    vlr_receita_nao_tributada = df_receitas_sem_debito['3'].sum()
+    # PIS e COFINS numa unica reducao; nansum porque o COFINS sem M610 correspondente fica NaN
+    vlr_debito_pis_cofins = float(np.nansum(df_receitas_com_debito[['11', 'valor_cofins']].to_numpy(dtype=float)))
 
-    return df_cred_por_tipo_all, df_cred_por_tipo, cred_bc_total, cred_total, df_receitas_com_debito, df_receitas_sem_debito, df_ajuste_acresc_pis, vlr_ajuste_acresc_pis, df_ajuste_acresc_cofins, vlr_ajuste_acresc_cofins
+
+    return df_cred_por_tipo_all, df_cred_por_tipo, cred_bc_total, cred_total, df_receitas_com_debito, df_receitas_sem_debito, df_ajuste_acresc_pis, vlr_ajuste_acresc_pis, df_ajuste_acresc_cofins, vlr_ajuste_acresc_cofins, vlr_receita_tributada, vlr_receita_nao_tributada, vlr_debito_pis_cofins
 
 
 def bloco_A_filtering(A100, A170):
     """Filter and analyze A-block data for services."""
+    serv_keys = ['ind_oper', '3', 'descr_serv_0200', '9', '11', '15']
+    serv_vals = ['5', '10', '12', '16', 'iss']
     if not A170.empty and 'ind_oper' in A170.columns and 'descr_serv_0200' in A170.columns:
-        df_serv_tomados = A170[A170['ind_oper'] == '0'].groupby(['ind_oper','3', 'descr_serv_0200', '9', '11', '15'], dropna=False)[['5', '10', '12', '16', 'iss']].sum().round(2).sort_values(by='5', ascending=False).reset_index()
+        df_serv_tomados = A170.loc[A170['ind_oper'] == '0', serv_keys + serv_vals].groupby(serv_keys, dropna=False, sort=False)[serv_vals].sum().round(2).sort_values(by='5', ascending=False).reset_index()
         df_serv_tomados['IBS'] = 0
         df_serv_tomados['CBS'] = 0
         df_serv_tomados = df_serv_tomados.rename(columns={
@@ -642,7 +717,7 @@ def bloco_A_filtering(A100, A170):
         df_serv_tomados = pd.DataFrame(columns=['ind_oper', 'cod_serv', 'descricao_servico', 'cst_pis_cofins', 'pis_aliq', 'cofins_aliq', 'vlr_servico', 'pis_cofins_bc', 'pis_vlr', 'cofins_vlr', 'iss', 'IBS', 'CBS'])
 
     if not A170.empty and 'ind_oper' in A170.columns and 'descr_serv_0200' in A170.columns:
-        df_serv_prestados = A170[A170['ind_oper'] == '1'].groupby(['ind_oper','3', 'descr_serv_0200', '9', '11', '15'], dropna=False)[['5', '10', '12', '16', 'iss']].sum().round(2).sort_values(by='5', ascending=False).reset_index()
+        df_serv_prestados = A170.loc[A170['ind_oper'] == '1', serv_keys + serv_vals].groupby(serv_keys, dropna=False, sort=False)[serv_vals].sum().round(2).sort_values(by='5', ascending=False).reset_index()
         df_serv_prestados['IBS'] = 0
         df_serv_prestados['CBS'] = 0
         df_serv_prestados = df_serv_prestados.rename(columns={
@@ -665,8 +740,13 @@ def bloco_A_filtering(A100, A170):
 
 def bloco_C_filtering(C100, C170, C175, C181, C185):
     """Filter and analyze C-block data for sales."""
+    if not C170.empty and 'cfop_descr' in C170.columns:
+        is_venda, is_compra = descr_startswith(C170['cfop_descr'], 'venda', 'compra')
+        venda_cols = [c for c in ('ncm', 'uf_empresa', 'cnpj', '11', 'cfop_descr', '7', '26', '30', '36') if c in C170.columns]
+        C170_venda = C170.loc[is_venda, venda_cols]
+
     if not C170.empty and 'ind_oper' in C170.columns and 'cfop_descr' in C170.columns:
-        df_C170_saidas = C170[(C170['ind_oper'] == '1') & (C170['cfop_descr'].str.lower().fillna('').str.startswith("venda"))]
+        df_C170_saidas = C170[(C170['ind_oper'] == '1') & is_venda]
     else:
         df_C170_saidas = pd.DataFrame()
 
@@ -674,14 +754,15 @@ def bloco_C_filtering(C100, C170, C175, C181, C185):
 
     # NF-e MOD 55
     if not C170.empty and 'ind_oper' in C170.columns:
-        df_C170_por_mod55_aliq = C170.groupby(['ind_oper', 'mod_nf', '27', '33'], dropna=False)[['7', '26', '30', '36']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
+        df_C170_por_mod55_aliq = C170.groupby(['ind_oper', 'mod_nf', '27', '33'], dropna=False, sort=False)[['7', '26', '30', '36']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
     else:
         df_C170_por_mod55_aliq = pd.DataFrame(columns=['ind_oper', 'mod_nf', '27', '33', '7', '26', '30', '36'])
 
     # C170
     if not C170.empty and 'cfop_descr' in C170.columns:
-        df_C170_COMPRA_por_item_cfop_cst_aliq_ncm = C170[C170['cfop_descr'].str.lower().fillna('').str.startswith("compra")].groupby(['3', 'item_descr', '11', 'cfop_descr', 'uf_empresa', 'part_uf', '25', '27', 'ncm'], dropna=False)[['7', '26', '30']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
-        df_C170_venda_por_ncm = C170[C170['cfop_descr'].str.lower().fillna('').str.startswith("venda")].groupby('ncm', dropna=False)[['7', '26', '30', '36']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
+        compra_keys = ['3', 'item_descr', '11', 'cfop_descr', 'uf_empresa', 'part_uf', '25', '27', 'ncm']
+        df_C170_COMPRA_por_item_cfop_cst_aliq_ncm = C170.loc[is_compra, compra_keys + ['7', '26', '30']].groupby(compra_keys, dropna=False, sort=False)[['7', '26', '30']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
+        df_C170_venda_por_ncm = C170_venda[['ncm', '7', '26', '30', '36']].groupby('ncm', dropna=False, sort=False)[['7', '26', '30', '36']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
     else:
         df_C170_COMPRA_por_item_cfop_cst_aliq_ncm = pd.DataFrame(columns=['3', 'item_descr', '11', 'cfop_descr', 'uf_empresa', 'part_uf', '25', '27', 'ncm', '7', '26', '30'])
         df_C170_venda_por_ncm = pd.DataFrame(columns=['ncm', '7', '26', '30', '36'])
@@ -689,84 +770,45 @@ def bloco_C_filtering(C100, C170, C175, C181, C185):
     # NFC-e MOD 65
     # Check if C175 is empty or missing required columns (some SPED files don't have C175)
     if not C175.empty and 'ind_oper' in C175.columns:
-        df_C175_por_mod65_aliq = C175.groupby(['ind_oper', 'mod_nf', '7', '13'], dropna=False)[['3', '6', '10', '16']].sum().round(2).sort_values(by='3', ascending=False).reset_index()
+        df_C175_por_mod65_aliq = C175.groupby(['ind_oper', 'mod_nf', '7', '13'], dropna=False, sort=False)[['3', '6', '10', '16']].sum().round(2).sort_values(by='3', ascending=False).reset_index()
     else:
         # Create empty DataFrame with expected structure
         df_C175_por_mod65_aliq = pd.DataFrame(columns=['ind_oper', 'mod_nf', '7', '13', '3', '6', '10', '16'])
 
     # tabela_venda_por_estab
+    # linhas de venda do C170 e do C175 com os mesmos nomes de coluna, agregadas num unico groupby
+    valor_cols = ['valor_opr', 'bc', 'vlr_pis', 'vlr_cofins']
+    venda_por_estab_parts = []
     if not C170.empty and 'cfop_descr' in C170.columns and 'uf_empresa' in C170.columns:
-        df_C170_venda_por_estab = C170[C170['cfop_descr'].str.lower().fillna('').str.startswith("venda")].groupby(['uf_empresa', 'cnpj'], dropna=False)[['7', '26', '30', '36']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
-        df_C170_venda_por_estab = df_C170_venda_por_estab.rename(columns={
-            'uf_empresa': 'uf_empresa',
-            'cnpj': 'cnpj',
-            '7': 'valor_opr',
-            '26': 'bc',
-            '30': 'vlr_pis',
-            '36': 'vlr_cofins'
-        })
-    else:
-        df_C170_venda_por_estab = pd.DataFrame(columns=['uf_empresa', 'cnpj', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
-
+        venda_por_estab_parts.append(
+            C170_venda[['uf_empresa', 'cnpj', '7', '26', '30', '36']].set_axis(['uf_empresa', 'cnpj'] + valor_cols, axis=1))
     if not C175.empty and 'uf_empresa' in C175.columns and 'cnpj' in C175.columns:
-        df_C175_venda_por_estab = C175.groupby(['uf_empresa', 'cnpj'], dropna=False)[['3', '6', '10', '16']].sum().round(2).sort_values(by='3', ascending=False).reset_index()
-        df_C175_venda_por_estab = df_C175_venda_por_estab.rename(columns={
-            'uf_empresa': 'uf_empresa',
-            'cnpj': 'cnpj',
-            '3': 'valor_opr',
-            '6': 'bc',
-            '10': 'vlr_pis',
-            '16': 'vlr_cofins'
-        })
-    else:
-        df_C175_venda_por_estab = pd.DataFrame(columns=['uf_empresa', 'cnpj', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
+        venda_por_estab_parts.append(
+            C175[['uf_empresa', 'cnpj', '3', '6', '10', '16']].set_axis(['uf_empresa', 'cnpj'] + valor_cols, axis=1))
 
-    df_final_venda_por_estab = pd.concat([df_C170_venda_por_estab, df_C175_venda_por_estab], ignore_index=True)
-    if not df_final_venda_por_estab.empty and 'uf_empresa' in df_final_venda_por_estab.columns:
-        df_final_venda_por_estab = df_final_venda_por_estab.groupby(['uf_empresa', 'cnpj'], dropna=False)[['valor_opr', 'bc', 'vlr_pis', 'vlr_cofins']].sum().round(2).sort_values(by='valor_opr', ascending=False).reset_index()
+    if venda_por_estab_parts:
+        df_final_venda_por_estab = pd.concat(venda_por_estab_parts, ignore_index=True).groupby(['uf_empresa', 'cnpj'], dropna=False, sort=False)[valor_cols].sum().round(2).sort_values(by='valor_opr', ascending=False).reset_index()
     else:
         df_final_venda_por_estab = pd.DataFrame(columns=['uf_empresa', 'cnpj', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
 
     # tabela_venda_por_uf_do_estab
     if not df_final_venda_por_estab.empty and 'uf_empresa' in df_final_venda_por_estab.columns:
-        df_final_venda_por_uf_estab = df_final_venda_por_estab.groupby('uf_empresa', dropna=False)[['valor_opr', 'bc', 'vlr_pis', 'vlr_cofins']].sum().round(2).sort_values(by='valor_opr', ascending=False).reset_index()
+        # agregado a partir da tabela por estabelecimento (ja somada); a ordem vem do sort_values
+        df_final_venda_por_uf_estab = df_final_venda_por_estab.groupby('uf_empresa', dropna=False, sort=False)[valor_cols].sum().round(2).sort_values(by='valor_opr', ascending=False).reset_index()
     else:
         df_final_venda_por_uf_estab = pd.DataFrame(columns=['uf_empresa', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
 
     # tabela_venda_por_cfop
+    venda_por_cfop_parts = []
     if not C170.empty and 'cfop_descr' in C170.columns and '11' in C170.columns:
-        df_C170_venda_por_cfop = C170[C170['cfop_descr'].str.lower().fillna('').str.startswith("venda")].groupby(['11','cfop_descr'], dropna=False)[['7', '26', '30', '36']].sum().round(2).sort_values(by='7', ascending=False).reset_index()
-        df_C170_venda_por_cfop = df_C170_venda_por_cfop.rename(columns={
-            '11': 'CFOP',
-            'cfop_descr': 'cfop_descr',
-            '7': 'valor_opr',
-            '26': 'bc',
-            '30': 'vlr_pis',
-            '36': 'vlr_cofins'
-        })
-    else:
-        df_C170_venda_por_cfop = pd.DataFrame(columns=['CFOP', 'cfop_descr', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
+        venda_por_cfop_parts.append(
+            C170_venda[['11', 'cfop_descr', '7', '26', '30', '36']].set_axis(['CFOP', 'cfop_descr'] + valor_cols, axis=1))
     if not C175.empty and 'cfop_descr' in C175.columns and '2' in C175.columns:
-        df_C175_venda_por_cfop = C175.groupby(['2', 'cfop_descr'], dropna=False)[['3', '6', '10', '16']].sum().round(2).sort_values(by='3', ascending=False).reset_index()
-        df_C175_venda_por_cfop = df_C175_venda_por_cfop.rename(columns={
-            '2': 'CFOP',
-            'cfop_descr': 'cfop_descr',
-            '3': 'valor_opr',
-            '6': 'bc',
-            '10': 'vlr_pis',
-            '16': 'vlr_cofins'
-        })
-    else:
-        df_C175_venda_por_cfop = pd.DataFrame(columns=['CFOP', 'cfop_descr', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
-    if not C181.empty and 'cfop_descr' in C181.columns and '3' in C181.columns:
-        df_C181_venda_por_cfop = C181.groupby(['3', 'cfop_descr'], dropna=False)[['4']].sum().round(2).sort_values(by='4', ascending=False).reset_index()
-    else:
-        df_C181_venda_por_cfop = pd.DataFrame(columns=['3', 'cfop_descr', '4'])
-
+        venda_por_cfop_parts.append(
+            C175[['2', 'cfop_descr', '3', '6', '10', '16']].set_axis(['CFOP', 'cfop_descr'] + valor_cols, axis=1))
 
-    df_final_venda_por_cfop = pd.concat([df_C170_venda_por_cfop, df_C175_venda_por_cfop], ignore_index=True)
-    if not df_final_venda_por_cfop.empty and 'CFOP' in df_final_venda_por_cfop.columns:
-        df_final_venda_por_cfop = df_final_venda_por_cfop.groupby(['CFOP', 'cfop_descr'], dropna=False)[['valor_opr', 'bc', 'vlr_pis', 'vlr_cofins']].sum().round(2).sort_values(by='valor_opr', ascending=False).reset_index()
+    if venda_por_cfop_parts:
+        df_final_venda_por_cfop = pd.concat(venda_por_cfop_parts, ignore_index=True).groupby(['CFOP', 'cfop_descr'], dropna=False, sort=False)[valor_cols].sum().round(2).sort_values(by='valor_opr', ascending=False).reset_index()
     else:
         df_final_venda_por_cfop = pd.DataFrame(columns=['CFOP', 'cfop_descr', 'valor_opr', 'bc', 'vlr_pis', 'vlr_cofins'])
 
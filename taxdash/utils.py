@@ -5,7 +5,13 @@ This module provides helper functions to reduce code duplication throughout
 the application, particularly for common DataFrame transformations.
 """
 
+import io
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 
 
 def convert_numeric_columns(df, columns, inplace=True):
@@ -26,7 +32,9 @@ def convert_numeric_columns(df, columns, inplace=True):
     if not inplace:
         df = df.copy()
 
-    df[columns] = df[columns].apply(pd.to_numeric, errors='coerce')
+    # one pd.to_numeric per column, without going through DataFrame.apply
+    for col in columns:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
 
     if not inplace:
         return df
@@ -75,10 +83,83 @@ def clean_and_convert_numeric(df, columns, inplace=True):
     if not inplace:
         df = df.copy()
 
-    # First clean decimal separators
-    df[columns] = df[columns].replace(',', '.', regex=True)
-    # Then convert to numeric
-    df[columns] = df[columns].apply(pd.to_numeric, errors='coerce')
+    for col in columns:
+        values = df[col]
+        if values.dtype == object:
+            # First clean decimal separators (plain substring replace, no regex)
+            values = values.astype(str).str.replace(',', '.', regex=False)
+        # Then convert to numeric
+        df[col] = pd.to_numeric(values, errors='coerce')
 
     if not inplace:
         return df
+
+
+def csv_via_arrow(df):
+    """
+    Write ``df`` like ``df.to_csv(index=False, sep=';', decimal=',')`` with a UTF-8 BOM,
+    using pyarrow's CSV writer.
+
+    The column handling is decided from ``df.dtypes``, not from the type Arrow
+    infers: float64 columns get the decimal comma, integer (also nullable) and
+    string columns are written as they are, and categoricals only when their
+    categories are strings (or there are none). Object columns are accepted
+    only when Arrow reads them as strings, since pandas prints mixed numbers
+    (``[1, 2.5]``) as ``1`` / ``2.5``, without the decimal comma.
+
+    Returns:
+        The CSV bytes, or None when the output could differ from pandas'
+        (other column types, floats pandas would print in another notation,
+        values or names that need quoting, single-column frames).
+    """
+    # pandas quotes an empty field when it is the whole line
+    if df.shape[1] < 2:
+        return None
+    # pandas writes one header line per column level
+    if df.columns.nlevels > 1:
+        return None
+    # the header is written by hand, without quoting
+    if any(c in str(name) for name in df.columns for c in ';"\r\n'):
+        return None
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+
+    columns = []
+    for dtype, column in zip(df.dtypes, table.columns):
+        if isinstance(dtype, pd.CategoricalDtype):
+            # pandas writes numeric categories without the decimal comma
+            if not pa.types.is_dictionary(column.type) or not (
+                    pa.types.is_string(column.type.value_type) or pa.types.is_null(column.type.value_type)):
+                return None
+            column = column.cast(pa.string())
+        elif dtype == np.float64:
+            # Arrow's text only matches pandas' repr for 1e-4 <= |x| < 1e10 (it switches
+            # notation outside that range); whole numbers get the '.0', then the decimal comma
+            values = np.abs(column.to_numpy())
+            values = values[np.isfinite(values)]
+            if ((values != 0) & ((values < 1e-4) | (values >= 1e10))).any():
+                return None
+            column = pc.replace_substring_regex(column.cast(pa.string()), r'^(-?[0-9]+)$', r'\1.0')
+            column = pc.replace_substring(column, '.', ',')
+        elif dtype == object or pd.api.types.is_string_dtype(dtype):
+            if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+                    or pa.types.is_null(column.type)):
+                return None
+        elif not (pd.api.types.is_integer_dtype(dtype) and pa.types.is_integer(column.type)):
+            return None
+        columns.append(column)
+
+    buf = io.BytesIO()
+    buf.write(('\ufeff' + ';'.join(map(str, df.columns)) + '\n').encode('utf-8'))
+    try:
+        # quoting 'none' raises if a value needs quotes; pandas writes those frames
+        pa_csv.write_csv(
+            pa.table(columns, names=[str(c) for c in df.columns]),
+            buf,
+            pa_csv.WriteOptions(include_header=False, delimiter=';', quoting_style='none'),
+        )
+    except pa.ArrowInvalid:
+        return None
+    return buf.getvalue()
@@ -1,13 +1,27 @@
+import csv
+import io
 from pathlib import Path
 import sys
 
+import numpy as np
+import pandas as pd
+import pytest
+
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from taxdash import (  # noqa: E402
+    config,
     load_and_process_data,
     load_and_process_sped_fiscal,
     load_and_process_ecd,
 )
+from taxdash import loaders  # noqa: E402
+from taxdash.loaders import (  # noqa: E402
+    _disk_cache_dir,
+    _split_sped_lines,
+    read_bundle_cache,
+    write_bundle_cache,
+)
 
 
 FIXTURE_DIR = Path(__file__).resolve().parents[1] / "arquivos_teste"
@@ -41,3 +55,126 @@ def test_ecd_loader_accepts_multiple_files():
 
     assert not df.empty
     assert df["id"].is_unique
+
+
+def test_ecd_loader_drops_journal_window_and_trailer():
+    raw = (
+        b"|0000|LECD|01012023|31122023|EMPRESA|84501873000178|\r\n"
+        b"|I050|01012023|04|A|5|1.01||CAIXA|\r\n"
+        b"|I200|1|31122023|100,00|N|\r\n"
+        b"|I250|1.01||100,00|D|\r\n"
+        b"|I350|31122023|\r\n"
+        b"|I355|1.01||100,00|D|\r\n"
+        b"|I990|6|\r\n"
+        b"|J001|0|\r\n"
+    )
+    df = load_and_process_ecd([io.BytesIO(raw)])
+
+    assert list(df["1"]) == ["0000", "I050", "I350", "I355", "I990"]
+
+
+def test_ecd_loader_keeps_lines_with_leading_quote():
+    raw = (
+        b"|0000|LECD|01012023|31122023|EMPRESA|84501873000178|\r\n"
+        b"|I050|01012023|04|A|5|1.01||\"CAIXA GERAL|\r\n"
+        b"|I050|01012023|04|A|5|1.02||BANCOS|\r\n"
+        b"|I990|4|\r\n"
+    )
+    df = load_and_process_ecd([io.BytesIO(raw)])
+
+    assert list(df["1"]) == ["0000", "I050", "I050", "I990"]
+
+
+def _read_with_pandas(raw, column_names):
+    # Same call as the C-engine fallback in _read_sped_frame
+    return pd.read_csv(
+        io.BytesIO(raw),
+        header=None,
+        delimiter=config.DELIMITER,
+        names=column_names,
+        low_memory=False,
+        encoding=config.ENCODING,
+        dtype=str,
+        engine="c",
+        on_bad_lines="skip",
+        quoting=csv.QUOTE_NONE,
+    )
+
+
+@pytest.mark.parametrize("raw", [
+    # rows wider than the trimmed width are skipped
+    b"|0000|A|B|\r\n|C100|1|2|3|4|5|6|7|\r\n|C170|X|\r\n",
+    # quotes are literal characters, embedded or leading
+    b"|0200|\"ABC|DE\"F|\r\n|0200|\"X\"|\"\"|\r\n",
+    # NA-like strings become NaN, everything else stays text
+    b"|0150|NA|null|N/A|\r\n|NaN|nan|None|#N/A|\r\n|0150||-|n.a.|NAO|\r\n",
+    # no trailing newline and Latin-1 text
+    b"|0000|A\xc7\xc3O|\r\n|9999|2|",
+])
+@pytest.mark.parametrize("used_count", [6, 3])
+def test_split_sped_lines_matches_pandas_read(raw, used_count):
+    column_names = [str(i) for i in range(6)]
+    expected = _read_with_pandas(raw, column_names).iloc[:, :used_count]
+
+    result = _split_sped_lines(io.BytesIO(raw), column_names, used_count)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_disk_cache_hit_matches_cold_load(tmp_path, monkeypatch):
+    raw = (
+        b"|0000|006|0|||01012025|31012025|EMPRESA|84501873000178|SP|\r\n"
+        b"|0140||EMPRESA|84501873000178|SP|\r\n"
+        b"|A100|0|0|||\r\n"
+        b"|9999|4|\r\n"
+    )
+    monkeypatch.setattr(config, "DISK_CACHE_DIR", str(tmp_path / "cache"))
+    _disk_cache_dir.clear()
+    load_and_process_data.clear()
+    try:
+        cold = load_and_process_data(io.BytesIO(raw))
+        load_and_process_data.clear()
+        # a second parse would mean the cache missed
+        monkeypatch.setattr(loaders, "_parse_files", None)
+        warm = load_and_process_data(io.BytesIO(raw))
+    finally:
+        _disk_cache_dir.clear()
+        load_and_process_data.clear()
+
+    assert [p.suffix for p in (tmp_path / "cache").iterdir()] == [".feather"]
+    pd.testing.assert_frame_equal(warm, cold)
+    # missing fields come back as NaN, not None
+    assert warm["5"].isna().any()
+    assert all(v is np.nan for v in warm["5"] if not isinstance(v, str))
+
+
+def test_bundle_cache_round_trip(tmp_path):
+    bundle = {
+        "frame": pd.DataFrame({"a": ["x", np.nan], "b": [1.5, np.nan]}),
+        "total": 3.25,
+        "count": np.int64(2),
+        "flag": True,
+        "label": "texto",
+        "missing": None,
+    }
+    path = str(tmp_path / "b.bundle")
+
+    write_bundle_cache(path, bundle)
+    loaded = read_bundle_cache(path)
+
+    assert list(loaded) == list(bundle)
+    pd.testing.assert_frame_equal(loaded["frame"], bundle["frame"])
+    assert loaded["frame"].loc[1, "a"] is np.nan
+    assert {k: loaded[k] for k in ("total", "count", "flag", "label", "missing")} == {
+        "total": 3.25, "count": 2, "flag": True, "label": "texto", "missing": None,
+    }
+
+
+def test_bundle_cache_skips_unsupported_scalar(tmp_path, caplog):
+    path = str(tmp_path / "b.bundle")
+
+    write_bundle_cache(path, {"frame": pd.DataFrame({"a": [1]}), "bad": pd.NA})
+
+    assert read_bundle_cache(path) is None
+    assert "bundle cache not written" in caplog.text
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,40 @@
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from taxdash import csv_via_arrow  # noqa: E402
+
+
+# (frame, whether the Arrow writer should take it instead of falling back)
+CSV_CASES = {
+    "float": (pd.DataFrame({"a": [1.5, np.nan, -2.0, 0.0], "b": [1234567.25, 0.0001, 3.0, -0.5]}), True),
+    "float_notation": (pd.DataFrame({"a": [1e-5, 1.0], "b": [1e12, 2.0]}), False),
+    "int": (pd.DataFrame({"a": [1, -2, 3], "b": [10, 20, 30]}), True),
+    "Int64": (pd.DataFrame({"a": pd.array([1, None, 3], dtype="Int64"), "b": ["x", "y", "z"]}), True),
+    "category": (pd.DataFrame({"a": pd.Categorical(["C100", "C170", None, "C100"]), "b": [1, 2, 3, 4]}), True),
+    "category_empty": (pd.DataFrame({"a": pd.Categorical([None, None], categories=pd.Index([], dtype=object)), "b": [1, 2]}), True),
+    "category_float": (pd.DataFrame({"a": pd.Categorical([1.5, 2.0]), "b": [1, 2]}), False),
+    "object_float": (pd.DataFrame({"a": pd.Series([1, 2.5], dtype=object), "b": ["x", "y"]}), False),
+    "object_text": (pd.DataFrame({"a": ["x", None, np.nan], "b": ["1,5", "", "z"]}), True),
+    "empty": (pd.DataFrame({"a": pd.Series([], dtype=float), "b": pd.Series([], dtype=object)}), True),
+    "semicolon": (pd.DataFrame({"a": ["x;y", "z"], "b": [1, 2]}), False),
+    "quote": (pd.DataFrame({"a": ['diz "oi"', "z"], "b": [1, 2]}), False),
+}
+
+
+@pytest.mark.parametrize("name", list(CSV_CASES))
+def test_csv_via_arrow_matches_pandas(name):
+    df, uses_arrow = CSV_CASES[name]
+    expected = df.to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig")
+
+    result = csv_via_arrow(df)
+
+    if uses_arrow:
+        assert result == expected
+    else:
+        assert result is None